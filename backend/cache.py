@@ -0,0 +1,311 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from dotenv import load_dotenv
+
+from compression import compress
+from http_cache import etag_for_bytes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+class CachedBody:
+    """A serialized response body stored by the plan cache.
+
+    Compressed variants are made on first request for each coding and kept
+    with the body, so every later response for this version is served
+    without compressing again.
+    """
+    __slots__ = ("body", "etag", "last_modified", "version", "generation", "created_at",
+                 "encoded", "on_resize")
+
+    def __init__(self, body: bytes, last_modified: Optional[datetime] = None, version: int = 0):
+        self.body = body
+        self.etag = etag_for_bytes(body)
+        self.last_modified = last_modified
+        self.version = version
+        self.generation = 0
+        self.created_at = time.monotonic()
+        self.encoded: Dict[str, bytes] = {}
+        # Set while a cache holds the entry, so variants count toward its size
+        self.on_resize: Optional[Callable[[int], None]] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(variant) for variant in self.encoded.values())
+
+    def variant(self, encoding: str) -> bytes:
+        """The body in a content coding, compressed once and then reused"""
+        variant = self.encoded.get(encoding)
+        if variant is None:
+            variant = self.encoded[encoding] = compress(self.body, encoding, precompress=True)
+            if self.on_resize is not None:
+                self.on_resize(len(variant))
+        return variant
+
+
+class PlanCache:
+    """Versioned in-memory LRU cache of serialized business plan responses.
+
+    Every write to the plan bumps ``generation`` and drops all entries. A load
+    that started before an invalidation is never stored, so a slow reader cannot
+    put stale bytes back into the cache. The optional TTL bounds staleness when
+    another worker process writes the plan.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: int = 256,
+                 on_resize: Optional[Callable[[int], None]] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes = 0
+        # Told the change in stored bytes, so an owning PlanCaches can keep a total
+        self.on_resize = on_resize
+        # Least recently used first
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    def _resize(self, delta: int):
+        self.bytes += delta
+        if self.on_resize is not None and delta:
+            self.on_resize(delta)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        entry.on_resize = None
+        self._resize(-entry.size)
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        """Return a fresh entry for key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.monotonic() - entry.created_at > self.ttl:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedBody, generation: int) -> CachedBody:
+        """Store entry for key unless the cache was invalidated since generation"""
+        entry.generation = generation
+        if generation == self.generation:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            entry.on_resize = self._resize
+            self._resize(entry.size)
+            if len(self._entries) > self.max_entries:
+                # Evict the least recently used entry, so one-off fields= or
+                # section keys cannot push out the hot full plan
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    async def get_or_load(
+        self, key: str, loader: Callable[[], Awaitable[Optional[CachedBody]]]
+    ) -> Optional[CachedBody]:
+        """Return the cached entry for key, running loader once on a miss.
+
+        Concurrent misses for the same key share a single loader call.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self.generation
+        try:
+            entry = await loader()
+            if entry is not None:
+                self.put(key, entry, generation)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._loading[key]
+
+    def invalidate(self):
+        """Drop every entry after a write to the plan"""
+        self.generation += 1
+        self.invalidations += 1
+        for entry in self._entries.values():
+            entry.on_resize = None
+        self._entries.clear()
+        self._resize(-self.bytes)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "generation": self.generation,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "ttl": self.ttl,
+        }
+
+
+class PlanCaches:
+    """One PlanCache per plan, evicting the least recently used plans.
+
+    Both the number of cached plans and the bytes they hold together are
+    bounded, so thousands of mostly idle plans cost nothing once they age
+    out while the hot ones stay cached. An evicted plan simply reloads.
+    """
+
+    def __init__(self, max_plans: int = 256, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, max_entries_per_plan: int = 32):
+        self.max_plans = max_plans
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries_per_plan = max_entries_per_plan
+        self.bytes = 0
+        self.evictions = 0
+        self._caches: "OrderedDict[str, PlanCache]" = OrderedDict()
+
+    def for_plan(self, plan_id: str) -> PlanCache:
+        """The cache for plan_id, marking the plan as recently used"""
+        cache = self._caches.get(plan_id)
+        if cache is None:
+            cache = PlanCache(ttl=self.ttl, max_entries=self.max_entries_per_plan, on_resize=self._resized)
+            self._caches[plan_id] = cache
+            self._evict()
+        else:
+            self._caches.move_to_end(plan_id)
+        return cache
+
+    def invalidate(self, plan_id: str):
+        """Drop the cached responses of one plan after a write to it"""
+        cache = self._caches.get(plan_id)
+        if cache is not None:
+            cache.invalidate()
+
+    def _resized(self, delta: int):
+        self.bytes += delta
+        if delta > 0:
+            self._evict()
+
+    def _evict(self):
+        # The most recently used plan is kept even when it alone is over budget
+        while len(self._caches) > 1 and (len(self._caches) > self.max_plans or self.bytes > self.max_bytes):
+            _, cache = self._caches.popitem(last=False)
+            cache.on_resize = None
+            self.bytes -= cache.bytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        caches = list(self._caches.values())
+        hits = sum(cache.hits for cache in caches)
+        misses = sum(cache.misses for cache in caches)
+        return {
+            "plans": len(caches),
+            "max_plans": self.max_plans,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "entries": sum(len(cache._entries) for cache in caches),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": self.evictions,
+            "ttl": self.ttl,
+        }
+
+
+class LRUCache:
+    """Bounded least-recently-used mapping with an optional per-entry TTL"""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._entries.get(key, self._MISSING)
+        if item is self._MISSING or (self.ttl and time.monotonic() - item[1] > self.ttl):
+            if item is not self._MISSING:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "ttl": self.ttl,
+        }
+
+
+# Per-plan response caches. PLAN_CACHE_TTL is in seconds, 0 disables expiry;
+# idle plans are evicted once either bound is reached
+plan_caches = PlanCaches(
+    max_plans=int(os.environ.get("PLAN_CACHE_MAX_PLANS", "256")),
+    max_bytes=int(os.environ.get("PLAN_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.environ.get("PLAN_CACHE_TTL", "0")) or None,
+    max_entries_per_plan=int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", "32")),
+)
+
+# Image metadata is immutable per id, so the TTL only bounds how long another
+# worker's delete can go unnoticed here
+image_metadata_cache = LRUCache(
+    maxsize=int(os.environ.get("IMAGE_METADATA_CACHE_SIZE", "4096")),
+    ttl=float(os.environ.get("IMAGE_METADATA_CACHE_TTL", "60")) or None,
+)
+
+# Sensitivity grids by (plan id, plan version, grid spec); old versions simply age out
+sensitivity_cache = LRUCache(maxsize=int(os.environ.get("SENSITIVITY_CACHE_SIZE", "32")))
+
+# Response bodies of past plan versions by (plan id, version); they never change
+plan_version_cache = LRUCache(maxsize=int(os.environ.get("PLAN_VERSION_CACHE_SIZE", "64")))
@@ -0,0 +1,272 @@
+import gzip
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it br is never offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; without it zstd is never offered
+    zstandard = None
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Bodies smaller than this gain less on the wire than compressing them costs
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", "6"))
+# Cached bodies are compressed once per version, so they can afford more effort
+PRECOMPRESS_GZIP_LEVEL = int(os.environ.get("PRECOMPRESS_GZIP_LEVEL", "9"))
+PRECOMPRESS_BROTLI_QUALITY = int(os.environ.get("PRECOMPRESS_BROTLI_QUALITY", "9"))
+PRECOMPRESS_ZSTD_LEVEL = int(os.environ.get("PRECOMPRESS_ZSTD_LEVEL", "12"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+class _GzipStream:
+    """Incremental gzip encoder for bodies sent in several chunks"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _available() -> Dict[str, int]:
+    """Supported codings and their preference when the client weighs them equally"""
+    encodings = {"gzip": 1}
+    if brotli is not None:
+        encodings["br"] = 3
+    if zstandard is not None:
+        encodings["zstd"] = 2
+    return encodings
+
+
+ENCODINGS = _available()
+
+
+def compress(body: bytes, encoding: str, precompress: bool = False) -> bytes:
+    """Encode a whole body; precompress spends more CPU for a smaller result"""
+    if encoding == "gzip":
+        # mtime=0 keeps the output, and so its ETag, stable across workers
+        return gzip.compress(body, PRECOMPRESS_GZIP_LEVEL if precompress else GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=PRECOMPRESS_BROTLI_QUALITY if precompress else BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=PRECOMPRESS_ZSTD_LEVEL if precompress else ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def stream_encoder(encoding: str):
+    """An object with compress(chunk) and finish() for a streamed body"""
+    if encoding == "gzip":
+        return _GzipStream(GZIP_LEVEL)
+    if encoding == "br":
+        return _BrotliStream(BROTLI_QUALITY)
+    if encoding == "zstd":
+        return _ZstdStream(ZSTD_LEVEL)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def negotiate(accept_encoding: Optional[str], encodings: Iterable[str] = None) -> Optional[str]:
+    """Pick a content coding from an Accept-Encoding header, or None for identity.
+
+    Codings with the highest q-value win; ties go to the better compressor.
+    "*" stands for every coding the header does not name explicitly.
+    """
+    if not accept_encoding:
+        return None
+    offered = {name: ENCODINGS[name] for name in (encodings or ENCODINGS) if name in ENCODINGS}
+    weights: Dict[str, float] = {}
+    wildcard = None
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name == "*":
+            wildcard = q
+        elif name == "x-gzip":
+            weights["gzip"] = q
+        elif name:
+            weights[name] = q
+    candidates = []
+    for name, preference in offered.items():
+        q = weights.get(name, wildcard if wildcard is not None else 0.0)
+        if q > 0:
+            candidates.append((q, preference, name))
+    return max(candidates)[2] if candidates else None
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """The entity tag of one encoding of a representation"""
+    if encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def encoded_etags(etag: str) -> List[str]:
+    """Every entity tag a client may hold for a representation"""
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ENCODINGS]
+
+
+class CompressionMiddleware:
+    """Compress API responses with the best coding the client accepts.
+
+    Only compressible media types are touched, and never the change feed,
+    whose frames must reach the client as they are sent. Responses that
+    already carry a Content-Encoding, such as the precompressed plan
+    bodies, pass through as they are.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressingResponder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.passthrough = False
+        self.encoder = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self._send)
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows how large the body is
+            self.start_message = message
+            headers = {name.lower(): value for name, value in message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            self.passthrough = (
+                b"content-encoding" in headers
+                or not is_compressible(content_type)
+                or content_type.startswith("text/event-stream")
+            )
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < self.minimum_size:
+                await self.send(start)
+                await self.send(message)
+                self.passthrough = True
+                return
+            if more_body:
+                self.encoder = stream_encoder(self.encoding)
+                body = self.encoder.compress(body)
+                _set_headers(start, self.encoding, None)
+            else:
+                body = compress(body, self.encoding)
+                _set_headers(start, self.encoding, len(body))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        body = self.encoder.compress(body)
+        if not more_body:
+            body += self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+def _set_headers(start: dict, encoding: str, length: Optional[int]):
+    headers = []
+    vary = None
+    for name, value in start.get("headers", []):
+        lowered = name.lower()
+        if lowered == b"content-length":
+            continue
+        if lowered == b"vary":
+            vary = value
+            continue
+        if lowered == b"etag" and not value.startswith(b"W/"):
+            # The bytes differ from the identity body; the content does not
+            value = b"W/" + value
+        headers.append((name, value))
+    headers.append((b"content-encoding", encoding.encode()))
+    if vary is None:
+        headers.append((b"vary", b"Accept-Encoding"))
+    elif b"accept-encoding" not in vary.lower():
+        headers.append((b"vary", vary + b", Accept-Encoding"))
+    else:
+        headers.append((b"vary", vary))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    start["headers"] = headers
@@ -0,0 +1,178 @@
+import csv
+import logging
+import os
+import re
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Amounts are stored in TL unless they say otherwise; rates are TL per unit
+BASE_CURRENCY = "TRY"
+
+FX_RATES_FILE = Path(os.environ.get("FX_RATES_FILE", ROOT_DIR / "fx_rates.csv"))
+
+CURRENCY_ALIASES = {"TL": "TRY", "YTL": "TRY", "₺": "TRY", "$": "USD", "€": "EUR"}
+
+_MONEY_PATTERN = re.compile(r"^\s*([$€₺]?)\s*([0-9][0-9.,]*)\s*([A-Za-z₺$€]*)\s*$")
+
+
+def normalize_currency(code: str) -> str:
+    code = code.strip()
+    return CURRENCY_ALIASES.get(code, CURRENCY_ALIASES.get(code.upper(), code.upper()))
+
+
+def _parse_number(text: str) -> float:
+    """Parse 100.000 / 1.200.000,50 / 35,000 / 12.5 regardless of locale"""
+    if "." in text and "," in text:
+        decimal = "." if text.rfind(".") > text.rfind(",") else ","
+    elif text.count(".") > 1 or text.count(",") > 1:
+        decimal = None
+    else:
+        separator = "." if "." in text else ","
+        whole, _, fraction = text.partition(separator)
+        # A single separator followed by exactly three digits groups thousands
+        decimal = None if len(fraction) == 3 and whole != "0" else separator
+    thousands = {".", ","} - {decimal}
+    for separator in thousands:
+        text = text.replace(separator, "")
+    return float(text.replace(",", ".") if decimal == "," else text)
+
+
+def parse_money(text: str, default_currency: str = "USD") -> Tuple[float, str]:
+    """Split free text like "100.000 USD" or "$35,000" into (amount, currency)"""
+    match = _MONEY_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Not an amount: {text!r}")
+    prefix, number, suffix = match.groups()
+    currency = suffix or prefix or default_currency
+    return _parse_number(number), normalize_currency(currency)
+
+
+class FxTable:
+    """Dated exchange rates held as one sorted date array per currency.
+
+    A lookup is a binary search for the latest rate on or before the date;
+    dates before the first rate use the first rate. Rates are TL per unit of
+    the currency, so any pair converts through TL.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[date, str, float]]):
+        by_currency: Dict[str, List[Tuple[np.datetime64, float]]] = {}
+        for day, currency, rate in rows:
+            by_currency.setdefault(normalize_currency(currency), []).append((np.datetime64(day, "D"), float(rate)))
+        self._dates: Dict[str, np.ndarray] = {}
+        self._rates: Dict[str, np.ndarray] = {}
+        for currency, entries in by_currency.items():
+            entries.sort()
+            self._dates[currency] = np.array([day for day, _ in entries], dtype="datetime64[D]")
+            self._rates[currency] = np.array([rate for _, rate in entries])
+
+    @classmethod
+    def load(cls, path: Path, fallback_usd_rate: Optional[float] = None) -> "FxTable":
+        """Read a date,currency,rate CSV; without one, USD at fallback_usd_rate"""
+        try:
+            with open(path, newline="") as file:
+                rows = [(row["date"], row["currency"], row["rate"]) for row in csv.DictReader(file)]
+        except FileNotFoundError:
+            logging.warning(f"FX rate table {path} not found, using the plan rate only")
+            rows = [("1970-01-01", "USD", fallback_usd_rate)] if fallback_usd_rate else []
+        return cls(rows)
+
+    def currencies(self) -> List[str]:
+        return sorted(set(self._dates) | {BASE_CURRENCY})
+
+    def rates(self, currency: str, dates) -> np.ndarray:
+        """TL per unit of currency on each date"""
+        currency = normalize_currency(currency)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        if currency == BASE_CURRENCY:
+            return np.ones(dates.shape)
+        if currency not in self._dates:
+            raise ValueError(f"No exchange rates for {currency}")
+        index = np.searchsorted(self._dates[currency], dates, side="right") - 1
+        return self._rates[currency][np.clip(index, 0, None)]
+
+    def rate(self, currency: str, on: date) -> float:
+        return float(self.rates(currency, [on])[0])
+
+    def convert(self, amounts, currencies: List[str], target: str, dates) -> np.ndarray:
+        """Convert many amounts at once, each from its own currency and date"""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        currencies = np.asarray([normalize_currency(code) for code in currencies])
+        in_tl = np.empty_like(amounts)
+        for currency in np.unique(currencies).tolist():
+            selected = currencies == currency
+            in_tl[selected] = amounts[selected] * self.rates(currency, dates[selected])
+        return in_tl / self.rates(target, dates)
+
+
+# Monetary fields of stored plan content. "*" matches every list item; amounts
+# are TL unless a "currency" key sits next to them.
+MONEY_PATHS = [
+    ("financial_data", "*", "financials", "*", field) for field in ("sales", "costs", "gross", "opex", "ebitda")
+] + [
+    ("financial_data", "ertug", "production", "*", field) for field in ("cost", "price")
+] + [
+    ("financial_data", "fiyuu_sales", "sales", "*", field) for field in ("buy_price", "sell_price")
+] + [
+    ("financial_data", "fiyuu_swap", "rental", "*", field) for field in ("monthly_rental", "battery_cost")
+] + [
+    ("financial_data", "*", driver, "*", field)
+    for driver in ("production", "sales", "rental")
+    for field in ("discount", "opex", "unit_depreciation")
+] + [
+    ("financial_data", "ertug", "investments", "*", "amount"),
+]
+
+
+def _collect(node, path: tuple, year: Optional[str], found: list):
+    """Find (container, key, year) for every value matching path under node"""
+    if isinstance(node, dict) and "year" in node:
+        year = node["year"]
+    if len(path) == 1:
+        if isinstance(node, dict) and isinstance(node.get(path[0]), (int, float)):
+            found.append((node, path[0], year))
+        return
+    head, rest = path[0], path[1:]
+    if isinstance(node, list):
+        children = node if head == "*" else []
+    elif isinstance(node, dict):
+        children = list(node.values()) if head == "*" else ([node[head]] if head in node else [])
+    else:
+        children = []
+    for child in children:
+        _collect(child, rest, year, found)
+
+
+def convert_plan_content(content: dict, table: FxTable, target: str, on: date) -> dict:
+    """Convert every monetary field of plan content to target, in place.
+
+    All values are gathered first and converted in a single vectorized call.
+    Rows with a year use the rate at the start of that year; everything else
+    uses the rate on the given date.
+    """
+    target = normalize_currency(target)
+    found: list = []
+    for path in MONEY_PATHS:
+        _collect(content, path, None, found)
+    if not found:
+        return content
+
+    default_date = np.datetime64(on, "D")
+    dates = [np.datetime64(f"{year}-01-01", "D") if year and str(year).isdigit() else default_date
+             for _, _, year in found]
+    currencies = [container.get("currency", BASE_CURRENCY) if key == "amount" else BASE_CURRENCY
+                  for container, key, _ in found]
+    converted = table.convert([container[key] for container, key, _ in found], currencies, target, dates)
+    for (container, key, _), value in zip(found, converted.round(2).tolist()):
+        container[key] = value
+        if key == "amount" and "currency" in container:
+            container["currency"] = target
+    return content
@@ -0,0 +1,127 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+MAX_CUSTOMS_LINES = int(os.environ.get("MAX_CUSTOMS_LINES", "20000"))
+
+# HS code -> duty rates on the CIF value (customs duty, additional duty) and
+# special consumption tax (OTV) on the duty-paid cost
+HS_RATES: Dict[str, Dict[str, float]] = {
+    "8714.10.00.90": {"customs_duty": 0.037, "additional_duty": 0.05, "excise": 0.0},  # moped parts (CKD)
+    "8507.60.00.00.01": {"customs_duty": 0.027, "additional_duty": 0.30, "excise": 0.03},  # Li-ion batteries
+    "8504.40.95.90.12": {"customs_duty": 0.033, "additional_duty": 0.05, "excise": 0.0},  # chargers, cabinets
+}
+
+# Charges per customs declaration in TL, shared out over its lines
+SHIPMENT_FEES: Dict[str, float] = {
+    "stamp_duty": 900.0,  # dv
+    "storage": 15000.0,  # dep
+    "handling": 800.0,  # tah
+    "other": 1000.0,  # tum_sair
+    "logistics": 35000.0,  # logis
+}
+
+# Output columns per unit, in the order of the customs calculation table
+LANDED_COST_FIELDS = (
+    "fob_usd", "freight", "cif_usd", "cif_tl", "gv", "ilave_gv", "kkdf", "dv", "dep", "tah",
+    "tum_sair", "logis", "cogs", "bandrol", "ara_top", "otv", "final_tl", "final_usd",
+)
+
+_FEE_FIELDS = {"stamp_duty": "dv", "storage": "dep", "handling": "tah", "other": "tum_sair", "logistics": "logis"}
+
+
+def _rate_columns(hs_codes: List[str], rates: Dict[str, Dict[str, float]]):
+    """Per-line rate arrays, looking each distinct HS code up once"""
+    positions: Dict[str, int] = {}
+    inverse = np.fromiter((positions.setdefault(code, len(positions)) for code in hs_codes), np.intp, len(hs_codes))
+    unknown = [code for code in positions if code not in rates]
+    if unknown:
+        raise ValueError(f"No duty rates for HS codes: {', '.join(unknown)}")
+    table = np.array([
+        [rates[code].get("customs_duty", 0.0), rates[code].get("additional_duty", 0.0), rates[code].get("excise", 0.0)]
+        for code in positions
+    ]).reshape(len(positions), 3)
+    return table[inverse].T
+
+
+def landed_cost(hs_codes: List[str], fob_usd, freight_usd, insurance_usd, qty, fx_rate: float,
+                rates: Optional[Dict[str, Dict[str, float]]] = None,
+                fees: Optional[Dict[str, float]] = None, kkdf_rate: float = 0.0,
+                bandrol=0.0, allocation: str = "value") -> Dict[str, np.ndarray]:
+    """Compute the per-unit landed cost chain for a batch of lines in one pass.
+
+    Lines are one shipment: SHIPMENT_FEES are spread over them by CIF value or
+    by quantity, then per unit. All amounts are per unit and in TL unless the
+    field name says USD. Returns one array per LANDED_COST_FIELDS entry.
+    """
+    fob_usd = np.asarray(fob_usd, dtype=np.float64)
+    freight_usd = np.broadcast_to(np.asarray(freight_usd, dtype=np.float64), fob_usd.shape)
+    insurance_usd = np.asarray(insurance_usd, dtype=np.float64)
+    qty = np.broadcast_to(np.asarray(qty, dtype=np.float64), fob_usd.shape)
+    if (qty <= 0).any():
+        raise ValueError("Quantities must be positive")
+    if (fob_usd < 0).any() or (freight_usd < 0).any() or (insurance_usd < 0).any() or fx_rate <= 0:
+        raise ValueError("Amounts must not be negative and the FX rate must be positive")
+    customs_duty, additional_duty, excise = _rate_columns(hs_codes, {**HS_RATES, **(rates or {})})
+    fees = {**SHIPMENT_FEES, **(fees or {})}
+    unknown = set(fees) - set(SHIPMENT_FEES)
+    if unknown:
+        raise ValueError(f"Unknown shipment fees: {', '.join(sorted(unknown))}")
+    if any(amount < 0 for amount in fees.values()):
+        raise ValueError("Shipment fees must not be negative")
+
+    cif_usd = fob_usd + freight_usd + insurance_usd
+    cif_tl = cif_usd * fx_rate
+    gv = cif_tl * customs_duty
+    ilave_gv = cif_tl * additional_duty
+    kkdf = cif_tl * kkdf_rate
+
+    if allocation == "value":
+        weights = cif_tl * qty
+    elif allocation == "quantity":
+        weights = qty
+    else:
+        raise ValueError(f"Unknown fee allocation: {allocation}")
+    total = weights.sum()
+    if total == 0:
+        # Every line has zero CIF: nothing to weigh by, so split fees evenly per unit
+        weights, total = qty, qty.sum()
+    share = weights / total / qty  # fraction of each shipment fee borne by one unit
+
+    columns = {
+        "fob_usd": fob_usd, "freight": freight_usd, "cif_usd": cif_usd, "cif_tl": cif_tl,
+        "gv": gv, "ilave_gv": ilave_gv, "kkdf": kkdf,
+    }
+    cogs = cif_tl + gv + ilave_gv + kkdf
+    for fee, field in _FEE_FIELDS.items():
+        columns[field] = share * fees[fee]
+        cogs = cogs + columns[field]
+    columns["cogs"] = cogs
+    columns["bandrol"] = np.broadcast_to(np.asarray(bandrol, dtype=np.float64), fob_usd.shape)
+    columns["ara_top"] = cogs + columns["bandrol"]
+    columns["otv"] = columns["ara_top"] * excise
+    columns["final_tl"] = columns["ara_top"] + columns["otv"]
+    columns["final_usd"] = columns["final_tl"] / fx_rate
+    return columns
+
+
+def shipment_totals(columns: Dict[str, np.ndarray], qty, fx_rate: float):
+    """Line totals in TL and shipment totals for a landed_cost result"""
+    qty = np.asarray(qty, dtype=np.float64)
+    line_totals = columns["final_tl"] * qty
+    duties = columns["gv"] + columns["ilave_gv"] + columns["kkdf"]
+    totals = {
+        "qty": int(qty.sum()),
+        "cif_tl": float(columns["cif_tl"] @ qty),
+        "duties_tl": float(duties @ qty),
+        "otv_tl": float(columns["otv"] @ qty),
+        "final_tl": float(line_totals.sum()),
+    }
+    totals["final_usd"] = totals["final_tl"] / fx_rate
+    return line_totals, {key: round(value, 2) for key, value in totals.items()}
@@ -1,70 +1,621 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import base64
+import json
 import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
+from cache import image_metadata_cache, plan_caches
+from plan_history import diff, is_snapshot_version, reconstruct
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# The plan served by the routes that predate multi-plan support
+DEFAULT_PLAN_ID = os.environ.get("DEFAULT_PLAN_ID", "default-business-plan-001")
+
+# Image listings fetch this many documents per round trip
+IMAGE_LISTING_BATCH = int(os.environ.get("IMAGE_LISTING_BATCH", "200"))
+IMAGE_LISTING_PROJECTION = {
+    "_id": 0, "id": 1, "plan_id": 1, "type": 1, "item_id": 1, "original_name": 1,
+    "mimetype": 1, "size": 1, "sha256": 1, "uploaded_at": 1, "width": 1, "height": 1
+}
+# Newest first; id breaks ties, so the order is total and pages never overlap
+IMAGE_LISTING_SORT = [("uploaded_at", -1), ("id", -1)]
+
+# The filters and sorts DatabaseManager issues, with sample values, registered
+# next to each query so `python indexes.py explain` checks every one of them
+QUERY_CATALOG: List[Tuple[str, str, dict, Optional[list]]] = []
+# Methods that only insert, or read a whole collection on purpose, so have no filter to index
+UNINDEXED_QUERIES: Set[str] = set()
+SAMPLE_TIME = datetime(2024, 1, 1)
+SAMPLE_SHA256 = "0" * 64
+
+
+def catalog_query(collection: str, query: dict, sort: Optional[list] = None,
+                  variant: Optional[str] = None) -> Callable:
+    """Register a filter and sort the decorated method issues, for the index explain"""
+    def register(method):
+        name = f"{method.__name__}({variant})" if variant else method.__name__
+        QUERY_CATALOG.append((name, collection, query, sort))
+        return method
+    return register
+
+
+def unindexed(method):
+    """Mark a method whose queries need no index, so the catalog check skips it"""
+    UNINDEXED_QUERIES.add(method.__name__)
+    return method
+
+
+def encode_image_cursor(image: dict) -> str:
+    """Opaque position after image in a listing ordered by (uploaded_at, id)"""
+    position = json.dumps([image["uploaded_at"].isoformat(), image["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_image_cursor(cursor: str) -> Tuple[datetime, str]:
+    """The (uploaded_at, id) an image cursor points after; ValueError if malformed"""
+    try:
+        uploaded_at, image_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(uploaded_at), str(image_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid image cursor") from e
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool usage so workers can be sized under load.
+
+    Motor runs PyMongo in executor threads, so counters are guarded by a lock
+    and checkout start times are kept per thread.
+    """
 
-class DatabaseManager:
     def __init__(self):
-        self.business_plans = db.business_plans
-        self.images = db.images
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.pool_clears = 0
+
+    def _record_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        if started is None:
+            return
+        wait = time.perf_counter() - started
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._record_wait()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self._record_wait()
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_ms": 1000 * self.total_wait / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": 1000 * self.max_wait,
+                "pool_clears": self.pool_clears,
+            }
+
+pool_stats = PoolStatsListener()
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def client_options() -> dict:
+    """Motor client settings, read from the environment"""
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS"),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS"),
+        # e.g. "zstd,snappy,zlib"; the server picks the first it supports
+        "compressors": os.environ.get("MONGO_COMPRESSORS") or None,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+# MongoDB connection, created on first use rather than at import
+_client: Optional[AsyncIOMotorClient] = None
+
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        load_dotenv(ROOT_DIR / '.env')
+        _client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'], event_listeners=[pool_stats], **client_options()
+        )
+    return _client
+
+def get_database():
+    return get_client()[os.environ['DB_NAME']]
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+class DatabaseManager:
+    @property
+    def business_plans(self):
+        return get_database().business_plans
+
+    @property
+    def plan_versions(self):
+        return get_database().plan_versions
+
+    @property
+    def images(self):
+        return get_database().images
+
+    @property
+    def image_blobs(self):
+        return get_database().image_blobs
+
+    @property
+    def jobs(self):
+        return get_database().jobs
 
-    async def get_business_plan(self) -> Optional[dict]:
-        """Get the current business plan data"""
-        plan = await self.business_plans.find_one({"active": True})
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True})
+    async def get_business_plan(self, projection: Optional[dict] = None,
+                                plan_id: str = DEFAULT_PLAN_ID) -> Optional[dict]:
+        """Get the current data of a business plan, optionally only the projected fields"""
+        plan = await self.business_plans.find_one({"id": plan_id, "active": True}, projection)
         return plan
 
-    async def create_business_plan(self, plan_data: dict) -> str:
-        """Create or update the business plan"""
-        # Deactivate existing plans
-        await self.business_plans.update_many({}, {"$set": {"active": False}})
-        
-        # Create new active plan
-        plan_data["active"] = True
-        result = await self.business_plans.insert_one(plan_data)
-        return str(result.inserted_id)
+    @catalog_query("business_plans", {"active": True}, [("id", 1)])
+    @catalog_query("business_plans", {"active": True, "id": {"$gt": DEFAULT_PLAN_ID}}, [("id", 1)], "after")
+    async def list_business_plans(self, limit: int = 100, after: Optional[str] = None) -> list:
+        """Ids and versions of the active plans, ordered by id"""
+        query = {"active": True}
+        if after:
+            query["id"] = {"$gt": after}
+        cursor = self.business_plans.find(
+            query, {"_id": 0, "id": 1, "version": 1, "created_at": 1, "updated_at": 1}
+        ).sort("id", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True, "version": 1})
+    async def create_business_plan(self, plan_data: dict) -> Optional[str]:
+        """Create or replace the business plan, returning its id.
+
+        Returns None when another writer created or changed the plan between
+        reading its version and writing, so nothing was written.
+        """
+        # Keep counting versions across replacements so stale If-Match values fail
+        document = {key: value for key, value in plan_data.items() if key != "_id"}
+        current = await self.business_plans.find_one(
+            {"id": document["id"], "active": True}, {"_id": 0, "version": 1, "content": 1}
+        )
+        document["active"] = True
+        document["version"] = (current or {}).get("version", 0) + 1
+
+        if current:
+            # Replace in place, only if no write landed since the read; the
+            # previous content lives on as a delta
+            version = current.get("version", 0)
+            query = {"id": document["id"], "active": True}
+            query["version"] = version if version else {"$in": [0, None]}
+            result = await self.business_plans.replace_one(query, document)
+            if not result.matched_count:
+                return None
+            delta = diff(current.get("content", {}), document.get("content", {}))
+        else:
+            try:
+                await self.business_plans.insert_one(document)
+            except DuplicateKeyError:
+                return None
+            delta = None
+        plan_caches.invalidate(document["id"])
+        await self.record_plan_version(document["id"], document["version"], delta, document.get("content"))
+        return document["id"]
 
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True})
+    async def seed_business_plan(self, plan_data: dict) -> bool:
+        """Insert the plan as version 1 unless an active plan with its id exists.
+
+        One upsert, so starting several workers at once seeds exactly once
+        and an existing plan is never read or touched. Returns whether the
+        plan was inserted.
+        """
+        document = {key: value for key, value in plan_data.items() if key != "_id"}
+        document.update(active=True, version=1)
+        try:
+            result = await self.business_plans.update_one(
+                {"id": document["id"], "active": True}, {"$setOnInsert": document}, upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker inserted it between our match and insert
+            return False
+        if result.upserted_id is None:
+            return False
+        plan_caches.invalidate(document["id"])
+        await self.record_plan_version(document["id"], 1, None, document.get("content"))
+        return True
+
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True})
     async def update_business_plan(self, plan_id: str, plan_data: dict) -> bool:
         """Update an existing business plan"""
-        plan_data["updated_at"] = plan_data.get("updatedAt")
-        result = await self.business_plans.update_one(
-            {"id": plan_id}, 
-            {"$set": plan_data}
+        # Conditional GETs rely on updated_at moving forward on every write
+        plan_data["updated_at"] = plan_data.get("updatedAt") or datetime.utcnow()
+        plan_data.pop("version", None)
+        previous = await self.business_plans.find_one_and_update(
+            {"id": plan_id, "active": True}, 
+            {"$set": plan_data, "$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1, "content": 1},
         )
-        return result.modified_count > 0
+        plan_caches.invalidate(plan_id)
+        if previous is None:
+            return False
+        if "content" in plan_data:
+            delta = diff(previous.get("content", {}), plan_data["content"])
+            await self.record_plan_version(plan_id, previous.get("version", 0) + 1, delta, plan_data["content"])
+        return True
+
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True, "version": 1})
+    async def apply_plan_update(self, plan_id: str, version: int, update: dict, delta: Optional[list] = None) -> bool:
+        """Apply a prepared update if the active plan is still at version.
+
+        Returns False when another writer got there first. Plans written before
+        versioning have no version field and count as version 0. delta is the
+        diff the update makes to the content, kept as history.
+        """
+        query = {"id": plan_id, "active": True}
+        query["version"] = version if version else {"$in": [0, None]}
+        result = await self.business_plans.update_one(query, update)
+        if result.matched_count:
+            plan_caches.invalidate(plan_id)
+            await self.record_plan_version(plan_id, version + 1, delta)
+        return result.matched_count > 0
 
+    @catalog_query("plan_versions", {"plan_id": DEFAULT_PLAN_ID}, [("version", -1)])
+    @catalog_query("business_plans", {"id": DEFAULT_PLAN_ID, "active": True, "version": 1}, variant="content")
+    async def record_plan_version(self, plan_id: str, version: int, delta: Optional[list],
+                                  content: Optional[dict] = None):
+        """Store version as a delta on the previous one, or as a full snapshot.
+
+        Snapshots are taken every SNAPSHOT_INTERVAL versions and whenever the
+        previous version is missing from history, so every chain starts with
+        one. Without content, a snapshot is read back from the plan itself.
+        """
+        latest = await self.plan_versions.find_one(
+            {"plan_id": plan_id}, {"_id": 0, "version": 1}, sort=[("version", -1)]
+        )
+        record = {"plan_id": plan_id, "version": version, "created_at": datetime.utcnow()}
+        if delta is not None and latest and latest["version"] == version - 1 and not is_snapshot_version(version):
+            record.update(kind="delta", ops=delta)
+        else:
+            if content is None:
+                plan = await self.business_plans.find_one(
+                    {"id": plan_id, "active": True, "version": version}, {"_id": 0, "content": 1}
+                )
+                if plan is None:
+                    # Already superseded; the next write starts a fresh chain
+                    return
+                content = plan.get("content", {})
+            record.update(kind="snapshot", content=content)
+        try:
+            await self.plan_versions.insert_one(record)
+        except DuplicateKeyError:
+            pass
+
+    @catalog_query("plan_versions", {"plan_id": DEFAULT_PLAN_ID}, [("version", -1)])
+    async def list_plan_versions(self, plan_id: str, limit: int = 100) -> list:
+        """Newest first, without the stored content or operations"""
+        cursor = self.plan_versions.aggregate([
+            {"$match": {"plan_id": plan_id}},
+            {"$sort": {"version": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "version": 1, "kind": 1, "created_at": 1,
+                          "changes": {"$size": {"$ifNull": ["$ops", []]}}}},
+        ])
+        return await cursor.to_list(length=limit)
+
+    @catalog_query("plan_versions", {"plan_id": DEFAULT_PLAN_ID, "kind": "snapshot", "version": {"$lte": 1}},
+                   [("version", -1)])
+    @catalog_query("plan_versions", {"plan_id": DEFAULT_PLAN_ID, "version": {"$gt": 1, "$lte": 2}}, [("version", 1)],
+                   "deltas")
+    async def get_plan_version(self, plan_id: str, version: int) -> Optional[dict]:
+        """Plan content as it was at version, or None when not in history"""
+        snapshot = await self.plan_versions.find_one(
+            {"plan_id": plan_id, "kind": "snapshot", "version": {"$lte": version}},
+            {"_id": 0}, sort=[("version", -1)]
+        )
+        if snapshot is None:
+            return None
+        deltas = await self.plan_versions.find(
+            {"plan_id": plan_id, "version": {"$gt": snapshot["version"], "$lte": version}}, {"_id": 0}
+        ).sort("version", 1).to_list(length=None)
+        try:
+            return reconstruct([snapshot] + deltas, version)
+        except LookupError:
+            return None
+
+    @unindexed
     async def save_image_metadata(self, image_data: dict) -> str:
         """Save image metadata to database"""
         result = await self.images.insert_one(image_data)
         return str(result.inserted_id)
 
+    @unindexed
+    async def save_image_metadata_many(self, images: List[dict]) -> int:
+        """Save metadata for a batch of uploads in one round trip"""
+        if not images:
+            return 0
+        result = await self.images.insert_many(images, ordered=False)
+        return len(result.inserted_ids)
+
+    @catalog_query("images", {"id": {"$in": ["sample-image-id", "other-image-id"]}})
+    async def get_images_metadata(self, image_ids: List[str]) -> Dict[str, dict]:
+        """Get metadata for many images by ID, querying only those not cached"""
+        found = {}
+        missing = []
+        for image_id in dict.fromkeys(image_ids):
+            image = image_metadata_cache.get(image_id)
+            if image is None:
+                missing.append(image_id)
+            else:
+                found[image_id] = image
+        if missing:
+            async for image in self.images.find({"id": {"$in": missing}}):
+                image_metadata_cache.put(image["id"], image)
+                found[image["id"]] = image
+        return found
+
+    @catalog_query("images", {"id": "sample-image-id"})
     async def get_image_metadata(self, image_id: str) -> Optional[dict]:
         """Get image metadata by ID"""
-        image = await self.images.find_one({"id": image_id})
+        image = image_metadata_cache.get(image_id)
+        if image is None:
+            image = await self.images.find_one({"id": image_id})
+            if image:
+                image_metadata_cache.put(image_id, image)
         return image
 
+    @catalog_query("images", {"id": "sample-image-id"})
     async def delete_image_metadata(self, image_id: str) -> bool:
         """Delete image metadata"""
+        image_metadata_cache.pop(image_id)
         result = await self.images.delete_one({"id": image_id})
         return result.deleted_count > 0
 
-    async def get_images_by_type(self, image_type: str, item_id: Optional[str] = None) -> list:
-        """Get images by type and optionally by item_id"""
-        query = {"type": image_type}
+    @catalog_query("image_blobs", {"_id": SAMPLE_SHA256})
+    async def acquire_blob(self, sha256: str, blob_data: dict) -> int:
+        """Add a reference to a content-addressed blob, creating its record if needed"""
+        update = {"$inc": {"refcount": 1}, "$setOnInsert": blob_data}
+        try:
+            blob = await self.image_blobs.find_one_and_update(
+                {"_id": sha256}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race with another upload of the same bytes
+            blob = await self.image_blobs.find_one_and_update(
+                {"_id": sha256}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return blob["refcount"]
+
+    @catalog_query("image_blobs", {"_id": SAMPLE_SHA256})
+    async def release_blob(self, sha256: str) -> int:
+        """Drop a reference to a blob and return how many remain"""
+        blob = await self.image_blobs.find_one_and_update(
+            {"_id": sha256},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        return blob["refcount"] if blob else 0
+
+    @catalog_query("image_blobs", {"_id": SAMPLE_SHA256, "refcount": {"$lte": 0}})
+    async def delete_blob_if_unreferenced(self, sha256: str) -> bool:
+        """Remove a blob record only if nothing references it any more"""
+        result = await self.image_blobs.delete_one({"_id": sha256, "refcount": {"$lte": 0}})
+        return result.deleted_count > 0
+
+    @unindexed
+    async def iter_image_records(self) -> AsyncIterator[dict]:
+        """Stream the storage facts of every image, for reconciliation"""
+        cursor = self.images.find(
+            {}, {"_id": 0, "id": 1, "plan_id": 1, "sha256": 1, "path": 1, "uploaded_at": 1}
+        ).batch_size(IMAGE_LISTING_BATCH)
+        async for image in cursor:
+            yield image
+
+    @unindexed
+    async def iter_blob_records(self) -> AsyncIterator[dict]:
+        """Stream every blob reference record"""
+        async for blob in self.image_blobs.find({}).batch_size(IMAGE_LISTING_BATCH):
+            yield blob
+
+    @catalog_query("business_plans", {"active": True})
+    async def iter_plan_image_refs(self) -> AsyncIterator[Tuple[str, str, str]]:
+        """Yield (plan_id, field path, image_id) for every product image a plan links to"""
+        cursor = self.business_plans.find({"active": True}, {"_id": 0, "id": 1, "content.products": 1})
+        async for plan in cursor:
+            products = plan.get("content", {}).get("products") or {}
+            for index, item in enumerate(products.get("equipment") or []):
+                if item.get("image_id"):
+                    yield plan["id"], f"products.equipment.{index}.image_id", item["image_id"]
+            for name in ("emoped", "battery"):
+                image_id = (products.get(name) or {}).get("image_id")
+                if image_id:
+                    yield plan["id"], f"products.{name}.image_id", image_id
+
+    @catalog_query("image_blobs", {"_id": SAMPLE_SHA256})
+    async def blob_record_missing(self, sha256: str) -> bool:
+        """True when no reference record exists for a blob"""
+        return await self.image_blobs.find_one({"_id": sha256}, {"_id": 1}) is None
+
+    @catalog_query("image_blobs", {"_id": SAMPLE_SHA256, "refcount": 2})
+    async def reset_leaked_blob(self, sha256: str, refcount: int) -> bool:
+        """Zero a blob's refcount if it still holds the value a scan observed"""
+        result = await self.image_blobs.update_one({"_id": sha256, "refcount": refcount}, {"$set": {"refcount": 0}})
+        return result.modified_count > 0
+
+    @catalog_query("images", {"id": "sample-image-id"})
+    async def set_image_details(self, image_id: str, details: dict) -> bool:
+        """Store facts found after upload, such as dimensions, on an image"""
+        image_metadata_cache.pop(image_id)
+        result = await self.images.update_one({"id": image_id}, {"$set": details})
+        return result.matched_count > 0
+
+    @unindexed
+    async def create_jobs(self, jobs: List[dict]) -> int:
+        """Record queued jobs in one round trip"""
+        if not jobs:
+            return 0
+        result = await self.jobs.insert_many([dict(job) for job in jobs])
+        return len(result.inserted_ids)
+
+    @catalog_query("jobs", {"type": {"$in": ["image.process"]}, "$or": [
+        {"status": "queued", "run_at": {"$lte": SAMPLE_TIME}},
+        {"status": "running", "lease_until": {"$lt": SAMPLE_TIME}},
+    ]}, [("run_at", 1)])
+    async def claim_job(self, types: List[str], worker: str, lease_until: datetime) -> Optional[dict]:
+        """Take the oldest due job of the given types, or one whose lease ran out.
+
+        The claim is a single find_one_and_update, so two workers never take
+        the same job, and a job of a crashed worker is picked up again once
+        its lease expires.
+        """
+        now = datetime.utcnow()
+        job = await self.jobs.find_one_and_update(
+            {"type": {"$in": types}, "$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "running", "worker": worker, "lease_until": lease_until,
+                      "started_at": now, "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            job.pop("_id", None)
+        return job
+
+    @catalog_query("jobs", {"id": "sample-job-id", "worker": "sample-worker", "status": "running"})
+    async def finish_job(self, job_id: str, worker: str, update: dict) -> bool:
+        """Record a job's outcome, unless another worker has taken it over since"""
+        update = {**update, "updated_at": datetime.utcnow()}
+        result = await self.jobs.update_one(
+            {"id": job_id, "worker": worker, "status": "running"},
+            {"$set": update, "$unset": {"lease_until": ""}}
+        )
+        return result.modified_count > 0
+
+    @catalog_query("jobs", {"id": "sample-job-id"})
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0, "lease_until": 0})
+
+    @unindexed
+    async def count_jobs(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        counts = {}
+        async for row in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    @catalog_query("images", {"plan_id": {"$exists": False}})
+    async def assign_default_plan(self) -> int:
+        """Move images uploaded before plan namespaces into the default plan"""
+        result = await self.images.update_many({"plan_id": {"$exists": False}}, {"$set": {"plan_id": DEFAULT_PLAN_ID}})
+        return result.modified_count
+
+    @catalog_query("images", {"plan_id": DEFAULT_PLAN_ID}, IMAGE_LISTING_SORT)
+    @catalog_query("images", {"plan_id": DEFAULT_PLAN_ID, "type": "equipment"}, IMAGE_LISTING_SORT, "type")
+    @catalog_query("images", {"plan_id": DEFAULT_PLAN_ID, "type": "equipment", "item_id": "sample-item"},
+                   IMAGE_LISTING_SORT, "item_id")
+    @catalog_query("images", {"plan_id": DEFAULT_PLAN_ID, "type": "equipment", "$or": [
+        {"uploaded_at": {"$lt": SAMPLE_TIME}},
+        {"uploaded_at": SAMPLE_TIME, "id": {"$lt": "sample-image-id"}},
+    ]}, IMAGE_LISTING_SORT, "after")
+    async def get_images_by_type(self, image_type: Optional[str] = None, item_id: Optional[str] = None,
+                                 plan_id: str = DEFAULT_PLAN_ID, after: Optional[Tuple[datetime, str]] = None,
+                                 limit: Optional[int] = None) -> AsyncIterator[dict]:
+        """Stream a plan's images newest first, optionally by type and item_id.
+
+        Pass the (uploaded_at, id) of the last image seen as after to resume
+        behind it. The sort key is unique, so pages never repeat or skip an
+        image, and every page is an index range scan however deep it is.
+        """
+        query = {"plan_id": plan_id}
+        if image_type:
+            query["type"] = image_type
         if item_id:
             query["item_id"] = item_id
+        if after:
+            uploaded_at, image_id = after
+            query["$or"] = [
+                {"uploaded_at": {"$lt": uploaded_at}},
+                {"uploaded_at": uploaded_at, "id": {"$lt": image_id}},
+            ]
         
-        cursor = self.images.find(query)
-        images = await cursor.to_list(length=None)
-        return images
+        cursor = self.images.find(query, IMAGE_LISTING_PROJECTION).sort(
+            IMAGE_LISTING_SORT
+        ).batch_size(IMAGE_LISTING_BATCH)
+        if limit:
+            cursor = cursor.limit(limit)
+        async for image in cursor:
+            yield image
 
 # Global database manager instance
 db_manager = DatabaseManager()
\ No newline at end of file
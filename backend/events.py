@@ -0,0 +1,279 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# "memory" reaches subscribers of this process only; "redis" relays events
+# between workers through a Redis channel at EVENT_REDIS_URL
+EVENT_BROKER = os.environ.get("EVENT_BROKER", "memory")
+EVENT_REDIS_URL = os.environ.get("EVENT_REDIS_URL", "redis://localhost:6379/0")
+EVENT_CHANNEL = os.environ.get("EVENT_CHANNEL", "emopad:events")
+# Seconds before resubscribing after the Redis connection drops, doubling up to the max
+EVENT_RECONNECT_BASE = float(os.environ.get("EVENT_RECONNECT_BASE", "1"))
+EVENT_RECONNECT_MAX = float(os.environ.get("EVENT_RECONNECT_MAX", "30"))
+
+# Events a subscriber may fall behind by before it is told to resync
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "256"))
+# Recent events kept for clients reconnecting with Last-Event-ID
+EVENT_HISTORY = int(os.environ.get("EVENT_HISTORY", "1024"))
+# Patches larger than this are left out; clients refetch instead
+EVENT_MAX_PATCH_BYTES = int(os.environ.get("EVENT_MAX_PATCH_BYTES", str(64 * 1024)))
+EVENT_KEEPALIVE = float(os.environ.get("EVENT_KEEPALIVE", "15"))
+
+
+def plan_event(event_type: str, plan_id: str, version: Optional[int] = None,
+               patch: Optional[List[dict]] = None, **fields) -> dict:
+    """A change event; sections lists the top-level plan keys a patch touches"""
+    event = {"type": event_type, "plan_id": plan_id, "at": datetime.utcnow().isoformat() + "Z"}
+    if version is not None:
+        event["version"] = version
+    if patch is not None:
+        event["sections"] = sorted({op["path"].split("/")[1] for op in patch if op["path"].count("/")})
+        encoded = json.dumps(patch, separators=(",", ":"), default=str)
+        event["patch"] = patch if len(encoded) <= EVENT_MAX_PATCH_BYTES else None
+    event.update(fields)
+    return event
+
+
+class EventBroker(ABC):
+    """Carries serialized events to every worker's hub"""
+
+    async def start(self, deliver: Callable[[bytes], None]):
+        self._deliver = deliver
+
+    @abstractmethod
+    async def publish(self, message: bytes):
+        """Send a message to the hubs of every worker"""
+
+    async def stop(self):
+        pass
+
+
+class MemoryBroker(EventBroker):
+    """Single-process broker: publishing delivers straight to the local hub"""
+
+    async def publish(self, message: bytes):
+        self._deliver(message)
+
+
+def _redis_asyncio():
+    """redis.asyncio, imported on first use: redis is optional, only this broker needs it"""
+    try:
+        import redis.asyncio
+    except ImportError as e:
+        raise RuntimeError("EVENT_BROKER=redis needs the redis package") from e
+    return redis.asyncio
+
+
+class RedisBroker(EventBroker):
+    """Relays events between worker processes over a Redis pub/sub channel.
+
+    Publishers do not deliver locally; every worker, including the one that
+    published, receives the event back from the channel exactly once.
+    """
+
+    def __init__(self, url: str = EVENT_REDIS_URL, channel: str = EVENT_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[bytes], None]):
+        await super().start(deliver)
+        self._client = _redis_asyncio().from_url(self.url)
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub):
+        """Deliver channel messages, resubscribing with backoff whenever the connection drops"""
+        failures = 0
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = self._client.pubsub()
+                        await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if failures:
+                            logging.info(f"Resubscribed to event channel {self.channel}")
+                            failures = 0
+                        if message.get("type") == "message":
+                            self._deliver(message["data"])
+                    raise ConnectionError("subscription ended")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Events published until then are lost; clients catch up on their next refetch
+                    failures += 1
+                    delay = min(EVENT_RECONNECT_MAX, EVENT_RECONNECT_BASE * 2 ** (failures - 1))
+                    logging.error(f"Lost event channel {self.channel}, reconnecting in {delay:.1f}s: {e}")
+                    await self._close(pubsub)
+                    pubsub = None
+                    await asyncio.sleep(delay)
+        finally:
+            await self._close(pubsub)
+
+    @staticmethod
+    async def _close(pubsub):
+        if pubsub is None:
+            return
+        try:
+            await pubsub.aclose()
+        except Exception as e:
+            logging.warning(f"Could not close event channel subscription: {e}")
+
+    async def publish(self, message: bytes):
+        await self._client.publish(self.channel, message)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def create_broker(name: str = EVENT_BROKER) -> EventBroker:
+    if name == "memory":
+        return MemoryBroker()
+    if name == "redis":
+        # Fail at startup, not on the first subscription, when redis is missing
+        _redis_asyncio()
+        return RedisBroker()
+    raise ValueError(f"Unknown event broker: {name}")
+
+
+class Subscription:
+    """One client's queue of encoded SSE frames for a plan"""
+
+    def __init__(self, hub: "EventHub", plan_id: str, maxsize: int):
+        self.hub = hub
+        self.plan_id = plan_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def offer(self, frame: bytes):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Too far behind to catch up event by event
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+
+    async def next_frame(self, timeout: float = EVENT_KEEPALIVE) -> bytes:
+        """The next frame, or a keepalive comment after timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return KEEPALIVE_FRAME
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+
+RESYNC_FRAME = b'event: resync\ndata: {"type":"resync"}\n\n'
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
+class EventHub:
+    """Fans plan change events out to Server-Sent Events subscribers.
+
+    Every event goes through the broker, then is encoded once and offered to
+    the subscribers of its plan only. Slow subscribers are never waited for:
+    when a queue fills up it is replaced by a single resync event.
+
+    Event ids are assigned by the publishing worker and travel with the event,
+    so every worker knows an event by the same id and a client reconnecting
+    to another worker resumes where it left off.
+    """
+
+    def __init__(self, broker: Optional[EventBroker] = None,
+                 queue_size: int = EVENT_QUEUE_SIZE, history: int = EVENT_HISTORY):
+        self.broker = broker or MemoryBroker()
+        self.queue_size = queue_size
+        self.published = 0
+        self.delivered = 0
+        # Unique per process, so ids from different publishers never collide
+        self._origin = uuid.uuid4().hex[:12]
+        self._ids = itertools.count(1)
+        self._history: Deque[Tuple[str, str, bytes]] = deque(maxlen=history)
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    async def start(self):
+        await self.broker.start(self._deliver)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    async def publish(self, event: dict):
+        """Send an event to every worker; failures are logged, never raised"""
+        event = {**event, "id": self._next_id()}
+        try:
+            await self.broker.publish(json.dumps(event, separators=(",", ":"), default=str).encode())
+            self.published += 1
+        except Exception as e:
+            logging.warning(f"Could not publish {event.get('type')} event: {e}")
+
+    def _next_id(self) -> str:
+        return f"{self._origin}-{next(self._ids)}"
+
+    def _deliver(self, message: bytes):
+        data = message.decode() if isinstance(message, bytes) else message
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logging.warning("Dropped a malformed event")
+            return
+        # Workers running an older version publish events without an id
+        event_id = str(event.get("id") or self._next_id())
+        frame = f"id: {event_id}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+        plan_id = event.get("plan_id")
+        self._history.append((event_id, plan_id, frame))
+        for subscription in tuple(self._subscribers.get(plan_id, ())):
+            subscription.offer(frame)
+            self.delivered += 1
+
+    def subscribe(self, plan_id: str, last_event_id: Optional[str] = None) -> Subscription:
+        """Register a subscriber, replaying what it missed since last_event_id"""
+        subscription = Subscription(self, plan_id, self.queue_size)
+        if last_event_id:
+            ids = [event_id for event_id, _, _ in self._history]
+            if last_event_id not in ids:
+                # Older than the history, or never seen here: the gap is unknown
+                subscription.offer(RESYNC_FRAME)
+            else:
+                for _, event_plan, frame in itertools.islice(self._history, ids.index(last_event_id) + 1, None):
+                    if event_plan == plan_id:
+                        subscription.offer(frame)
+        self._subscribers.setdefault(plan_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.plan_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.plan_id]
+
+    def stats(self) -> dict:
+        return {
+            "broker": type(self.broker).__name__,
+            "plans": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "history": len(self._history),
+        }
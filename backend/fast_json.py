@@ -0,0 +1,54 @@
+import datetime
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Encode what neither encoder handles natively, as jsonable_encoder would"""
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    if np is not None and isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        """Compact UTF-8 JSON bytes"""
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+else:
+    def dumps(value: Any) -> bytes:
+        """Compact UTF-8 JSON bytes"""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded with dumps.
+
+    Return it from a handler directly: FastAPI then skips jsonable_encoder,
+    which walks every value in Python before the stdlib encoder runs again.
+    Content must already be plain data; nothing is validated on the way out.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
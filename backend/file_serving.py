@@ -0,0 +1,230 @@
+import os
+import stat
+import uuid
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi.responses import Response
+
+# Bytes per pread, each sent as one body message
+SEND_CHUNK_SIZE = 256 * 1024
+
+# More ranges than this in one request are served as the whole file
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested byte ranges overlap the file"""
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a bytes Range header into sorted, merged (start, end) pairs.
+
+    Ends are inclusive. Returns None when the header should be ignored, which
+    RFC 9110 requires for unknown units and malformed values.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start_text, dash, end_text = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else max(start, size - 1)
+            else:
+                # Suffix range: the last N bytes
+                suffix = int(end_text)
+                if suffix == 0:
+                    continue
+                start = max(size - suffix, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start < 0 or end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(if_range: Optional[str], etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """Whether a Range request may be honoured given its If-Range validator"""
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return etag is not None and if_range == etag
+    if if_range.startswith("W/") or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(if_range) == parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def _open_regular_file(path: Path) -> Tuple[BinaryIO, int]:
+    file = open(path, "rb")
+    try:
+        file_stat = os.fstat(file.fileno())
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise RuntimeError(f"{path} is not a regular file")
+    except BaseException:
+        file.close()
+        raise
+    return file, file_stat.st_size
+
+
+async def open_regular_file(path: Path) -> Tuple[BinaryIO, int]:
+    """Open a file for RangeFileResponse off the event loop, returning it and its size.
+
+    Raises FileNotFoundError while the route can still answer 404; once
+    opened, the file stays readable even if it is unlinked meanwhile.
+    """
+    return await anyio.to_thread.run_sync(_open_regular_file, path)
+
+
+class RangeFileResponse(Response):
+    """Serve a file with byte range support.
+
+    Handles single and multiple ranges (206 with multipart/byteranges),
+    unsatisfiable ranges (416) and If-Range. The file is opened by the caller
+    with open_regular_file and closed once sent; it is read with pread in
+    SEND_CHUNK_SIZE chunks off the event loop.
+    """
+
+    def __init__(self, opened: Tuple[BinaryIO, int], request_headers, media_type: str,
+                 headers: Optional[dict] = None, filename: Optional[str] = None):
+        super().__init__(content=None, status_code=200, headers=headers, media_type=media_type)
+        self.file, self.size = opened
+        self.range_header = request_headers.get("range")
+        self.if_range = request_headers.get("if-range")
+        self.headers["accept-ranges"] = "bytes"
+        if filename is not None:
+            quoted = quote(filename)
+            if quoted != filename:
+                disposition = f"attachment; filename*=utf-8''{quoted}"
+            else:
+                disposition = f'attachment; filename="{filename}"'
+            self.headers.setdefault("content-disposition", disposition)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self._send_file(scope, send)
+        finally:
+            self.file.close()
+
+    async def _send_file(self, scope, send):
+        send_body = scope.get("method", "GET") != "HEAD"
+        size = self.size
+
+        ranges = None
+        if self.range_header and if_range_matches(
+            self.if_range, self.headers.get("etag"), self.headers.get("last-modified")
+        ):
+            try:
+                ranges = parse_range_header(self.range_header, size)
+            except RangeNotSatisfiable:
+                await self._send_unsatisfiable(send, size)
+                return
+
+        if not ranges:
+            parts = [(None, 0, size)]
+            self.status_code = 200
+            self.headers["content-length"] = str(size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            parts = [(None, start, end - start + 1)]
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            parts, length = self._multipart_parts(ranges, size)
+            self.status_code = 206
+            self.headers["content-length"] = str(length)
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        for index, (preamble, offset, count) in enumerate(parts):
+            last_part = index == len(parts) - 1
+            if preamble or (last_part and not count):
+                await send({
+                    "type": "http.response.body",
+                    "body": preamble or b"",
+                    "more_body": not (last_part and not count),
+                })
+            if count:
+                await self._send_chunks(send, self.file.fileno(), offset, count, more_after=not last_part)
+
+    def _multipart_parts(self, ranges: List[Tuple[int, int]], size: int):
+        """Split multiple ranges into (preamble, offset, count) parts and total length"""
+        boundary = uuid.uuid4().hex
+        content_type = self.media_type or "application/octet-stream"
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+
+        parts = []
+        length = 0
+        for start, end in ranges:
+            preamble = (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            count = end - start + 1
+            parts.append((preamble, start, count))
+            length += len(preamble) + count
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        parts.append((closing, 0, 0))
+        return parts, length + len(closing)
+
+    async def _send_chunks(self, send, fd: int, offset: int, count: int, more_after: bool):
+        remaining = count
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(SEND_CHUNK_SIZE, remaining), offset)
+            if not chunk:
+                raise RuntimeError(f"{self.file.name} shrank while being served")
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": remaining > 0 or more_after,
+            })
+
+    async def _send_unsatisfiable(self, send, size: int):
+        self.status_code = 416
+        headers = [
+            (b"content-range", f"bytes */{size}".encode("latin-1")),
+            (b"content-length", b"0"),
+        ]
+        await send({"type": "http.response.start", "status": 416, "headers": headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,151 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# TL per USD the plan's imported costs were priced at
+PLAN_FX_RATE = float(os.environ.get("PLAN_FX_RATE", "45"))
+
+# financial_data key -> key of the driver rows its financials are derived from
+DRIVER_KEYS = {"ertug": "production", "fiyuu_sales": "sales", "fiyuu_swap": "rental"}
+
+# Engine input columns, in matrix order. Every column but opex is per unit, so
+# the P&L scales with volume; opex is the fixed cash cost of the year.
+COLUMNS = ("volume", "price", "periods", "unit_cost", "discount", "opex", "unit_depreciation")
+
+# Output metrics, matching the FinancialYear fields
+METRICS = ("sales", "costs", "gross", "opex", "ebitda")
+
+# Drivers scenarios can vary, with their plan values. fx_rate is TL per USD;
+# the others multiply the plan drivers.
+SCENARIO_DRIVERS = {
+    "fx_rate": PLAN_FX_RATE,
+    "ckd_cost": 1.0,
+    "units": 1.0,
+    "monthly_rental": 1.0,
+    "battery_count": 1.0,
+}
+
+# (driver, stream, column) each scenario driver scales. Fiyuu buys and resells
+# what Ertug builds, so units move both; CKD parts are bought in USD.
+SCENARIO_TARGETS = [
+    ("ckd_cost", "ertug", "unit_cost"),
+    ("fx_rate", "ertug", "unit_cost"),
+    ("units", "ertug", "volume"),
+    ("units", "fiyuu_sales", "volume"),
+    ("monthly_rental", "fiyuu_swap", "price"),
+    ("battery_count", "fiyuu_swap", "volume"),
+]
+
+# Stored driver key per column; None means the column is 1 for that driver
+_COLUMN_KEYS = {
+    "production": ("units", "price", None, "cost"),
+    "sales": ("units", "sell_price", None, "buy_price"),
+    "rental": ("battery_count", "monthly_rental", "billed_months", "battery_cost"),
+}
+_DEFAULTS = {"discount": 0, "unit_depreciation": 0, "billed_months": 12}
+
+
+def _driver_values(row: dict, keys: Tuple[str, ...]) -> List[int]:
+    return [1 if key is None else row.get(key, _DEFAULTS[key]) if key in _DEFAULTS else row[key] for key in keys]
+
+
+def driver_matrix(financial_data: dict) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+    """Stack the driver rows of every stream into one (rows, COLUMNS) int64 matrix.
+
+    Returns the (stream, year) label of each row alongside. Streams without
+    drivers are left out. Raises ValueError for negative drivers or a discount
+    above the price.
+    """
+    labels = []
+    values = []
+    for stream, driver_key in DRIVER_KEYS.items():
+        rows = (financial_data.get(stream) or {}).get(driver_key)
+        if not rows:
+            continue
+        keys = _COLUMN_KEYS[driver_key] + COLUMNS[4:]
+        for row in rows:
+            labels.append((stream, row["year"]))
+            values.extend(_driver_values(row, keys))
+    matrix = np.array(values, dtype=np.int64).reshape(len(labels), len(COLUMNS))
+    for (stream, year), row in zip(labels, matrix):
+        if (row < 0).any():
+            raise ValueError(f"Negative driver values for {stream} {year}")
+        if row[COLUMNS.index("discount")] > row[COLUMNS.index("price")]:
+            raise ValueError(f"Discount above the price for {stream} {year}")
+    return labels, matrix
+
+
+def compute_pnl(matrix: np.ndarray) -> np.ndarray:
+    """Derive METRICS for every driver row at once.
+
+    Works on any leading shape, so a stack of scenario matrices computes in
+    the same call.
+    """
+    volume, price, periods, unit_cost, discount, opex, unit_depreciation = np.moveaxis(matrix, -1, 0)
+    # A scenario can push the price under the discount; nothing sells below zero
+    sales = volume * np.maximum(price - discount, 0) * periods
+    costs = volume * unit_cost
+    gross = sales - costs
+    # Reported opex includes depreciation, which EBITDA leaves out
+    ebitda = gross - opex
+    return np.stack((sales, costs, gross, opex + volume * unit_depreciation, ebitda), axis=-1)
+
+
+def apply_scenario(base: np.ndarray, streams: List[str], factors: Dict[str, np.ndarray]) -> np.ndarray:
+    """Scale a driver matrix by scenario factors.
+
+    factors maps SCENARIO_DRIVERS names to arrays that broadcast together, for
+    example one value per trial or one axis of a grid. Returns a float matrix
+    of shape (*factor shape, rows, COLUMNS) ready for compute_pnl.
+    """
+    unknown = set(factors) - set(SCENARIO_DRIVERS)
+    if unknown:
+        raise ValueError(f"Unknown drivers: {', '.join(sorted(unknown))}")
+    streams = np.asarray(streams)
+    shape = np.broadcast_shapes(*(np.shape(values) for values in factors.values()))
+    multipliers = np.ones(shape + base.shape)
+    for name, stream, column in SCENARIO_TARGETS:
+        if name in factors:
+            factor = np.asarray(factors[name], dtype=np.float64)
+            if name == "fx_rate":
+                factor = factor / PLAN_FX_RATE
+            multipliers[..., streams == stream, COLUMNS.index(column)] *= factor[..., None]
+    return base * multipliers
+
+
+def derive_financials(financial_data: dict) -> Dict[str, List[dict]]:
+    """FinancialYear rows computed from drivers, by stream"""
+    labels, matrix = driver_matrix(financial_data)
+    results: Dict[str, List[dict]] = {}
+    for (stream, year), values in zip(labels, compute_pnl(matrix).tolist()):
+        results.setdefault(stream, []).append({"year": year, **dict(zip(METRICS, values))})
+    return results
+
+
+def financials_drift(financial_data: dict, derived: Dict[str, List[dict]]) -> Dict[str, List[dict]]:
+    """Where stored financials differ from the derived ones, by stream"""
+    drift = {}
+    for stream, rows in derived.items():
+        stored = {row.get("year"): row for row in (financial_data.get(stream) or {}).get("financials", [])}
+        differences = []
+        for row in rows:
+            stored_row = stored.pop(row["year"], None)
+            if stored_row is None:
+                differences.append({"year": row["year"], "metric": None, "stored": None, "derived": row})
+                continue
+            for metric in METRICS:
+                if stored_row.get(metric) != row[metric]:
+                    differences.append({
+                        "year": row["year"], "metric": metric,
+                        "stored": stored_row.get(metric), "derived": row[metric],
+                    })
+        for year, stored_row in stored.items():
+            differences.append({"year": year, "metric": None, "stored": stored_row, "derived": None})
+        drift[stream] = differences
+    return drift
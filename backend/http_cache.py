@@ -0,0 +1,80 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def etag_for_bytes(body: bytes) -> str:
+    """Strong ETag derived from a SHA-256 of the body"""
+    return f'"{hashlib.sha256(body).hexdigest()}"'
+
+
+def etag_for_parts(*parts) -> str:
+    """Strong ETag derived from metadata that changes whenever the content does"""
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:40]}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Mongo hands back naive datetimes that are already UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def http_date(value: datetime) -> str:
+    """Format a datetime as an RFC 9110 HTTP-date"""
+    return format_datetime(_as_utc(value).replace(microsecond=0), usegmt=True)
+
+
+def parse_etags(header: str) -> List[str]:
+    """Split an If-None-Match header into opaque tags, dropping weak prefixes"""
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match and If-Modified-Since for a GET request.
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted when
+    the client did not send any entity tags.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = parse_etags(if_none_match)
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since is None or since.tzinfo is None:
+            return False
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None,
+                      cache_control: Optional[str] = None) -> dict:
+    """Headers that let clients revalidate a representation"""
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
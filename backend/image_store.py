@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Largest accepted image in bytes, and the size of each read from the upload
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Files accepted by one batch upload, and how many of them are stored at once
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "50"))
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+# Enough leading bytes to recognise every supported format
+SNIFF_SIZE = 32
+# Sizes of the BMP info headers Windows and OS/2 have defined
+BMP_DIB_HEADER_SIZES = (12, 40, 52, 56, 64, 108, 124)
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before it is stored"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredUpload:
+    """Facts about an upload gathered while it was streamed to disk"""
+    __slots__ = ("path", "size", "sha256", "mimetype", "extension")
+
+    def __init__(self, path: Path, size: int, sha256: str, mimetype: str, extension: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.mimetype = mimetype
+        self.extension = extension
+
+
+def _bmp_file_size(head: bytes) -> Optional[int]:
+    """The file size a BMP header declares, or None if the header is not a BMP one"""
+    if len(head) < 18 or not head.startswith(b"BM"):
+        return None
+    file_size = int.from_bytes(head[2:6], "little")
+    dib_size = int.from_bytes(head[14:18], "little")
+    if dib_size not in BMP_DIB_HEADER_SIZES or file_size < 14 + dib_size:
+        return None
+    return file_size
+
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Identify an image from its magic bytes, returning (mimetype, extension)"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", ".png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", ".jpg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif", ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif", ".avif"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1"):
+        return "image/heic", ".heic"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff", ".tiff"
+    if _bmp_file_size(head) is not None:
+        return "image/bmp", ".bmp"
+    return None
+
+
+async def stream_upload(file: UploadFile, dest: Path, max_size: int = MAX_UPLOAD_SIZE) -> StoredUpload:
+    """Copy an upload to dest in fixed-size chunks.
+
+    The content is hashed and measured on the fly, so memory use does not grow
+    with the file. The type is taken from the leading bytes, never from the
+    client's content type. A partially written dest is removed on any failure.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    sniffed = None
+    head = b""
+    try:
+        async with aiofiles.open(dest, 'wb') as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if sniffed is None:
+                    head += chunk[:SNIFF_SIZE]
+                    if len(head) >= SNIFF_SIZE:
+                        sniffed = sniff_image_type(head)
+                        if sniffed is None:
+                            raise UploadRejected(400, "File must be an image")
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(413, f"Image exceeds maximum size of {max_size} bytes")
+                hasher.update(chunk)
+                await out.write(chunk)
+
+        if sniffed is None:
+            # Files shorter than SNIFF_SIZE never reached the check above
+            sniffed = sniff_image_type(head)
+            if sniffed is None:
+                raise UploadRejected(400, "File must be an image")
+        if sniffed[0] == "image/bmp" and _bmp_file_size(head) != size:
+            # Text that happens to start with "BM" rarely declares its own length
+            raise UploadRejected(400, "File must be an image")
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+
+    mimetype, extension = sniffed
+    return StoredUpload(dest, size, hasher.hexdigest(), mimetype, extension)
+
+
+class BlobStore:
+    """Content-addressed storage for image bytes.
+
+    Blobs live at ``blobs/<aa>/<bb>/<sha256><ext>`` under the upload root, so
+    identical uploads share one file. Reference counts are kept in Mongo by
+    DatabaseManager; this class only moves files.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.blob_dir = root / "blobs"
+        self.tmp_dir = root / "tmp"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, sha256: str, extension: str) -> Path:
+        return self.blob_dir / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+
+    def temp_path(self) -> Path:
+        return self.tmp_dir / f"{uuid.uuid4()}.part"
+
+    def commit(self, upload: StoredUpload) -> Path:
+        """Move a streamed upload into its blob path, or drop it if already stored.
+
+        Call only after the blob reference has been acquired, so a concurrent
+        remove() either sees the new reference or has already moved the old
+        file out of the way.
+        """
+        path = self.blob_path(upload.sha256, upload.extension)
+        if path.exists():
+            upload.path.unlink(missing_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(upload.path, path)
+        upload.path = path
+        return path
+
+    async def remove(self, path: Path, confirm: Callable[[], Awaitable[bool]]) -> bool:
+        """Delete a blob whose reference count dropped to zero.
+
+        The file is first renamed aside, then confirm() deletes the reference
+        record only if it is still unreferenced. If another upload grabbed a
+        reference in between, the file is put back.
+        """
+        graveyard = self.tmp_dir / f"{path.name}.{uuid.uuid4()}.gone"
+        try:
+            os.replace(path, graveyard)
+        except FileNotFoundError:
+            await confirm()
+            return False
+
+        if await confirm():
+            graveyard.unlink(missing_ok=True)
+            return True
+
+        if path.exists():
+            graveyard.unlink(missing_ok=True)
+        else:
+            os.replace(graveyard, path)
+        return False
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads from their Content-Length before the body is read.
+
+    Multipart parsing happens before the endpoint runs, so without this check
+    an oversized upload would be received in full before being refused.
+    Requests without a Content-Length are still bounded by stream_upload.
+    Batch uploads may carry up to max_files files of max_size each.
+    """
+
+    def __init__(self, app, path_pattern: str = r"^/api(/plans/[^/]+)?/images", max_size: int = MAX_UPLOAD_SIZE,
+                 max_files: int = MAX_BATCH_FILES):
+        self.app = app
+        # Uploads go to /api/images or to a plan's /api/plans/{plan_id}/images
+        self.path_pattern = re.compile(path_pattern)
+        # Allow room for multipart boundaries and the other form fields
+        self.max_body = max_size + UPLOAD_CHUNK_SIZE
+        self.max_batch_body = max_files * (max_size + UPLOAD_CHUNK_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and self.path_pattern.match(scope["path"])
+        ):
+            max_body = self.max_batch_body if scope["path"].endswith("/upload-batch") else self.max_body
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > max_body:
+                        await send({
+                            "type": "http.response.start",
+                            "status": 413,
+                            "headers": [(b"content-type", b"application/json")],
+                        })
+                        await send({
+                            "type": "http.response.body",
+                            "body": b'{"detail":"Upload too large"}',
+                        })
+                        return
+                    break
+        await self.app(scope, receive, send)
@@ -0,0 +1,200 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Pillow is optional; originals are served without it. Importing it is slow and
+# most requests never need it, so it is imported on first use
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Requested widths are rounded up to this ladder so the disk cache stays small
+VARIANT_WIDTHS = (160, 320, 640, 960, 1280, 1920)
+
+# fmt query value -> (Pillow format, mimetype, extension)
+VARIANT_FORMATS = {
+    "avif": ("AVIF", "image/avif", ".avif"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "png": ("PNG", "image/png", ".png"),
+}
+
+# Formats a source is re-encoded as when only a width is requested
+SOURCE_FORMATS = {"image/jpeg": "jpeg", "image/png": "png", "image/webp": "webp", "image/avif": "avif"}
+
+VARIANT_WORKERS = int(os.environ.get("IMAGE_VARIANT_WORKERS", str(min(2, os.cpu_count() or 1))))
+VARIANT_QUALITY = int(os.environ.get("IMAGE_VARIANT_QUALITY", "80"))
+# Widths rendered right after upload, so first views are served from disk
+VARIANT_PREWARM_WIDTHS = tuple(
+    int(width) for width in os.environ.get("IMAGE_VARIANT_PREWARM_WIDTHS", "320,640").split(",") if width.strip()
+)
+# Variants of sources Pillow cannot decode, remembered so they are not rendered on every request
+VARIANT_FAILED_MAX = int(os.environ.get("IMAGE_VARIANT_FAILED_MAX", "1024"))
+
+
+def snap_width(width: int) -> int:
+    """Round a requested width up to the nearest supported variant width"""
+    for candidate in VARIANT_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return VARIANT_WIDTHS[-1]
+
+
+def _pillow():
+    """Pillow's Image and ImageOps modules"""
+    from PIL import Image, ImageOps
+    return Image, ImageOps
+
+
+def _undecodable(error: Exception) -> bool:
+    """Whether rendering failed on the source bytes themselves, so a retry would fail too"""
+    Image, _ = _pillow()
+    from PIL import UnidentifiedImageError
+    return isinstance(error, (UnidentifiedImageError, Image.DecompressionBombError))
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def image_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    """Width and height read from the image header, or None if Pillow cannot tell"""
+    if not PILLOW_AVAILABLE:
+        return None
+    Image, _ = _pillow()
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except FileNotFoundError:
+        raise
+    except (OSError, Image.DecompressionBombError):
+        # Unrecognised or truncated; retrying would not change the bytes
+        return None
+
+
+def _render_variant(source: str, dest: str, width: int, pillow_format: str, quality: int):
+    """Resize and re-encode one image; runs inside a worker process"""
+    Image, ImageOps = _pillow()
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if pillow_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        # Write under a temporary name so readers never see a partial variant
+        partial = f"{dest}.{os.getpid()}.part"
+        image.save(partial, format=pillow_format, quality=quality, optimize=True)
+    os.replace(partial, dest)
+
+
+class VariantService:
+    """Generates resized and re-encoded image variants on first request.
+
+    Variants are cached on disk under ``variants/<aa>/`` keyed by the source
+    content hash, so every image_id sharing a blob shares its variants too.
+    Encoding runs in a bounded process pool to keep the event loop free.
+    """
+
+    def __init__(self, root: Path, max_workers: int = VARIANT_WORKERS):
+        self.variant_dir = root / "variants"
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[Path, asyncio.Future] = {}
+        # (variant path, source mtime) -> None, oldest first
+        self._failed: "OrderedDict[Tuple[Path, Optional[int]], None]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return PILLOW_AVAILABLE
+
+    def supported_formats(self) -> set:
+        if not PILLOW_AVAILABLE:
+            return set()
+        Image, _ = _pillow()
+        Image.init()
+        return {name for name, (pillow_format, _, _) in VARIANT_FORMATS.items() if pillow_format in Image.SAVE}
+
+    def negotiate_format(self, requested: Optional[str], accept: str, source_mimetype: str) -> str:
+        """Pick the output format for a fmt query value.
+
+        ``auto`` chooses the best modern format the client accepts, and no value
+        keeps the source format. Raises ValueError for unsupported formats.
+        """
+        supported = self.supported_formats()
+        if requested == "auto":
+            for name in ("avif", "webp"):
+                if name in supported and VARIANT_FORMATS[name][1] in accept:
+                    return name
+            requested = None
+        if requested is None:
+            return SOURCE_FORMATS.get(source_mimetype, "png")
+        if requested not in supported:
+            raise ValueError(f"Unsupported image format: {requested}")
+        return requested
+
+    def variant_path(self, key: str, width: int, fmt: str) -> Path:
+        return self.variant_dir / key[:2] / f"{key}_w{width}{VARIANT_FORMATS[fmt][2]}"
+
+    async def get_variant(self, source: Path, key: str, width: int, fmt: str) -> Tuple[Path, str]:
+        """Return the path and mimetype of a variant, rendering it if missing"""
+        path = self.variant_path(key, width, fmt)
+        mimetype = VARIANT_FORMATS[fmt][1]
+        if path.exists():
+            return path, mimetype
+        failed_key = (path, _mtime(source))
+        if failed_key in self._failed:
+            raise ValueError(f"Variant could not be rendered: {path.name}")
+
+        pending = self._pending.get(path)
+        if pending is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(
+                self._get_executor(), _render_variant,
+                str(source), str(path), width, VARIANT_FORMATS[fmt][0], VARIANT_QUALITY
+            )
+            self._pending[path] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(path, None))
+        try:
+            await asyncio.shield(pending)
+        except Exception as e:
+            # Undecodable sources are not retried on every request; anything
+            # else, such as a worker crash or a file still being written, may
+            # succeed next time. A rewritten source gets a new mtime and a retry.
+            if _undecodable(e):
+                self._failed[failed_key] = None
+                while len(self._failed) > VARIANT_FAILED_MAX:
+                    self._failed.popitem(last=False)
+            raise
+        return path, mimetype
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking would copy the event loop and the Mongo client's threads
+            # and locks into the workers, which can deadlock them
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info("Image variant workers stopped")
@@ -0,0 +1,176 @@
+"""Index declarations for the backend collections and a query plan audit.
+
+Run ``python indexes.py ensure`` to create the indexes, ``python indexes.py audit``
+to list missing, undeclared and unused ones, and ``python indexes.py explain``
+to check that every DatabaseManager query is served by an index, in the order
+it is sorted by. ``explain`` exits non-zero when a query falls back to a
+collection scan or sorts in memory.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import Dict, List
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import QUERY_CATALOG, close_client, get_database
+from jobs import JOB_RETENTION
+
+# Indexes every deployment needs, by collection
+REQUIRED_INDEXES: Dict[str, List[IndexModel]] = {
+    "business_plans": [
+        IndexModel([("active", ASCENDING)], name="active_1"),
+        # Inactive plans are kept as history under the same id, so uniqueness
+        # only holds among active plans
+        IndexModel(
+            [("id", ASCENDING)],
+            name="id_active_unique",
+            unique=True,
+            partialFilterExpression={"active": True},
+        ),
+    ],
+    "plan_versions": [
+        # Serves version reads, snapshot lookups and the newest-first listing
+        IndexModel([("plan_id", ASCENDING), ("version", ASCENDING)], name="plan_id_1_version_1", unique=True),
+    ],
+    "images": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Images are namespaced by plan, so every listing filters on plan_id
+        # first; each filter combination ends in the (uploaded_at, id) page key
+        IndexModel(
+            [("plan_id", ASCENDING), ("type", ASCENDING), ("item_id", ASCENDING),
+             ("uploaded_at", ASCENDING), ("id", ASCENDING)],
+            name="plan_id_1_type_1_item_id_1_uploaded_at_1_id_1",
+        ),
+        IndexModel(
+            [("plan_id", ASCENDING), ("type", ASCENDING), ("uploaded_at", ASCENDING), ("id", ASCENDING)],
+            name="plan_id_1_type_1_uploaded_at_1_id_1",
+        ),
+        IndexModel(
+            [("plan_id", ASCENDING), ("uploaded_at", ASCENDING), ("id", ASCENDING)],
+            name="plan_id_1_uploaded_at_1_id_1",
+        ),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Serves the claim: due queued jobs and expired leases, oldest first
+        IndexModel([("status", ASCENDING), ("type", ASCENDING), ("run_at", ASCENDING)],
+                   name="status_1_type_1_run_at_1"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_1_lease_until_1"),
+        # Finished jobs are kept for JOB_RETENTION seconds, then expire
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=JOB_RETENTION),
+    ],
+}
+
+async def _ensure_collection_indexes(db, collection: str, models: List[IndexModel]) -> List[str]:
+    created = []
+    for model in models:
+        try:
+            created.extend(await db[collection].create_indexes([model]))
+        except OperationFailure as e:
+            # Usually an index on the same keys under another name or options
+            logging.warning(f"Could not create index {model.document['name']} on {collection}: {e}")
+    return created
+
+
+async def ensure_indexes(db) -> List[str]:
+    """Create every required index, returning the names that now exist"""
+    # Collections are independent, so their round trips overlap
+    results = await asyncio.gather(*(
+        _ensure_collection_indexes(db, collection, models) for collection, models in REQUIRED_INDEXES.items()
+    ))
+    return [name for names in results for name in names]
+
+
+async def audit_indexes(db) -> dict:
+    """Compare existing indexes with the declared ones and report usage"""
+    report = {}
+    for collection, models in REQUIRED_INDEXES.items():
+        declared = {model.document["name"] for model in models}
+        existing = set()
+        async for index in db[collection].list_indexes():
+            existing.add(index["name"])
+
+        usage = {}
+        try:
+            async for stats in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stats["name"]] = stats["accesses"]["ops"]
+        except OperationFailure as e:
+            logging.info(f"Index usage unavailable for {collection}: {e}")
+
+        report[collection] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared - {"_id_"}),
+            "unused": sorted(name for name, ops in usage.items() if ops == 0 and name != "_id_"),
+            "usage": usage,
+        }
+    return report
+
+
+def _winning_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of a winning plan, outermost first, across every branch"""
+    stages = []
+    pending = [plan]
+    while pending:
+        plan = pending.pop(0)
+        stages.append(plan.get("stage", "?"))
+        if plan.get("inputStage"):
+            pending.append(plan["inputStage"])
+        pending.extend(plan.get("inputStages") or [])
+    return stages
+
+
+async def explain_queries(db) -> List[dict]:
+    """Explain each catalogued query with its sort and flag collection scans and in-memory sorts"""
+    results = []
+    for name, collection, query, sort in QUERY_CATALOG:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.limit(1).explain()
+        stages = _winning_stages(explanation["queryPlanner"]["winningPlan"])
+        results.append({
+            "query": name,
+            "collection": collection,
+            "filter": query,
+            "sort": sort,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+            # A SORT stage means the index serves the filter but not the order
+            "in_memory_sort": "SORT" in stages,
+        })
+    return results
+
+
+async def _main(command: str) -> int:
+    db = get_database()
+    try:
+        return await _run(db, command)
+    finally:
+        close_client()
+
+
+async def _run(db, command: str) -> int:
+    if command == "ensure":
+        print(json.dumps(await ensure_indexes(db), indent=2))
+        return 0
+    if command == "audit":
+        report = await audit_indexes(db)
+        print(json.dumps(report, indent=2))
+        return 1 if any(entry["missing"] for entry in report.values()) else 0
+
+    results = await explain_queries(db)
+    for result in results:
+        status = "COLLSCAN" if result["collection_scan"] else "SORT" if result["in_memory_sort"] else "ok"
+        print(f"{status:8} {result['query']:32} {' <- '.join(result['stages'])}")
+    return 1 if any(result["collection_scan"] or result["in_memory_sort"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage and audit MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "audit", "explain"])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.command)))
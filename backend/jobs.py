@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Jobs run at once in this process; keep it low, request handling comes first
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+# Seconds before the first retry, doubling on every further attempt up to JOB_RETRY_MAX
+JOB_RETRY_BASE = float(os.environ.get("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.environ.get("JOB_RETRY_MAX", "300"))
+# A running job not finished within this many seconds is taken over by another worker
+JOB_LEASE = float(os.environ.get("JOB_LEASE", "300"))
+# Idle workers look for due retries and jobs queued by other processes this often
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "5"))
+# Pause after each job, so a burst of uploads never saturates the event loop
+JOB_PACE = float(os.environ.get("JOB_PACE", "0.05"))
+# Seconds finished jobs stay visible through the status endpoint
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", str(7 * 24 * 3600)))
+
+JobHandler = Callable[[dict], Awaitable[Optional[dict]]]
+
+
+def backoff(attempt: int, base: float = JOB_RETRY_BASE, cap: float = JOB_RETRY_MAX) -> float:
+    """Seconds to wait before retrying after the given failed attempt, with jitter"""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobQueue:
+    """Runs background jobs recorded in the jobs collection.
+
+    Every job is a Mongo document first, so it survives restarts and its
+    status can be read from any worker process. Workers claim due jobs one
+    at a time with a lease; failures are retried with exponential backoff
+    until max_attempts, then the job is marked failed with its last error.
+    """
+
+    def __init__(self, db_manager, workers: int = JOB_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 lease: float = JOB_LEASE, poll_interval: float = JOB_POLL_INTERVAL, pace: float = JOB_PACE):
+        self.db = db_manager
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.pace = pace
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.running = 0
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    def register(self, job_type: str, handler: JobHandler):
+        """Run handler(payload) for jobs of job_type; its return value is stored as the result"""
+        self._handlers[job_type] = handler
+
+    def _record(self, job_type: str, payload: dict, max_attempts: Optional[int]) -> dict:
+        now = datetime.utcnow()
+        return {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "run_at": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    async def enqueue(self, job_type: str, payload: dict, max_attempts: Optional[int] = None) -> str:
+        """Record a job and wake a worker, returning the job id"""
+        return (await self.enqueue_many([(job_type, payload)], max_attempts))[0]
+
+    async def enqueue_many(self, jobs: List[Tuple[str, dict]], max_attempts: Optional[int] = None) -> List[str]:
+        """Record several jobs with one insert"""
+        records = [self._record(job_type, payload, max_attempts) for job_type, payload in jobs]
+        await self.db.create_jobs(records)
+        if self._wake is not None:
+            self._wake.set()
+        return [record["id"] for record in records]
+
+    def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"{self.worker_id}/{index}")) for index in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, worker: str):
+        while True:
+            self._wake.clear()
+            try:
+                lease_until = datetime.utcnow() + timedelta(seconds=self.lease)
+                job = await self.db.claim_job(list(self._handlers), worker, lease_until)
+            except Exception as e:
+                logging.warning(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job, worker)
+            await asyncio.sleep(self.pace)
+
+    async def _execute(self, job: dict, worker: str):
+        started = time.monotonic()
+        self.running += 1
+        try:
+            result = await self._handlers[job["type"]](job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of waiting out its lease
+            await self._finish(job, worker, {"status": "queued", "run_at": datetime.utcnow(),
+                                             "attempts": job["attempts"] - 1})
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] < job["max_attempts"]:
+                delay = backoff(job["attempts"])
+                logging.warning(f"Job {job['id']} ({job['type']}) failed, retrying in {delay:.1f}s: {error}")
+                self.retried += 1
+                await self._finish(job, worker, {
+                    "status": "queued", "error": error,
+                    "run_at": datetime.utcnow() + timedelta(seconds=delay)
+                })
+            else:
+                logging.error(f"Job {job['id']} ({job['type']}) failed after {job['attempts']} attempts: {error}")
+                self.failed += 1
+                await self._finish(job, worker, {
+                    "status": "failed", "error": error, "finished_at": datetime.utcnow()
+                })
+            return
+        finally:
+            self.running -= 1
+
+        self.succeeded += 1
+        await self._finish(job, worker, {
+            "status": "succeeded", "result": result or {}, "error": None,
+            "finished_at": datetime.utcnow(), "duration": round(time.monotonic() - started, 3)
+        })
+
+    async def _finish(self, job: dict, worker: str, update: dict):
+        try:
+            if not await self.db.finish_job(job["id"], worker, update):
+                logging.warning(f"Job {job['id']} was taken over before it finished")
+        except Exception as e:
+            # The lease runs out and another worker picks the job up again
+            logging.warning(f"Could not record the outcome of job {job['id']}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.worker_id,
+            "workers": len(self._tasks),
+            "types": sorted(self._handlers),
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
@@ -1,8 +1,10 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, ClassVar, List, Dict, Any, Optional
 from datetime import datetime
 import uuid
 
+from currency import parse_money
+
 # Business Plan Models
 class Actor(BaseModel):
     name: str
@@ -49,7 +51,17 @@ class Battery(BaseModel):
 
 class Investment(BaseModel):
     item: str
-    amount: str
+    amount: float
+    currency: str = "USD"
+
+    @model_validator(mode="before")
+    @classmethod
+    def parse_legacy_amount(cls, data: Any) -> Any:
+        # Plans stored before amounts were numeric hold text like "100.000 USD"
+        if isinstance(data, dict) and isinstance(data.get("amount"), str):
+            amount, currency = parse_money(data["amount"], data.get("currency", "USD"))
+            data = {**data, "amount": amount, "currency": currency}
+        return data
 
 class FinancialYear(BaseModel):
     year: str
@@ -62,6 +74,53 @@ class FinancialYear(BaseModel):
 class CompanyFinancials(BaseModel):
     financials: List[FinancialYear]
 
+# P&L drivers; financials rows are derived from these when present.
+# Everything but opex is per unit, so the totals scale with volume. opex is
+# the cash cost of the year; reported opex adds depreciation, EBITDA does not.
+class PnlDriver(BaseModel):
+    # Name of the per-unit price field the discount comes off
+    priceField: ClassVar[str]
+
+    year: str
+    discount: int = Field(default=0, ge=0)  # per unit per period
+    opex: int = Field(ge=0)
+    unitDepreciation: int = Field(default=0, alias="unit_depreciation", ge=0)  # per unit per year
+
+    @model_validator(mode="after")
+    def discount_within_price(self):
+        if self.discount > getattr(self, self.priceField):
+            raise ValueError("discount cannot exceed the price, sales would be negative")
+        return self
+
+class ProductionDriver(PnlDriver):
+    priceField: ClassVar[str] = "price"
+
+    units: int = Field(ge=0)
+    cost: int = Field(ge=0)
+    price: int = Field(ge=0)
+
+class SalesDriver(PnlDriver):
+    priceField: ClassVar[str] = "sellPrice"
+
+    units: int = Field(ge=0)
+    buyPrice: int = Field(alias="buy_price", ge=0)
+    sellPrice: int = Field(alias="sell_price", ge=0)
+
+class RentalDriver(PnlDriver):
+    priceField: ClassVar[str] = "monthlyRental"
+
+    batteryCount: int = Field(alias="battery_count", ge=0)
+    cabinetCount: int = Field(alias="cabinet_count", ge=0)
+    monthlyRental: int = Field(alias="monthly_rental", ge=0)
+    billedMonths: int = Field(default=12, alias="billed_months", ge=0)
+    batteryCost: int = Field(alias="battery_cost", ge=0)  # per battery per year
+
+class FiyuuSalesFinancials(CompanyFinancials):
+    sales: Optional[List[SalesDriver]] = None
+
+class FiyuuSwapFinancials(CompanyFinancials):
+    rental: Optional[List[RentalDriver]] = None
+
 class AtabridgeFinancials(BaseModel):
     investment: str
     revenue: str
@@ -70,12 +129,13 @@ class AtabridgeFinancials(BaseModel):
 class ErtugFinancials(BaseModel):
     investments: List[Investment]
     financials: List[FinancialYear]
+    production: Optional[List[ProductionDriver]] = None
 
 class FinancialData(BaseModel):
     atabridge: AtabridgeFinancials
     ertug: ErtugFinancials
-    fiyuuSales: CompanyFinancials = Field(alias="fiyuu_sales")
-    fiyuuSwap: CompanyFinancials = Field(alias="fiyuu_swap")
+    fiyuuSales: FiyuuSalesFinancials = Field(alias="fiyuu_sales")
+    fiyuuSwap: FiyuuSwapFinancials = Field(alias="fiyuu_swap")
 
 class Products(BaseModel):
     equipment: List[Equipment]
@@ -116,20 +176,97 @@ class ImageUpload(BaseModel):
     originalName: str = Field(alias="original_name")
     mimetype: str
     size: int
+    sha256: Optional[str] = None
     path: str
     uploadedAt: datetime = Field(default_factory=datetime.utcnow, alias="uploaded_at")
+    # Filled in by the post-upload processing job
+    width: Optional[int] = None
+    height: Optional[int] = None
+    processedAt: Optional[datetime] = Field(default=None, alias="processed_at")
 
 class ImageUploadResponse(BaseModel):
     success: bool
     imageUrl: str = Field(alias="image_url")
     imageId: str = Field(alias="image_id")
+    jobId: Optional[str] = Field(default=None, alias="job_id")  # post-upload processing, see /api/jobs
+
+class ImageUploadResult(BaseModel):
+    filename: Optional[str] = None
+    success: bool
+    imageUrl: Optional[str] = Field(default=None, alias="image_url")
+    imageId: Optional[str] = Field(default=None, alias="image_id")
+    jobId: Optional[str] = Field(default=None, alias="job_id")
+    error: Optional[str] = None
+
+class BatchImageUploadResponse(BaseModel):
+    success: bool  # false when any file failed
+    uploaded: int
+    failed: int
+    results: List[ImageUploadResult]  # in the order the files were sent
 
 # Request/Response Models
 class BusinessPlanResponse(BaseModel):
     success: bool
     data: BusinessPlanData
+    version: Optional[int] = None  # matches the version in change feed events
 
 class ErrorResponse(BaseModel):
     success: bool = False
     error: str
-    detail: Optional[str] = None
\ No newline at end of file
+    detail: Optional[str] = None
+
+# Simulation Models
+class Distribution(BaseModel):
+    kind: str = "fixed"  # "fixed", "normal", "lognormal", "uniform", "triangular"
+    value: Optional[float] = None  # fixed
+    mean: Optional[float] = None  # normal, lognormal (of the value, not its log)
+    sd: Optional[float] = None
+    low: Optional[float] = None  # uniform, triangular
+    mode: Optional[float] = None  # triangular
+    high: Optional[float] = None
+
+class SimulationRequest(BaseModel):
+    trials: int = 100_000
+    seed: Optional[int] = None
+    percentiles: List[float] = [5, 25, 50, 75, 95]
+    # fx_rate is TL per USD; the others are multipliers of the plan drivers
+    drivers: Dict[str, Distribution] = {}
+
+# Customs Models
+class DutyRates(BaseModel):
+    customsDuty: float = Field(default=0.0, alias="customs_duty")
+    additionalDuty: float = Field(default=0.0, alias="additional_duty")
+    excise: float = 0.0
+
+class CustomsLine(BaseModel):
+    sku: Optional[str] = None
+    hsCode: str = Field(alias="hs_code")
+    fobUsd: float = Field(alias="fob_usd", ge=0)  # per unit
+    freightUsd: float = Field(default=0.0, alias="freight_usd", ge=0)  # per unit
+    insuranceUsd: float = Field(default=0.0, alias="insurance_usd", ge=0)  # per unit
+    qty: int = Field(default=1, gt=0)
+    bandrol: float = Field(default=0.0, ge=0)  # TL per unit
+
+class LandedCostRequest(BaseModel):
+    lines: List[CustomsLine]
+    fxRate: Optional[float] = Field(default=None, alias="fx_rate", gt=0)  # TL per USD, plan rate if omitted
+    kkdfRate: float = Field(default=0.0, alias="kkdf_rate", ge=0)
+    allocation: str = "value"  # spread shipment fees by "value" or "quantity"
+    rates: Dict[str, DutyRates] = {}  # overrides of the built-in HS code table
+    fees: Dict[str, Annotated[float, Field(ge=0)]] = {}  # overrides of the per-shipment fees
+
+class SensitivityAxis(BaseModel):
+    driver: str  # fx_rate in TL per USD; other drivers as multipliers of the plan
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = 51
+    values: Optional[List[float]] = None  # instead of start/stop/steps
+
+class SensitivityRequest(BaseModel):
+    axes: List[SensitivityAxis]
+    streams: Optional[List[str]] = None  # e.g. ["fiyuu_swap"]; default every affected stream
+
+# Multi-plan Models
+class PlanCreateRequest(BaseModel):
+    id: Optional[str] = None  # generated when omitted
+    content: Optional[BusinessPlanData] = None  # defaults to a copy of the seed plan
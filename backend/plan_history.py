@@ -0,0 +1,106 @@
+import copy
+import os
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Every Nth version is stored in full, so reading any version replays at most
+# N - 1 deltas on top of a snapshot
+SNAPSHOT_INTERVAL = max(1, int(os.environ.get("PLAN_SNAPSHOT_INTERVAL", "20")))
+
+
+def _pointer(path: Tuple[str, ...]) -> str:
+    return "".join("/" + str(segment).replace("~", "~0").replace("/", "~1") for segment in path)
+
+
+def _segments(pointer: str) -> List[str]:
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")] if pointer else []
+
+
+def diff(old: Any, new: Any, path: Tuple[str, ...] = ()) -> List[dict]:
+    """RFC 6902 operations that turn old into new.
+
+    Dicts are compared key by key and lists item by item, so an edit costs
+    operations in proportion to what changed, not to the size of the plan.
+    """
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": _pointer(path), "value": new}]
+    if isinstance(old, dict):
+        ops = []
+        for key, value in old.items():
+            if key not in new:
+                ops.append({"op": "remove", "path": _pointer(path + (key,))})
+            else:
+                ops.extend(diff(value, new[key], path + (key,)))
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": _pointer(path + (key,)), "value": value})
+        return ops
+    if isinstance(old, list):
+        ops = []
+        for index, (before, after) in enumerate(zip(old, new)):
+            ops.extend(diff(before, after, path + (str(index),)))
+        # Remove from the end so earlier indexes stay valid
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            ops.append({"op": "remove", "path": _pointer(path + (str(index),))})
+        for index in range(len(old), len(new)):
+            ops.append({"op": "add", "path": _pointer(path + (str(index),)), "value": new[index]})
+        return ops
+    return [] if old == new else [{"op": "replace", "path": _pointer(path), "value": new}]
+
+
+def apply_delta(document: Any, ops: List[dict]) -> Any:
+    """Apply diff() output to document in place, returning the result"""
+    for op in ops:
+        segments = _segments(op["path"])
+        if not segments:
+            document = copy.deepcopy(op["value"])
+            continue
+        parent = document
+        for segment in segments[:-1]:
+            parent = parent[int(segment)] if isinstance(parent, list) else parent[segment]
+        last = segments[-1]
+        if isinstance(parent, list):
+            index = int(last)
+            if op["op"] == "add":
+                parent.insert(index, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op["value"])
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op["value"])
+    return document
+
+
+def is_snapshot_version(version: int) -> bool:
+    return version % SNAPSHOT_INTERVAL == 0
+
+
+def reconstruct(records: List[dict], version: int) -> dict:
+    """Content at version from a snapshot record followed by its deltas.
+
+    records must be sorted by version and start with a snapshot; raises
+    LookupError when the chain does not reach version without a gap.
+    """
+    if not records or records[0].get("kind") != "snapshot":
+        raise LookupError(f"No snapshot for version {version}")
+    content = copy.deepcopy(records[0]["content"])
+    expected = records[0]["version"]
+    for record in records[1:]:
+        expected += 1
+        if record["version"] != expected:
+            raise LookupError(f"History is missing version {expected}")
+        if record["kind"] == "snapshot":
+            content = copy.deepcopy(record["content"])
+        else:
+            content = apply_delta(content, record["ops"])
+    if expected != version:
+        raise LookupError(f"History is missing version {version}")
+    return content
@@ -0,0 +1,385 @@
+import copy
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, get_args, get_origin
+
+from pydantic import TypeAdapter, ValidationError
+
+from financials import DRIVER_KEYS, derive_financials
+from plan_sections import UnknownSection, extract, resolve_annotation, unwrap_optional
+
+# Largest number of operations accepted in one PATCH
+MAX_PATCH_OPS = 200
+
+JSON_PATCH_OPS = {"add", "remove", "replace", "move", "copy", "test"}
+
+
+class PatchError(Exception):
+    """Raised when a patch cannot be applied; carries the HTTP status to return"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(str(detail))
+        self.status_code = status_code
+        self.detail = detail
+
+
+def parse_pointer(pointer: str) -> Tuple[str, ...]:
+    """Split an RFC 6901 JSON pointer into unescaped segments"""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise PatchError(400, f"Invalid JSON pointer: {pointer!r}")
+    if pointer == "":
+        raise PatchError(422, "Patching the whole plan is not supported")
+    segments = tuple(part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/"))
+    for segment in segments:
+        if not segment or segment.startswith("$") or "." in segment:
+            raise PatchError(400, f"Invalid path segment {segment!r} in {pointer}")
+    return segments
+
+
+def _is_list(annotation) -> bool:
+    return get_origin(unwrap_optional(annotation)) in (list, List)
+
+
+def _item_annotation(annotation) -> Any:
+    return get_args(unwrap_optional(annotation))[0]
+
+
+def _resolve(path: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Any]:
+    """Resolve a patch path to stored keys, allowing a trailing "-" list append"""
+    try:
+        if path[-1] == "-":
+            stored, annotation = resolve_annotation(path[:-1])
+            if not _is_list(annotation):
+                raise UnknownSection("/".join(path))
+            return stored + ("-",), _item_annotation(annotation)
+        return resolve_annotation(path)
+    except UnknownSection:
+        raise PatchError(422, f"Unknown business plan path: /{'/'.join(path)}")
+
+
+class PatchOp:
+    """One normalized JSON Patch operation on stored plan content"""
+    __slots__ = ("op", "path", "value", "source")
+
+    def __init__(self, op: str, path: Tuple[str, ...], value: Any = None,
+                 source: Optional[Tuple[str, ...]] = None):
+        self.op = op
+        self.path = path
+        self.value = value
+        self.source = source
+
+
+def parse_json_patch(body: Any) -> List[PatchOp]:
+    """Validate an RFC 6902 document and map its paths onto stored keys"""
+    if not isinstance(body, list) or not body:
+        raise PatchError(400, "JSON Patch must be a non-empty array of operations")
+    if len(body) > MAX_PATCH_OPS:
+        raise PatchError(413, f"At most {MAX_PATCH_OPS} operations per patch")
+
+    ops = []
+    for raw in body:
+        if not isinstance(raw, dict) or raw.get("op") not in JSON_PATCH_OPS or "path" not in raw:
+            raise PatchError(400, f"Invalid patch operation: {raw!r}")
+        if raw["op"] in ("add", "replace", "test") and "value" not in raw:
+            raise PatchError(400, f"Operation {raw['op']} requires a value")
+        path, _ = _resolve(parse_pointer(raw["path"]))
+        source = None
+        if raw["op"] in ("move", "copy"):
+            if "from" not in raw:
+                raise PatchError(400, f"Operation {raw['op']} requires from")
+            source, _ = _resolve(parse_pointer(raw["from"]))
+        ops.append(PatchOp(raw["op"], path, raw.get("value"), source))
+    return ops
+
+
+def merge_patch_paths(patch: Any, prefix: Tuple[str, ...] = ()) -> List[Tuple[str, ...]]:
+    """Stored paths of the leaves an RFC 7386 merge patch touches"""
+    if not isinstance(patch, dict) or (not patch and not prefix):
+        raise PatchError(400, "Merge patch must be a non-empty JSON object")
+    paths = []
+    for key, value in patch.items():
+        if not isinstance(key, str) or not key or key.startswith("$") or "." in key:
+            raise PatchError(400, f"Invalid merge patch key {key!r}")
+        path, _ = _resolve(prefix + (key,))
+        if isinstance(value, dict) and value:
+            paths.extend(merge_patch_paths(value, path))
+        else:
+            paths.append(path)
+    if len(paths) > MAX_PATCH_OPS:
+        raise PatchError(413, f"At most {MAX_PATCH_OPS} fields per patch")
+    return paths
+
+
+def merge_patch_to_ops(patch: dict, content: dict, prefix: Tuple[str, ...] = ()) -> List[PatchOp]:
+    """Translate a merge patch into JSON Patch operations against current content.
+
+    prefix is a stored path; keys in patch may use any accepted spelling.
+    """
+    ops = []
+    for key, value in patch.items():
+        path, _ = _resolve(prefix + (key,))
+        current = _get(content, path)
+        if value is None:
+            if current is not _ABSENT:
+                ops.append(PatchOp("remove", path))
+        elif isinstance(value, dict) and isinstance(current, dict):
+            ops.extend(merge_patch_to_ops(value, content, path))
+        else:
+            ops.append(PatchOp("add", path, value))
+    return ops
+
+
+def projection_for_ops(ops_paths: List[Tuple[str, ...]]) -> Dict[str, int]:
+    """Mongo projection covering every subtree the operations read or write"""
+    projection = {"_id": 0, "id": 1, "version": 1}
+    for path in ops_paths:
+        prefix = ["content"]
+        for segment in path:
+            if segment.isdigit() or segment == "-":
+                break
+            prefix.append(segment)
+        projection[".".join(prefix)] = 1
+    # Drop paths already covered by a shorter one; Mongo rejects overlapping projections
+    kept = {}
+    for key in sorted(projection, key=len):
+        if not any(key.startswith(other + ".") for other in kept):
+            kept[key] = projection[key]
+    return kept
+
+
+def op_paths(ops: List[PatchOp]) -> List[Tuple[str, ...]]:
+    """Paths whose current values are needed to apply ops"""
+    paths = []
+    for op in ops:
+        paths.append(op.path)
+        if op.source:
+            paths.append(op.source)
+    return paths
+
+
+def _derived_streams(paths: List[Tuple[str, ...]]) -> List[str]:
+    """Streams whose drivers or financials a patch touches"""
+    streams = []
+    for stream, driver_key in DRIVER_KEYS.items():
+        targets = [("financial_data", stream, driver_key), ("financial_data", stream, "financials")]
+        if any(path[:len(target)] == target[:len(path)] for path in paths for target in targets):
+            streams.append(stream)
+    return streams
+
+
+def derivation_paths(paths: List[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+    """Driver lists to fetch so touched financials can be recomputed, and the
+    stored financials so the history delta only records rows that changed"""
+    return [
+        ("financial_data", stream, key)
+        for stream in _derived_streams(paths) for key in (DRIVER_KEYS[stream], "financials")
+    ]
+
+
+def derived_ops(paths: List[Tuple[str, ...]], content: dict) -> List[PatchOp]:
+    """Operations that rewrite financials from their drivers after a patch.
+
+    Financials rows are derived data: a patch to the drivers recomputes them and
+    a direct edit of a stream that has drivers is overwritten.
+    """
+    ops = []
+    for stream in _derived_streams(paths):
+        rows = _get(content, ("financial_data", stream, DRIVER_KEYS[stream]))
+        if rows is _ABSENT or not rows:
+            continue
+        try:
+            derived = derive_financials({stream: {DRIVER_KEYS[stream]: rows}})
+        except (KeyError, TypeError, ValueError) as e:
+            raise PatchError(422, f"Invalid {DRIVER_KEYS[stream]} drivers for {stream}: {e}")
+        ops.append(PatchOp("add", ("financial_data", stream, "financials"), derived[stream]))
+    return ops
+
+
+_ABSENT = object()
+
+
+def _get(content: Any, path: Tuple[str, ...]) -> Any:
+    try:
+        return extract(content, path)
+    except (KeyError, IndexError, ValueError, TypeError):
+        return _ABSENT
+
+
+def _container(content: dict, path: Tuple[str, ...]):
+    parent = _get(content, path[:-1])
+    if parent is _ABSENT or not isinstance(parent, (dict, list)):
+        raise PatchError(422, f"Path /{'/'.join(path[:-1])} does not exist")
+    return parent
+
+
+def _list_index(parent: list, segment: str, allow_end: bool) -> int:
+    if segment == "-" and allow_end:
+        return len(parent)
+    if not segment.isdigit():
+        raise PatchError(422, f"Invalid list index {segment!r}")
+    index = int(segment)
+    if index > len(parent) or (index == len(parent) and not allow_end):
+        raise PatchError(422, f"List index {index} out of range")
+    return index
+
+
+def _add(content: dict, path: Tuple[str, ...], value: Any):
+    parent = _container(content, path)
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, path[-1], allow_end=True), value)
+    else:
+        parent[path[-1]] = value
+
+
+def _remove(content: dict, path: Tuple[str, ...]) -> Any:
+    parent = _container(content, path)
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, path[-1], allow_end=False))
+    if path[-1] not in parent:
+        raise PatchError(422, f"Path /{'/'.join(path)} does not exist")
+    return parent.pop(path[-1])
+
+
+def apply_ops(content: dict, ops: List[PatchOp]):
+    """Apply operations in order to (partial) stored content, in place"""
+    for op in ops:
+        if op.op == "add":
+            _add(content, op.path, copy.deepcopy(op.value))
+        elif op.op == "remove":
+            _remove(content, op.path)
+        elif op.op == "replace":
+            _remove(content, op.path)
+            _add(content, op.path, copy.deepcopy(op.value))
+        elif op.op == "move":
+            if op.path[:len(op.source)] == op.source and op.path != op.source:
+                raise PatchError(422, "Cannot move a value into one of its children")
+            _add(content, op.path, _remove(content, op.source))
+        elif op.op == "copy":
+            value = _get(content, op.source)
+            if value is _ABSENT:
+                raise PatchError(422, f"Path /{'/'.join(op.source)} does not exist")
+            _add(content, op.path, copy.deepcopy(value))
+        elif op.op == "test":
+            if _get(content, op.path) != op.value:
+                raise PatchError(409, f"Test failed at /{'/'.join(op.path)}")
+
+
+def _touched_units(ops: List[PatchOp]) -> List[Tuple[Tuple[str, ...], str]]:
+    """The (path, kind) of every subtree an operation changes.
+
+    kind is "set" for a value written in place, "push" for an append to a
+    list, "unset" for a removed object member and "list" for a list whose
+    items shift and must be rewritten.
+    """
+    units = []
+    for op in ops:
+        writes = []
+        if op.op in ("remove", "move"):
+            writes.append(("remove", op.source if op.op == "move" else op.path))
+        if op.op in ("add", "replace", "move", "copy"):
+            writes.append((op.op, op.path))
+        for action, path in writes:
+            _, parent_annotation = resolve_annotation(path[:-1])
+            if not _is_list(parent_annotation):
+                units.append((path, "unset" if action == "remove" else "set"))
+            elif path[-1] == "-":
+                units.append((path[:-1], "push"))
+            elif action == "replace":
+                units.append((path, "set"))
+            else:
+                units.append((path[:-1], "list"))
+    return units
+
+
+def _merge_units(units: List[Tuple[Tuple[str, ...], str]], content: dict) -> Dict[Tuple[str, ...], str]:
+    """Collapse overlapping units so the Mongo update has no conflicting paths"""
+    merged: Dict[Tuple[str, ...], str] = {}
+    for path, kind in sorted(units, key=lambda unit: len(unit[0])):
+        ancestor = next((other for other in merged if path[:len(other)] == other), None)
+        if ancestor is None:
+            merged[path] = kind
+        elif not (ancestor == path and kind == merged[path] == "push"):
+            # Several changes under one subtree: write its final value once
+            merged[ancestor] = "set" if _get(content, ancestor) is not _ABSENT else "unset"
+    return merged
+
+
+def _validation_error(path: Tuple[str, ...], error: ValidationError) -> PatchError:
+    return PatchError(422, {
+        "path": "/" + "/".join(path),
+        "errors": error.errors(include_url=False, include_input=False),
+    })
+
+
+def build_update(ops: List[PatchOp], original: dict, content: dict) -> dict:
+    """Validate the touched sub-models and translate the change into a Mongo update.
+
+    Only the subtrees the patch touched are validated: a changed value against
+    its own model, appended items against the list item model, removed members
+    against whether the parent model requires them. original is the fetched
+    content before apply_ops; content is the same after.
+    """
+    units = _merge_units(_touched_units(ops), content)
+    update: Dict[str, dict] = {"$set": {}, "$unset": {}, "$push": {}}
+    for path, kind in units.items():
+        field = ".".join(("content",) + path)
+        _, annotation = resolve_annotation(path)
+
+        if kind == "unset":
+            _, parent = resolve_annotation(path[:-1])
+            parent = unwrap_optional(parent)
+            for name, model_field in parent.model_fields.items():
+                if (model_field.alias or name) == path[-1] and model_field.is_required():
+                    raise PatchError(422, f"/{'/'.join(path)} is required and cannot be removed")
+            update["$unset"][field] = ""
+            continue
+
+        adapter = TypeAdapter(annotation)
+        if kind == "push":
+            item_adapter = TypeAdapter(_item_annotation(annotation))
+            before = _get(original, path)
+            new_items = extract(content, path)[len(before):] if isinstance(before, list) else []
+            try:
+                values = [item_adapter.dump_python(item_adapter.validate_python(item), by_alias=True)
+                          for item in new_items]
+            except ValidationError as e:
+                raise _validation_error(path, e)
+            update["$push"][field] = {"$each": values}
+            continue
+
+        try:
+            value = adapter.validate_python(extract(content, path))
+        except ValidationError as e:
+            raise _validation_error(path, e)
+        update["$set"][field] = adapter.dump_python(value, by_alias=True)
+
+    update["$set"]["updated_at"] = datetime.utcnow()
+    update["$inc"] = {"version": 1}
+    return {operator: fields for operator, fields in update.items() if fields}
+
+
+def apply_update(original: dict, update: dict) -> dict:
+    """The content a build_update result leaves in the store, applied to a copy of original.
+
+    The update holds validated, coerced values, so history and change events
+    taken from this match the stored plan where the patched content may not.
+    """
+    content = copy.deepcopy(original)
+    for operator in ("$unset", "$set", "$push"):
+        for field, value in update.get(operator, {}).items():
+            path = tuple(field.split("."))
+            if path[0] != "content":
+                continue
+            path = path[1:]
+            parent = content
+            for segment in path[:-1]:
+                parent = parent[int(segment)] if isinstance(parent, list) else parent.setdefault(segment, {})
+            key = int(path[-1]) if isinstance(parent, list) else path[-1]
+            if operator == "$unset":
+                parent.pop(key, None)
+            elif operator == "$set":
+                parent[key] = copy.deepcopy(value)
+            else:
+                if isinstance(parent, dict):
+                    parent.setdefault(key, [])
+                parent[key].extend(copy.deepcopy(value["$each"]))
+    return content
@@ -0,0 +1,169 @@
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter
+
+from fast_json import dumps
+from models import BusinessPlanData
+
+# Upper bound on fields= entries, which also bounds distinct cache keys per request
+MAX_FIELDS = 8
+
+
+@lru_cache(maxsize=None)
+def content_schema() -> str:
+    """Fingerprint of the plan schema.
+
+    Content written as normalize_content() output is tagged with it, so reads
+    can serialize the stored dict without validating it again; a schema
+    change makes older documents take the validating path. Generating the
+    JSON schema is slow, so it happens on first use rather than at import.
+    """
+    return hashlib.sha256(
+        json.dumps(BusinessPlanData.model_json_schema(by_alias=True), sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+
+_PLAN_ADAPTER = TypeAdapter(BusinessPlanData)
+
+
+class UnknownSection(Exception):
+    """Raised for a path that does not name part of BusinessPlanData"""
+
+
+def _field_for_segment(model, segment: str):
+    """Find a model field by its stored (alias) name or its attribute name"""
+    for name, field in model.model_fields.items():
+        if segment in (field.alias, name):
+            return field.alias or name, field.annotation
+    return None, None
+
+
+def unwrap_optional(annotation: Any) -> Any:
+    """The inner type of an Optional[...] annotation"""
+    if get_origin(annotation) is Union:
+        return next(arg for arg in get_args(annotation) if arg is not type(None))
+    return annotation
+
+
+@lru_cache(maxsize=256)
+def resolve_annotation(path: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Any]:
+    """Map a section path onto stored keys and the type annotation it addresses.
+
+    Segments may use the stored snake_case key, the camelCase attribute name
+    or kebab-case; list items are addressed by index.
+    """
+    annotation: Any = BusinessPlanData
+    stored = []
+    for raw in path:
+        segment = raw.replace("-", "_")
+        # Optional[...] sections
+        annotation = unwrap_optional(annotation)
+        if get_origin(annotation) in (list, List):
+            if not segment.isdigit():
+                raise UnknownSection("/".join(path))
+            annotation = get_args(annotation)[0]
+            stored.append(segment)
+            continue
+        if not (isinstance(annotation, type) and issubclass(annotation, BaseModel)):
+            raise UnknownSection("/".join(path))
+        key, annotation = _field_for_segment(annotation, segment)
+        if key is None:
+            raise UnknownSection("/".join(path))
+        stored.append(key)
+    return tuple(stored), annotation
+
+
+@lru_cache(maxsize=256)
+def resolve_section(path: Tuple[str, ...]) -> Tuple[Tuple[str, ...], TypeAdapter]:
+    """Like resolve_annotation, with a TypeAdapter to validate the subtree"""
+    stored, annotation = resolve_annotation(path)
+    return stored, TypeAdapter(annotation)
+
+
+def parse_fields(fields: str) -> List[Tuple[str, ...]]:
+    """Split a fields= value like "financial_data.ertug,risks" into paths"""
+    paths = []
+    for field in fields.split(","):
+        field = field.strip().strip(".")
+        if field:
+            paths.append(tuple(field.split(".")))
+    if not paths:
+        raise UnknownSection(fields)
+    if len(paths) > MAX_FIELDS:
+        raise UnknownSection(f"at most {MAX_FIELDS} fields may be requested")
+    return paths
+
+
+def normalize_content(content: Any) -> dict:
+    """Validate plan content and return it exactly as responses render it.
+
+    Stored keys are the aliases responses use, so the result doubles as the
+    stored form; tag it with content_schema() when writing it.
+    """
+    return _PLAN_ADAPTER.dump_python(_PLAN_ADAPTER.validate_python(content), mode="json", by_alias=True)
+
+
+def is_normalized(plan: dict) -> bool:
+    return plan.get("content_schema") == content_schema()
+
+
+def projection_for(paths: List[Tuple[str, ...]]) -> Dict[str, int]:
+    """Mongo projection that fetches only the requested subtrees of content.
+
+    Array indexes cannot be projected by dotted path, so projection stops at
+    the enclosing list and the item is picked out after the read.
+    """
+    projection = {"_id": 0, "updated_at": 1, "created_at": 1, "content_schema": 1}
+    for path in paths:
+        prefix = []
+        for segment in path:
+            if segment.isdigit():
+                break
+            prefix.append(segment)
+        projection[".".join(["content"] + prefix)] = 1
+    return projection
+
+
+def extract(content: dict, path: Tuple[str, ...]) -> Any:
+    """Pick a subtree out of stored content, raising KeyError if it is absent"""
+    value: Any = content
+    for segment in path:
+        if isinstance(value, list):
+            index = int(segment)
+            if index >= len(value):
+                raise KeyError(segment)
+            value = value[index]
+        else:
+            value = value[segment]
+    return value
+
+
+def _nest(target: dict, path: Tuple[str, ...], value: Any):
+    for segment in path[:-1]:
+        target = target.setdefault(segment, {})
+    target[path[-1]] = value
+
+
+def serialize_sections(content: dict, paths: List[Tuple[str, ...]], nested: bool,
+                       validated: bool = False) -> bytes:
+    """Serialize the requested subtrees into a response body.
+
+    Subtrees are validated first unless the content was normalized when it
+    was written. With nested=False the single subtree becomes ``data``;
+    otherwise ``data`` mirrors the plan layout with only the requested
+    branches present.
+    """
+    data: Optional[Any] = {} if nested else None
+    for path in paths:
+        stored, adapter = resolve_section(path)
+        value = extract(content, stored)
+        if not validated:
+            value = adapter.dump_python(adapter.validate_python(value), mode="json", by_alias=True)
+        if nested:
+            _nest(data, stored, value)
+        else:
+            data = value
+    return dumps({"success": True, "data": data})
@@ -0,0 +1,331 @@
+"""Reconciliation of uploaded image files with their database records.
+
+Compares the files under UPLOAD_DIR with the images and image_blobs
+collections and with the product images plans link to, then reports or
+removes orphans on either side. Run ``python reconcile.py`` for a report and
+``python reconcile.py --delete`` to clean up as well. The server can run the
+same job periodically; see RECONCILE_INTERVAL.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Seconds between background runs in the server; 0 leaves the job to the CLI.
+# Enable it on one worker only, every worker would otherwise scan the same disk
+RECONCILE_INTERVAL = float(os.environ.get("RECONCILE_INTERVAL", "0"))
+# Background runs only report unless this is set
+RECONCILE_DELETE = os.environ.get("RECONCILE_DELETE", "false").lower() in ("1", "true", "yes")
+# Files and records younger than this may belong to an upload in flight
+RECONCILE_GRACE = float(os.environ.get("RECONCILE_GRACE", "3600"))
+# Directory entries read per os.scandir batch, and filesystem operations per second
+RECONCILE_BATCH = int(os.environ.get("RECONCILE_BATCH", "500"))
+RECONCILE_IO_RATE = float(os.environ.get("RECONCILE_IO_RATE", "2000"))
+# Paths or ids listed per category in a report
+RECONCILE_SAMPLE = int(os.environ.get("RECONCILE_SAMPLE", "50"))
+
+# Report categories; only the first six are ever removed
+REMOVABLE = ("orphan_blobs", "leaked_blobs", "orphan_files", "orphan_variants", "stale_temp", "missing_files")
+CATEGORIES = REMOVABLE + ("outside_upload_dir", "dangling_references", "unreferenced_images")
+
+
+class IoBudget:
+    """Paces filesystem work to a fixed number of operations per second"""
+
+    def __init__(self, rate: float = RECONCILE_IO_RATE):
+        self.rate = rate
+        self.spent = 0
+        self._started = time.monotonic()
+
+    async def spend(self, operations: int = 1):
+        """Account for operations, sleeping while ahead of the rate"""
+        self.spent += operations
+        ahead = self.spent / self.rate - (time.monotonic() - self._started) if self.rate > 0 else 0
+        # Always yield, so requests are served between batches
+        await asyncio.sleep(max(ahead, 0))
+
+
+def _walk(root: str) -> Iterator[os.DirEntry]:
+    """Every regular file under root, found with os.scandir"""
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def _read_batch(files: Iterator[os.DirEntry], size: int) -> Tuple[int, List[Tuple[str, str, float]]]:
+    """Read up to size entries as (path, name, mtime); runs in a worker thread.
+
+    Returns how many entries were read too, since files removed meanwhile
+    are left out of the batch.
+    """
+    read = 0
+    batch = []
+    for entry in itertools.islice(files, size):
+        read += 1
+        try:
+            batch.append((entry.path, entry.name, entry.stat(follow_symlinks=False).st_mtime))
+        except FileNotFoundError:
+            continue
+    return read, batch
+
+
+class _Findings:
+    def __init__(self):
+        self.items: Dict[str, list] = {category: [] for category in CATEGORIES}
+        self.counts: Dict[str, int] = {category: 0 for category in CATEGORIES}
+
+    def add(self, category: str, item, keep: bool = True):
+        self.counts[category] += 1
+        if keep:
+            self.items[category].append(item)
+        elif len(self.items[category]) < RECONCILE_SAMPLE:
+            self.items[category].append(item)
+
+
+class Reconciler:
+    """Finds and optionally removes image storage that nothing refers to.
+
+    Disk side: blob files without a reference record, legacy uploads and
+    variants without metadata, and stale temporary files. Database side:
+    image records whose file is gone, and blob records no image refers to.
+    Plan links to missing images and images no plan links to are reported
+    but never changed. Anything younger than the grace period is left alone,
+    and filesystem work is paced by an IoBudget.
+    """
+
+    def __init__(self, db_manager, blob_store, variant_dir: Path, grace: float = RECONCILE_GRACE,
+                 batch_size: int = RECONCILE_BATCH, io_rate: float = RECONCILE_IO_RATE):
+        self.db = db_manager
+        self.blob_store = blob_store
+        self.root = blob_store.root
+        self.variant_dir = variant_dir
+        self.grace = grace
+        self.batch_size = batch_size
+        self.io_rate = io_rate
+        self.running = False
+        self.last_report: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self, delete: bool = False) -> dict:
+        """Scan once and return a report; with delete, also remove orphans"""
+        if self.running:
+            raise RuntimeError("Reconciliation is already running")
+        self.running = True
+        try:
+            report = await self._run(delete)
+        finally:
+            self.running = False
+        self.last_report = report
+        return report
+
+    async def _run(self, delete: bool) -> dict:
+        started = time.monotonic()
+        started_at = datetime.utcnow()
+        cutoff = time.time() - self.grace
+        cutoff_at = started_at - timedelta(seconds=self.grace)
+        budget = IoBudget(self.io_rate)
+        findings = _Findings()
+
+        # Database side first: anything written after this snapshot is young
+        image_ids: Set[str] = set()
+        referenced_blobs: Set[str] = set()
+        variant_keys: Set[str] = set()
+        images_by_path: Dict[str, List[dict]] = {}
+        stored_names: Set[str] = set()
+        async for image in self.db.iter_image_records():
+            image_ids.add(image["id"])
+            if image.get("sha256"):
+                referenced_blobs.add(image["sha256"])
+            variant_keys.add(image.get("sha256") or image["id"])
+            path = os.path.abspath(image["path"]) if image.get("path") else ""
+            images_by_path.setdefault(path, []).append(image)
+            stored_names.add(os.path.basename(path))
+
+        blobs: Dict[str, dict] = {}
+        async for blob in self.db.iter_blob_records():
+            blobs[blob["_id"]] = blob
+
+        linked: Set[str] = set()
+        async for plan_id, path, image_id in self.db.iter_plan_image_refs():
+            linked.add(image_id)
+            if image_id not in image_ids:
+                findings.add("dangling_references", {"plan_id": plan_id, "path": path, "image_id": image_id})
+
+        # Disk side, in batches read off the event loop
+        root = os.path.abspath(self.root)
+        blob_dir = os.path.abspath(self.blob_store.blob_dir)
+        tmp_dir = os.path.abspath(self.blob_store.tmp_dir)
+        variant_dir = os.path.abspath(self.variant_dir)
+        on_disk: Set[str] = set()
+        files = _walk(root)
+        scanned = 0
+        while True:
+            read, batch = await asyncio.to_thread(_read_batch, files, self.batch_size)
+            if not read:
+                break
+            scanned += len(batch)
+            for path, name, mtime in batch:
+                on_disk.add(path)
+                if mtime > cutoff:
+                    continue
+                parent = os.path.dirname(path)
+                if path.startswith(blob_dir + os.sep):
+                    if name.split(".", 1)[0] not in blobs:
+                        findings.add("orphan_blobs", path)
+                elif parent == tmp_dir or name.endswith(".part"):
+                    findings.add("stale_temp", path)
+                elif path.startswith(variant_dir + os.sep):
+                    if name.rsplit("_w", 1)[0] not in variant_keys:
+                        findings.add("orphan_variants", path)
+                elif parent == root and name not in stored_names:
+                    findings.add("orphan_files", path)
+            await budget.spend(read)
+
+        for path, images in images_by_path.items():
+            for image in images:
+                uploaded_at = image.get("uploaded_at")
+                if isinstance(uploaded_at, datetime) and uploaded_at > cutoff_at:
+                    continue
+                if not path.startswith(root + os.sep):
+                    # Stored under another UPLOAD_DIR; a missing file here proves nothing
+                    findings.add("outside_upload_dir", image["id"], keep=False)
+                elif path not in on_disk:
+                    findings.add("missing_files", {"id": image["id"], "path": path, "sha256": image.get("sha256")})
+
+        for sha256, blob in blobs.items():
+            created_at = blob.get("created_at")
+            if sha256 in referenced_blobs or (isinstance(created_at, datetime) and created_at > cutoff_at):
+                continue
+            findings.add("leaked_blobs", {"sha256": sha256, "refcount": blob.get("refcount", 0),
+                                          "extension": blob.get("extension", "")})
+
+        for image_id in image_ids - linked:
+            findings.add("unreferenced_images", image_id, keep=False)
+
+        removed = {category: 0 for category in REMOVABLE}
+        if delete:
+            removed = await self._remove(findings, budget)
+
+        report = {
+            "started_at": started_at.isoformat() + "Z",
+            "duration": round(time.monotonic() - started, 3),
+            "delete": delete,
+            "scanned": {"files": scanned, "images": len(image_ids), "blobs": len(blobs)},
+            "removed": removed,
+        }
+        for category in CATEGORIES:
+            report[category] = {
+                "count": findings.counts[category],
+                "sample": findings.items[category][:RECONCILE_SAMPLE],
+            }
+        logging.info(
+            "Image reconciliation: " + ", ".join(f"{c}={n}" for c, n in findings.counts.items() if n)
+            + (f"; removed {sum(removed.values())}" if delete else "")
+        )
+        return report
+
+    async def _remove(self, findings: _Findings, budget: IoBudget) -> Dict[str, int]:
+        removed = {category: 0 for category in REMOVABLE}
+
+        for path in findings.items["orphan_blobs"]:
+            # Renamed aside first, so an upload of the same bytes racing this
+            # removal either keeps the file or writes a fresh one
+            sha256 = os.path.basename(path).split(".", 1)[0]
+            if await self.blob_store.remove(Path(path), lambda: self.db.blob_record_missing(sha256)):
+                removed["orphan_blobs"] += 1
+            await budget.spend(2)
+
+        for category in ("orphan_files", "orphan_variants", "stale_temp"):
+            for path in findings.items[category]:
+                try:
+                    os.unlink(path)
+                    removed[category] += 1
+                except FileNotFoundError:
+                    pass
+                await budget.spend(1)
+
+        for image in findings.items["missing_files"]:
+            if await self.db.delete_image_metadata(image["id"]):
+                removed["missing_files"] += 1
+                if image["sha256"]:
+                    await self._release(image["sha256"], Path(image["path"]))
+            await budget.spend(1)
+
+        for blob in findings.items["leaked_blobs"]:
+            # Only if no upload took a reference since the scan read the count
+            if blob["refcount"] > 0 and not await self.db.reset_leaked_blob(blob["sha256"], blob["refcount"]):
+                continue
+            path = self.blob_store.blob_path(blob["sha256"], blob["extension"])
+            await self.blob_store.remove(path, lambda: self.db.delete_blob_if_unreferenced(blob["sha256"]))
+            removed["leaked_blobs"] += 1
+            await budget.spend(2)
+
+        return removed
+
+    async def _release(self, sha256: str, path: Path):
+        """Drop one blob reference, deleting the file after the last, as delete_image does"""
+        if await self.db.release_blob(sha256) <= 0:
+            await self.blob_store.remove(path, lambda: self.db.delete_blob_if_unreferenced(sha256))
+
+    def start(self, interval: float = RECONCILE_INTERVAL, delete: bool = RECONCILE_DELETE):
+        """Run periodically in the background; an interval of 0 does nothing"""
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(interval, delete))
+
+    async def _loop(self, interval: float, delete: bool):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run(delete)
+            except RuntimeError:
+                pass  # a run requested through the API is still going
+            except Exception as e:
+                logging.warning(f"Image reconciliation failed: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+async def _main(delete: bool) -> int:
+    from database import close_client, db_manager
+    from image_store import BlobStore
+
+    upload_dir = Path(os.environ.get("UPLOAD_DIR", ROOT_DIR / "uploads"))
+    reconciler = Reconciler(db_manager, BlobStore(upload_dir), upload_dir / "variants")
+    try:
+        report = await reconciler.run(delete)
+    finally:
+        close_client()
+    print(json.dumps(report, indent=2, default=str))
+    found = sum(report[category]["count"] for category in REMOVABLE)
+    return 1 if found and not delete else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and remove orphaned image files and records")
+    parser.add_argument("--delete", action="store_true", help="remove orphans instead of only reporting them")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.delete)))
@@ -88,30 +88,45 @@ SEED_BUSINESS_PLAN = {
             },
             "ertug": {
                 "investments": [
-                    {"item": "Montaj hattı", "amount": "100.000 USD"},
-                    {"item": "Boru bükme makinası", "amount": "25.000 USD"},
-                    {"item": "Lazer kaynak makinası", "amount": "35.000 USD"},
-                    {"item": "CKD ithalat & stoklama", "amount": "1.200.000 USD"},
-                    {"item": "Nakliye & gümrükleme", "amount": "10.000 USD"}
+                    {"item": "Montaj hattı", "amount": 100000, "currency": "USD"},
+                    {"item": "Boru bükme makinası", "amount": 25000, "currency": "USD"},
+                    {"item": "Lazer kaynak makinası", "amount": 35000, "currency": "USD"},
+                    {"item": "CKD ithalat & stoklama", "amount": 1200000, "currency": "USD"},
+                    {"item": "Nakliye & gümrükleme", "amount": 10000, "currency": "USD"}
                 ],
                 "financials": [
-                    {"year": "2026", "sales": 107949600, "costs": 95891511, "gross": 12058089, "opex": 18720333, "ebitda": -6662245},
-                    {"year": "2027", "sales": 213550400, "costs": 176597577, "gross": 36952823, "opex": 27934550, "ebitda": 9018273},
-                    {"year": "2028", "sales": 353410000, "costs": 283394827, "gross": 70015173, "opex": 32015104, "ebitda": 38000069}
+                    {"year": "2026", "sales": 107950500, "costs": 95893000, "gross": 12057500, "opex": 18720333, "ebitda": -6662833},
+                    {"year": "2027", "sales": 213552000, "costs": 176598000, "gross": 36954000, "opex": 27934550, "ebitda": 9019450},
+                    {"year": "2028", "sales": 353412000, "costs": 283392000, "gross": 70020000, "opex": 32015104, "ebitda": 38004896}
+                ],
+                "production": [
+                    {"year": "2026", "units": 3500, "cost": 27398, "price": 33840, "discount": 2997, "opex": 18720333},
+                    {"year": "2027", "units": 6000, "cost": 29433, "price": 36920, "discount": 1328, "opex": 27934550},
+                    {"year": "2028", "units": 9000, "cost": 31488, "price": 40600, "discount": 1332, "opex": 32015104}
                 ]
             },
             "fiyuu_sales": {
                 "financials": [
-                    {"year": "2026", "sales": 143595000, "costs": 118440000, "gross": 25155000, "opex": 14151352, "ebitda": 11003648},
+                    {"year": "2026", "sales": 143594500, "costs": 118440000, "gross": 25154500, "opex": 14151352, "ebitda": 11003148},
                     {"year": "2027", "sales": 298530000, "costs": 221520000, "gross": 77010000, "opex": 21224257, "ebitda": 55785743},
-                    {"year": "2028", "sales": 516853125, "costs": 365400000, "gross": 151453125, "opex": 28734657, "ebitda": 122718468}
+                    {"year": "2028", "sales": 516852000, "costs": 365400000, "gross": 151452000, "opex": 28734657, "ebitda": 122717343}
+                ],
+                "sales": [
+                    {"year": "2026", "units": 3500, "buy_price": 33840, "sell_price": 45000, "discount": 3973, "opex": 14151352},
+                    {"year": "2027", "units": 6000, "buy_price": 36920, "sell_price": 51750, "discount": 1995, "opex": 21224257},
+                    {"year": "2028", "units": 9000, "buy_price": 40600, "sell_price": 59513, "discount": 2085, "opex": 28734657}
                 ]
             },
             "fiyuu_swap": {
                 "financials": [
-                    {"year": "2026", "sales": 108889200, "costs": 19963020, "gross": 88926180, "opex": 56831112, "ebitda": 56431042},
-                    {"year": "2027", "sales": 469476000, "costs": 74844000, "gross": 394632000, "opex": 172439965, "ebitda": 311575485},
-                    {"year": "2028", "sales": 1119787200, "costs": 159390000, "gross": 960397200, "opex": 377590438, "ebitda": 804928956}
+                    {"year": "2026", "sales": 108864000, "costs": 19960920, "gross": 88903080, "opex": 56830778, "ebitda": 56407942},
+                    {"year": "2027", "sales": 459648000, "costs": 74844000, "gross": 384804000, "opex": 172435875, "ebitda": 301747485},
+                    {"year": "2028", "sales": 1088640000, "costs": 159372360, "gross": 929267640, "opex": 377596164, "ebitda": 773799396}
+                ],
+                "rental": [
+                    {"year": "2026", "battery_count": 2520, "cabinet_count": 140, "monthly_rental": 3600, "battery_cost": 7921, "opex": 32495138, "unit_depreciation": 9657},
+                    {"year": "2027", "battery_count": 10080, "cabinet_count": 560, "monthly_rental": 3800, "battery_cost": 7425, "opex": 83056515, "unit_depreciation": 8867},
+                    {"year": "2028", "battery_count": 22680, "cabinet_count": 1260, "monthly_rental": 4000, "battery_cost": 7027, "opex": 155468244, "unit_depreciation": 9794}
                 ]
             }
         },
@@ -0,0 +1,175 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from financials import COLUMNS, METRICS, SCENARIO_DRIVERS, SCENARIO_TARGETS, apply_scenario, compute_pnl, driver_matrix
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+MAX_GRID_POINTS = int(os.environ.get("SENSITIVITY_MAX_GRID_POINTS", "250000"))
+
+# Break-even search stops once EBITDA is within this many TL of zero
+BREAK_EVEN_TOLERANCE = 0.5
+BREAK_EVEN_MAX_ITERATIONS = 60
+
+_EBITDA = METRICS.index("ebitda")
+
+
+def grid_values(axis: dict) -> np.ndarray:
+    """The sorted driver values one axis sweeps"""
+    if axis.get("values"):
+        values = np.unique(np.asarray(axis["values"], dtype=np.float64))
+    else:
+        values = np.linspace(axis["start"], axis["stop"], axis["steps"])
+    if not np.isfinite(values).all() or (values < 0).any():
+        raise ValueError(f"Invalid values for {axis['driver']}")
+    return values
+
+
+def _affected_rows(streams: List[str], drivers: List[str], only: Optional[List[str]]) -> np.ndarray:
+    targets = {stream for driver, stream, _ in SCENARIO_TARGETS if driver in drivers}
+    if only:
+        targets &= set(only)
+    return np.array([index for index, stream in enumerate(streams) if stream in targets], dtype=np.intp)
+
+
+def _ebitda_per_row(base, streams, factors: Dict[str, np.ndarray]) -> np.ndarray:
+    """EBITDA where row i of the last factor axis applies only to driver row i"""
+    ebitda = compute_pnl(apply_scenario(base, streams, factors))[..., _EBITDA]
+    return np.diagonal(ebitda, axis1=-2, axis2=-1)
+
+
+def solve_break_even(evaluate, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Find x in [low, high] where evaluate(x) == 0, element-wise.
+
+    Vectorized Illinois (modified regula falsi): every element converges
+    independently and the loop ends when all have. EBITDA is linear in each
+    single driver, so the first step usually lands on the root. Elements
+    without a sign change in the bracket come back as NaN.
+    """
+    a, b = low.copy(), high.copy()
+    fa, fb = evaluate(a), evaluate(b)
+    bracketed = np.sign(fa) * np.sign(fb) <= 0
+    root = np.where(np.abs(fa) <= BREAK_EVEN_TOLERANCE, a, b)
+    done = ~bracketed | (np.abs(fa) <= BREAK_EVEN_TOLERANCE) | (np.abs(fb) <= BREAK_EVEN_TOLERANCE)
+
+    for _ in range(BREAK_EVEN_MAX_ITERATIONS):
+        if done.all():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = np.where(fb != fa, (a * fb - b * fa) / (fb - fa), (a + b) / 2)
+        c = np.where(done, root, c)
+        fc = evaluate(c)
+        converged = ~done & (np.abs(fc) <= BREAK_EVEN_TOLERANCE)
+        root = np.where(converged, c, root)
+        done |= converged
+
+        crossed = fc * fb < 0
+        a, fa = np.where(crossed, b, a), np.where(crossed, fb, fa / 2)
+        b, fb = c, fc
+    root = np.where(done, root, b)
+    return np.where(bracketed, root, np.nan)
+
+
+def _driver_base(base: np.ndarray, streams: List[str], rows: np.ndarray, driver: str) -> np.ndarray:
+    """Plan value of the column a relative driver scales, per row"""
+    columns = {stream: COLUMNS.index(column) for name, stream, column in SCENARIO_TARGETS if name == driver}
+    return np.array([base[row, columns[streams[row]]] if streams[row] in columns else np.nan for row in rows])
+
+
+def sensitivity_grid(financial_data: dict, axes: List[dict], streams_filter: Optional[List[str]] = None) -> dict:
+    """EBITDA over a one or two driver grid, with break-even points per axis.
+
+    The surface comes from a single broadcast of the driver matrix against the
+    axis values. Break-even on an axis is solved for every grid value of the
+    other axis, holding the remaining drivers at plan.
+    """
+    drivers = [axis["driver"] for axis in axes]
+    unknown = set(drivers) - set(SCENARIO_DRIVERS)
+    if unknown:
+        raise ValueError(f"Unknown drivers: {', '.join(sorted(unknown))}")
+    if not 1 <= len(axes) <= 2 or len(set(drivers)) != len(drivers):
+        raise ValueError("Sweep one or two different drivers")
+    values = [grid_values(axis) for axis in axes]
+    if int(np.prod([len(v) for v in values])) > MAX_GRID_POINTS:
+        raise ValueError(f"Grid is larger than {MAX_GRID_POINTS} points")
+
+    labels, base = driver_matrix(financial_data)
+    streams = [stream for stream, _ in labels]
+    rows = _affected_rows(streams, drivers, streams_filter)
+    if not len(rows):
+        raise ValueError("No plan drivers are affected by this sweep")
+    row_base = base[rows]
+    row_streams = [streams[row] for row in rows]
+
+    # One axis per driver: (n0, 1) and (1, n1) broadcast to the full grid
+    shape = [len(v) for v in values]
+    factors = {
+        driver: v.reshape([-1 if i == j else 1 for j in range(len(values))])
+        for i, (driver, v) in enumerate(zip(drivers, values))
+    }
+    surface = compute_pnl(apply_scenario(row_base, row_streams, factors))[..., _EBITDA]
+    surface = np.moveaxis(surface, -1, 0)  # (rows, *grid)
+
+    break_even = []
+    for i, driver in enumerate(drivers):
+        other = 1 - i if len(drivers) == 2 else None
+        count = shape[other] if other is not None else 1
+        low = np.full((count, len(rows)), values[i][0])
+        high = np.full((count, len(rows)), values[i][-1])
+
+        def evaluate(x, driver=driver, other=other):
+            scenario = {driver: x}
+            if other is not None:
+                scenario[drivers[other]] = values[other][:, None]
+            return _ebitda_per_row(row_base, row_streams, scenario)
+
+        factor = solve_break_even(evaluate, low, high).T  # (rows, count)
+        plan_values = _driver_base(base, streams, rows, driver)[:, None]
+        absolute = factor if driver == "fx_rate" else factor * plan_values
+        break_even.append((driver, drivers[other] if other is not None else None, factor, absolute))
+
+    return {"labels": [labels[row] for row in rows], "values": values, "surface": surface, "break_even": break_even}
+
+
+def _json_list(array: np.ndarray, decimals: int) -> list:
+    """Rounded nested lists with NaN as null"""
+    rounded = np.round(array, decimals).astype(object)
+    rounded[np.isnan(array)] = None
+    return rounded.tolist()
+
+
+def grid_response(result: dict, axes: List[dict]) -> dict:
+    """Shape a sensitivity_grid result for JSON, keyed by stream and year"""
+    surfaces: Dict[str, dict] = {}
+    for (stream, year), surface in zip(result["labels"], result["surface"]):
+        surfaces.setdefault(stream, {})[year] = np.rint(surface).astype(np.int64).tolist()
+
+    break_even = []
+    for driver, across, factor, absolute in result["break_even"]:
+        points: Dict[str, dict] = {}
+        for (stream, year), row_factor, row_absolute in zip(result["labels"], factor, absolute):
+            if across is None:
+                row_factor, row_absolute = row_factor[:1], row_absolute[:1]
+            point = {"factor": _json_list(row_factor, 6), "value": _json_list(row_absolute, 2)}
+            if across is None:
+                point = {key: value[0] for key, value in point.items()}
+            points.setdefault(stream, {})[year] = point
+        break_even.append({"driver": driver, "across": across, "points": points})
+
+    return {
+        "axes": [{"driver": axis["driver"], "values": values.tolist()}
+                 for axis, values in zip(axes, result["values"])],
+        "surfaces": surfaces,
+        "break_even": break_even,
+    }
+
+
+def cache_key(plan_id: str, version: int, axes: List[dict], streams: Optional[List[str]]) -> Tuple:
+    """Key for a grid result; the plan version makes stale entries unreachable"""
+    return (plan_id, version, tuple(tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in axis.items()))
+                                    for axis in axes), tuple(streams or ()))
@@ -1,147 +1,1207 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form
-from fastapi.responses import FileResponse
+# Imported first, so STARTUP_PROFILE can time every import after it
+from startup import startup_profile
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, File, UploadFile, Form, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
-from typing import Optional
-import aiofiles
+from typing import List, Optional
+import asyncio
+import copy
+import re
 import shutil
-from datetime import datetime
+import time
+from datetime import date, datetime
 import uuid
 
-from models import BusinessPlanResponse, ImageUploadResponse, ErrorResponse
-from database import db_manager
-from seed_data import SEED_BUSINESS_PLAN
+from models import BatchImageUploadResponse, BusinessPlanResponse, ImageUploadResponse, ImageUploadResult, ErrorResponse, LandedCostRequest, PlanCreateRequest, SensitivityRequest, SimulationRequest
+from database import (
+    DEFAULT_PLAN_ID, IMAGE_LISTING_BATCH, client_options, close_client, db_manager, decode_image_cursor,
+    encode_image_cursor, get_client, get_database, pool_stats
+)
+from indexes import audit_indexes, ensure_indexes
+from compression import COMPRESSION_MIN_SIZE, CompressionMiddleware, encoded_etag, encoded_etags, negotiate
+from cache import CachedBody, image_metadata_cache, plan_caches, plan_version_cache, sensitivity_cache
+from file_serving import RangeFileResponse, open_regular_file
+from image_variants import (
+    SOURCE_FORMATS, VARIANT_PREWARM_WIDTHS, VARIANT_WIDTHS, VariantService, image_dimensions, snap_width
+)
+from image_store import (
+    MAX_BATCH_FILES, UPLOAD_CONCURRENCY, BlobStore, StoredUpload, UploadRejected, UploadSizeLimitMiddleware,
+    stream_upload
+)
+from plan_sections import (
+    UnknownSection, content_schema, is_normalized, normalize_content, parse_fields, projection_for, resolve_section,
+    serialize_sections
+)
+from plan_patch import (
+    PatchError, apply_ops, apply_update, build_update, derivation_paths, derived_ops, merge_patch_paths, merge_patch_to_ops,
+    op_paths, parse_json_patch, projection_for_ops
+)
+from financials import PLAN_FX_RATE, derive_financials, financials_drift
+from currency import BASE_CURRENCY, FX_RATES_FILE, FxTable, convert_plan_content, normalize_currency
+from customs import LANDED_COST_FIELDS, MAX_CUSTOMS_LINES, landed_cost, shipment_totals
+from simulation import MAX_SIMULATION_TRIALS, SimulationService, validate_drivers
+from sensitivity import cache_key, grid_response, sensitivity_grid
+from http_cache import etag_for_parts, is_not_modified, not_modified_response, parse_etags, validator_headers
+from plan_history import diff
+from events import EventHub, create_broker, plan_event
+from reconcile import Reconciler
+from jobs import JobQueue
+from fast_json import FastJSONResponse, dumps
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Create uploads directory
-UPLOAD_DIR = ROOT_DIR / "uploads"
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", ROOT_DIR / "uploads"))
 UPLOAD_DIR.mkdir(exist_ok=True)
+blob_store = BlobStore(UPLOAD_DIR)
+variant_service = VariantService(UPLOAD_DIR)
+simulation_service = SimulationService()
+fx_table = FxTable.load(FX_RATES_FILE, fallback_usd_rate=PLAN_FX_RATE)
+event_hub = EventHub(create_broker())
+reconciler = Reconciler(db_manager, blob_store, variant_service.variant_dir)
+job_queue = JobQueue(db_manager)
+
+# Optimistic writes without If-Match retry this many times against concurrent writers
+PATCH_RETRIES = 3
+
+# Plan ids appear in URLs, cache keys and image namespaces
+PLAN_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+# Plan clients must revalidate every time; image ids never change content
+PLAN_CACHE_CONTROL = "no-cache"
+IMAGE_CACHE_CONTROL = f"public, max-age={int(os.environ.get('IMAGE_CACHE_MAX_AGE', '86400'))}"
+
+# Image ids resolved by one GET /api/images?ids=... request
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", "100"))
+
+# Seed the default plan and move legacy images into it on startup; once the
+# database is set up, turning this off saves the round trips on every boot
+SEED_DATABASE = os.environ.get("SEED_DATABASE", "true").lower() in ("1", "true", "yes")
+# Create missing indexes on startup; off when deployments run `python indexes.py ensure`
+ENSURE_INDEXES = os.environ.get("ENSURE_INDEXES", "true").lower() in ("1", "true", "yes")
+
+def _seed_content() -> dict:
+    """Normalized content of the seed plan, imported only when a plan is seeded"""
+    from seed_data import SEED_BUSINESS_PLAN
+    return normalize_content(SEED_BUSINESS_PLAN["content"])
+
+async def _audit_indexes(db):
+    """Log index drift; runs after startup, since nothing waits on it"""
+    try:
+        for collection, report in (await audit_indexes(db)).items():
+            if report["missing"] or report["undeclared"]:
+                logging.warning(f"Index audit for {collection}: {report}")
+    except Exception as e:
+        logging.warning(f"Index audit skipped: {e}")
+
+# Connect, prepare indexes and seed data before serving; release on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_client()
+    db = get_database()
+    if ENSURE_INDEXES:
+        with startup_profile.phase("indexes"):
+            await ensure_indexes(db)
+    
+    if SEED_DATABASE:
+        with startup_profile.phase("seed"):
+            now = datetime.utcnow()
+            seeded = await db_manager.seed_business_plan({
+                "id": DEFAULT_PLAN_ID, "content": _seed_content(), "content_schema": content_schema(),
+                "created_at": now, "updated_at": now
+            })
+            if seeded:
+                logging.info("Seeded database with initial business plan data")
+            moved = await db_manager.assign_default_plan()
+            if moved:
+                logging.info(f"Moved {moved} images into the default plan namespace")
+    
+    with startup_profile.phase("background"):
+        await event_hub.start()
+        reconciler.start()
+        job_queue.start()
+    index_audit = asyncio.create_task(_audit_indexes(db)) if ENSURE_INDEXES else None
+    startup_profile.ready()
+    
+    yield
+    
+    if index_audit is not None:
+        index_audit.cancel()
+        await asyncio.gather(index_audit, return_exceptions=True)
+    await job_queue.stop()
+    await reconciler.stop()
+    await event_hub.stop()
+    variant_service.shutdown()
+    simulation_service.shutdown()
+    close_client()
 
 # Create the main app without a prefix
-app = FastAPI(title="E-Moped Business Plan API")
+app = FastAPI(title="E-Moped Business Plan API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Initialize database with seed data
-@app.on_event("startup")
-async def startup_event():
-    # Check if business plan exists, if not create it
-    existing_plan = await db_manager.get_business_plan()
-    if not existing_plan:
-        await db_manager.create_business_plan(SEED_BUSINESS_PLAN)
-        logging.info("Seeded database with initial business plan data")
-
 @api_router.get("/")
 async def root():
     return {"message": "E-Moped Business Plan API"}
 
-@api_router.get("/business-plan", response_model=BusinessPlanResponse)
-async def get_business_plan():
-    """Get the current business plan data"""
+def plan_scope(request: Request) -> str:
+    """The plan a request targets: {plan_id} under /plans, else the default plan"""
+    plan_id = request.path_params.get("plan_id", DEFAULT_PLAN_ID)
+    if not PLAN_ID_PATTERN.match(plan_id):
+        raise HTTPException(status_code=400, detail="Invalid plan id")
+    return plan_id
+
+@api_router.get("/plans")
+async def list_plans(limit: int = Query(100, ge=1, le=1000), after: Optional[str] = Query(None)):
+    """List hosted business plans by id; pass the last id as after for the next page"""
+    try:
+        plans = await db_manager.list_business_plans(limit, after)
+        return FastJSONResponse({"success": True, "plans": plans, "next": plans[-1]["id"] if len(plans) == limit else None})
+    except Exception as e:
+        logging.error(f"Error listing business plans: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/plans", status_code=201)
+async def create_plan(plan: PlanCreateRequest):
+    """Create a new business plan, by default as a copy of the seed plan"""
+    plan_id = plan.id or str(uuid.uuid4())
+    if not PLAN_ID_PATTERN.match(plan_id):
+        raise HTTPException(status_code=400, detail="Invalid plan id")
+    try:
+        if await db_manager.get_business_plan(projection={"_id": 0, "id": 1}, plan_id=plan_id):
+            raise HTTPException(status_code=409, detail="Business plan already exists")
+        content = plan.content.model_dump(mode="json", by_alias=True) if plan.content else _seed_content()
+        now = datetime.utcnow()
+        created = await db_manager.create_business_plan({
+            "id": plan_id, "content": content, "content_schema": content_schema(), "created_at": now, "updated_at": now
+        })
+        if not created:
+            # Another request created the same plan since the check above
+            raise HTTPException(status_code=409, detail="Business plan already exists")
+        await event_hub.publish(plan_event("plan.created", plan_id, 1))
+        return {"success": True, "id": plan_id, "url": f"/api/plans/{plan_id}/business-plan"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error creating business plan: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+def _plan_last_modified(plan: dict) -> Optional[datetime]:
+    last_modified = plan.get("updated_at") or plan.get("created_at")
+    return last_modified if isinstance(last_modified, datetime) else None
+
+def _cached_plan_response(request: Request, entry: CachedBody) -> Response:
+    """Serve a cached plan body, or 304 when the client copy is current.
+
+    Small bodies go out as they are; larger ones in the best coding the
+    client accepts, each encoding with its own ETag.
+    """
+    encoding = None
+    if len(entry.body) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+    etag = encoded_etag(entry.etag, encoding)
+    headers = validator_headers(etag, entry.last_modified, PLAN_CACHE_CONTROL)
+    headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request, etag, entry.last_modified):
+        return not_modified_response(headers)
+    if encoding is None:
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(content=entry.variant(encoding), media_type="application/json", headers=headers)
+
+async def _load_business_plan_body(plan_id: str) -> Optional[CachedBody]:
+    """Fetch the active plan and serialize it into response bytes"""
+    plan = await db_manager.get_business_plan(plan_id=plan_id)
+    if not plan:
+        return None
+    if is_normalized(plan):
+        # Validated when written and stored in response form: encode as is
+        body = dumps({"success": True, "data": plan["content"], "version": plan.get("version", 0)})
+    else:
+        response = BusinessPlanResponse(success=True, data=plan["content"], version=plan.get("version", 0))
+        body = response.model_dump_json(by_alias=True).encode()
+    return CachedBody(body, _plan_last_modified(plan), plan.get("version", 0))
+
+async def _plan_sections_response(request: Request, paths: list, nested: bool, plan_id: str) -> Response:
+    """Serve part of the plan, fetching and validating only the requested subtrees"""
     try:
-        plan = await db_manager.get_business_plan()
+        stored_paths = [resolve_section(path)[0] for path in paths]
+    except UnknownSection as e:
+        raise HTTPException(status_code=404, detail=f"Unknown business plan section: {e}")
+
+    async def load() -> Optional[CachedBody]:
+        plan = await db_manager.get_business_plan(projection=projection_for(stored_paths), plan_id=plan_id)
         if not plan:
-            raise HTTPException(status_code=404, detail="Business plan not found")
+            return None
+        try:
+            body = serialize_sections(plan.get("content", {}), paths, nested, validated=is_normalized(plan))
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Section not found in business plan")
+        return CachedBody(body, _plan_last_modified(plan))
+
+    key = ("fields:" if nested else "section:") + ",".join(".".join(path) for path in stored_paths)
+    entry = await plan_caches.for_plan(plan_id).get_or_load(key, load)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Business plan not found")
+    return _cached_plan_response(request, entry)
+
+def _converted_plan_loader(currency: str, on: date, plan_id: str):
+    async def load() -> Optional[CachedBody]:
+        """Serialize the active plan with every monetary field in currency"""
+        plan = await db_manager.get_business_plan(plan_id=plan_id)
+        if not plan:
+            return None
+        data = plan["content"] if is_normalized(plan) else normalize_content(plan["content"])
+        convert_plan_content(data, fx_table, currency, on)
+        body = dumps({"success": True, "currency": currency, "fx_date": on.isoformat(), "data": data})
+        return CachedBody(body, _plan_last_modified(plan), plan.get("version", 0))
+    return load
+
+@api_router.get("/business-plan", response_model=BusinessPlanResponse)
+@api_router.get("/plans/{plan_id}/business-plan", response_model=BusinessPlanResponse)
+async def get_business_plan(
+    request: Request,
+    fields: Optional[str] = Query(None),  # e.g. "financial_data.ertug,risks"
+    currency: Optional[str] = Query(None),  # e.g. "USD"; amounts are stored in TL
+    fx_date: Optional[date] = Query(None),  # rate date for amounts without a year
+    plan_id: str = Depends(plan_scope)
+):
+    """Get the current business plan data, or only the requested fields"""
+    try:
+        if fields:
+            if currency:
+                raise HTTPException(status_code=400, detail="currency is only supported for the full plan")
+            try:
+                paths = parse_fields(fields)
+            except UnknownSection as e:
+                raise HTTPException(status_code=400, detail=f"Invalid fields: {e}")
+            return await _plan_sections_response(request, paths, nested=True, plan_id=plan_id)
         
-        return BusinessPlanResponse(success=True, data=plan["content"])
+        if currency and normalize_currency(currency) != BASE_CURRENCY:
+            currency = normalize_currency(currency)
+            if currency not in fx_table.currencies():
+                raise HTTPException(status_code=400, detail=f"No exchange rates for {currency}")
+            on = fx_date or date.today()
+            entry = await plan_caches.for_plan(plan_id).get_or_load(
+                f"plan:{currency}:{on}", _converted_plan_loader(currency, on, plan_id)
+            )
+            if entry is None:
+                raise HTTPException(status_code=404, detail="Business plan not found")
+            return _cached_plan_response(request, entry)
+        
+        entry = await plan_caches.for_plan(plan_id).get_or_load("plan", lambda: _load_business_plan_body(plan_id))
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        return _cached_plan_response(request, entry)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching business plan: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+async def _active_plan_ref(plan_id: str) -> dict:
+    plan = await db_manager.get_business_plan(projection={"_id": 0, "id": 1, "version": 1}, plan_id=plan_id)
+    if not plan:
+        raise HTTPException(status_code=404, detail="Business plan not found")
+    return plan
+
+async def _plan_version_content(plan_id: str, version: int) -> dict:
+    content = await db_manager.get_plan_version(plan_id, version)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Version {version} is not in the plan history")
+    return content
+
+@api_router.get("/business-plan/versions")
+@api_router.get("/plans/{plan_id}/business-plan/versions")
+async def list_business_plan_versions(limit: int = Query(100, ge=1, le=1000), plan_id: str = Depends(plan_scope)):
+    """List stored versions of the active plan, newest first"""
+    try:
+        plan = await _active_plan_ref(plan_id)
+        versions = await db_manager.list_plan_versions(plan["id"], limit)
+        return FastJSONResponse({"success": True, "current": plan.get("version", 0), "versions": versions})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error listing business plan versions: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/business-plan/versions/diff")
+@api_router.get("/plans/{plan_id}/business-plan/versions/diff")
+async def diff_business_plan_versions(
+    from_version: int = Query(..., alias="from", ge=1),
+    to_version: Optional[int] = Query(None, alias="to", ge=1),  # defaults to the current version
+    plan_id: str = Depends(plan_scope)
+):
+    """JSON Patch operations that turn one plan version into another"""
+    try:
+        plan = await _active_plan_ref(plan_id)
+        to_version = to_version or plan.get("version", 0)
+        before = await _plan_version_content(plan["id"], from_version)
+        after = await _plan_version_content(plan["id"], to_version)
+        return FastJSONResponse(
+            {"success": True, "from": from_version, "to": to_version, "operations": diff(before, after)}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error diffing business plan versions: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/business-plan/versions/{version}")
+@api_router.get("/plans/{plan_id}/business-plan/versions/{version}")
+async def get_business_plan_version(version: int, request: Request, plan_id: str = Depends(plan_scope)):
+    """Get the plan content as it was at a past version"""
+    try:
+        plan = await _active_plan_ref(plan_id)
+        key = (plan["id"], version)
+        entry = plan_version_cache.get(key)
+        if entry is None:
+            content = await _plan_version_content(plan["id"], version)
+            body = dumps({"success": True, "version": version, "data": content})
+            entry = CachedBody(body, version=version)
+            plan_version_cache.put(key, entry)
+        return _cached_plan_response(request, entry)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching business plan version {version}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/business-plan/versions/{version}/restore")
+@api_router.post("/plans/{plan_id}/business-plan/versions/{version}/restore")
+async def restore_business_plan_version(version: int, plan_id: str = Depends(plan_scope)):
+    """Roll the plan back to a past version by writing it as a new version"""
+    try:
+        plan = await db_manager.get_business_plan(
+            projection={"_id": 0, "id": 1, "version": 1, "content": 1}, plan_id=plan_id
+        )
+        if not plan:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        current = plan.get("version", 0)
+        try:
+            content = normalize_content(await _plan_version_content(plan["id"], version))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Version {version} no longer fits the plan schema: {e.error_count()} errors")
+        update = {
+            "$set": {"content": content, "content_schema": content_schema(), "updated_at": datetime.utcnow()},
+            "$inc": {"version": 1}
+        }
+        delta = diff(plan.get("content", {}), content)
+        if not await db_manager.apply_plan_update(plan["id"], current, update, delta):
+            raise HTTPException(status_code=409, detail="Business plan is being changed concurrently, retry")
+        await event_hub.publish(plan_event("plan.restored", plan_id, current + 1, delta, restored=version))
+        return {"success": True, "version": current + 1, "restored": version}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error restoring business plan version {version}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/business-plan/{section_path:path}")
+@api_router.get("/plans/{plan_id}/business-plan/{section_path:path}")
+async def get_business_plan_section(section_path: str, request: Request, plan_id: str = Depends(plan_scope)):
+    """Get one section of the business plan, e.g. financial-data/ertug"""
+    try:
+        path = tuple(segment for segment in section_path.split("/") if segment)
+        return await _plan_sections_response(request, [path], nested=False, plan_id=plan_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching business plan section {section_path}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def _patch_plan_once(body, merge: bool, expected_version: Optional[int], plan_id: str) -> Optional[int]:
+    """Apply a patch to the stored plan; None means another write won the race"""
+    if merge:
+        paths = merge_patch_paths(body)
+    else:
+        ops = parse_json_patch(body)
+        paths = op_paths(ops)
+
+    plan = await db_manager.get_business_plan(
+        projection=projection_for_ops(paths + derivation_paths(paths)), plan_id=plan_id
+    )
+    if not plan:
+        raise HTTPException(status_code=404, detail="Business plan not found")
+    version = plan.get("version", 0)
+    if expected_version is not None and version != expected_version:
+        raise HTTPException(status_code=412, detail="Business plan has changed")
+
+    original = plan.get("content", {})
+    content = copy.deepcopy(original)
+    if merge:
+        ops = merge_patch_to_ops(body, content)
+    apply_ops(content, ops)
+    # Keep financials in step with their drivers
+    derived = derived_ops(paths, content)
+    apply_ops(content, derived)
+    update = build_update(ops + derived, original, content)
+    # History records what is stored, which validation may have coerced
+    delta = diff(original, apply_update(original, update))
+    if not delta:
+        # Only test operations, or values equal to the stored ones: nothing to write
+        return version
+    if not await db_manager.apply_plan_update(plan["id"], version, update, delta):
+        return None
+    await event_hub.publish(plan_event("plan.patched", plan_id, version + 1, delta))
+    return version + 1
+
+@api_router.patch("/business-plan")
+@api_router.patch("/plans/{plan_id}/business-plan")
+async def patch_business_plan(request: Request, plan_id: str = Depends(plan_scope)):
+    """Change part of the business plan with a JSON Patch or JSON Merge Patch.
+
+    Only the touched fields are validated and written. Send If-Match with the
+    ETag of GET /business-plan to fail with 412 instead of overwriting someone
+    else's change.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in ("application/json-patch+json", "application/merge-patch+json", "application/json"):
+        raise HTTPException(status_code=415, detail="Use application/json-patch+json or application/merge-patch+json")
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Patch body is not valid JSON")
+
+    try:
+        expected_version = None
+        if_match = request.headers.get("if-match")
+        if if_match and if_match.strip() != "*":
+            entry = await plan_caches.for_plan(plan_id).get_or_load("plan", lambda: _load_business_plan_body(plan_id))
+            if entry is None:
+                raise HTTPException(status_code=404, detail="Business plan not found")
+            if not set(parse_etags(if_match)) & set(encoded_etags(entry.etag)):
+                raise HTTPException(status_code=412, detail="Business plan has changed")
+            expected_version = entry.version
+
+        merge = content_type == "application/merge-patch+json"
+        for _ in range(1 if expected_version is not None else PATCH_RETRIES):
+            version = await _patch_plan_once(body, merge, expected_version, plan_id)
+            if version is not None:
+                return {"success": True, "version": version}
+        if expected_version is not None:
+            raise HTTPException(status_code=412, detail="Business plan has changed")
+        raise HTTPException(status_code=409, detail="Business plan is being changed concurrently, retry")
+    except PatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error patching business plan: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def _load_financials_body(plan_id: str) -> Optional[CachedBody]:
+    """Derive financials from the stored drivers and compare with stored totals"""
+    plan = await db_manager.get_business_plan(
+        projection={"_id": 0, "version": 1, "updated_at": 1, "created_at": 1, "content.financial_data": 1},
+        plan_id=plan_id
+    )
+    if not plan:
+        return None
+    financial_data = plan.get("content", {}).get("financial_data", {})
+    derived = derive_financials(financial_data)
+    drift = financials_drift(financial_data, derived)
+    data = {
+        stream: {"financials": rows, "in_sync": not drift[stream], "drift": drift[stream]}
+        for stream, rows in derived.items()
+    }
+    body = dumps({"success": True, "version": plan.get("version", 0), "data": data})
+    return CachedBody(body, _plan_last_modified(plan), plan.get("version", 0))
+
+@api_router.get("/events")
+@api_router.get("/plans/{plan_id}/events")
+async def stream_plan_events(request: Request, plan_id: str = Depends(plan_scope)):
+    """Stream a plan's change events as Server-Sent Events.
+
+    Plan events carry the new version and the JSON Patch that produced it, so
+    clients apply it instead of refetching. A resync event means events were
+    missed and the plan should be fetched again.
+    """
+    subscription = event_hub.subscribe(plan_id, request.headers.get("last-event-id"))
+
+    async def frames():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                yield await subscription.next_frame()
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        frames(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/financials/compute")
+@api_router.get("/plans/{plan_id}/financials/compute")
+async def compute_financials(request: Request, plan_id: str = Depends(plan_scope)):
+    """Compute sales, costs, gross, opex and EBITDA for every actor and year from the plan drivers"""
+    try:
+        entry = await plan_caches.for_plan(plan_id).get_or_load("financials", lambda: _load_financials_body(plan_id))
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        return _cached_plan_response(request, entry)
+    except HTTPException:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"Invalid financial drivers: {e}")
+        raise HTTPException(status_code=422, detail=f"Invalid financial drivers: {e}")
+    except Exception as e:
+        logging.error(f"Error computing financials: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/financials/simulate")
+@api_router.post("/plans/{plan_id}/financials/simulate")
+async def simulate_financials(simulation: SimulationRequest, plan_id: str = Depends(plan_scope)):
+    """Run Monte Carlo trials over the plan drivers.
+
+    Returns percentile bands of every P&L metric and the probability of
+    negative EBITDA per actor and year. The same seed gives the same result.
+    """
+    if not 1 <= simulation.trials <= MAX_SIMULATION_TRIALS:
+        raise HTTPException(status_code=422, detail=f"trials must be between 1 and {MAX_SIMULATION_TRIALS}")
+    if not simulation.percentiles or not all(0 <= p <= 100 for p in simulation.percentiles):
+        raise HTTPException(status_code=422, detail="percentiles must be between 0 and 100")
+    try:
+        drivers = validate_drivers({
+            name: spec.model_dump(exclude_none=True) for name, spec in simulation.drivers.items()
+        })
+        plan = await db_manager.get_business_plan(
+            projection={"_id": 0, "version": 1, "content.financial_data": 1}, plan_id=plan_id
+        )
+        if not plan:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        started = time.perf_counter()
+        result = await simulation_service.simulate(
+            plan.get("content", {}).get("financial_data", {}), drivers,
+            simulation.trials, simulation.seed, simulation.percentiles
+        )
+        return FastJSONResponse({
+            "success": True,
+            "version": plan.get("version", 0),
+            "trials": simulation.trials,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            **result
+        })
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error simulating financials: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/financials/sensitivity")
+@api_router.post("/plans/{plan_id}/financials/sensitivity")
+async def compute_sensitivity(grid: SensitivityRequest, request: Request, plan_id: str = Depends(plan_scope)):
+    """Sweep one or two drivers and return the EBITDA surface and break-even points.
+
+    Results are cached by plan version and grid spec.
+    """
+    axes = [axis.model_dump(exclude_none=True) for axis in grid.axes]
+    for axis in axes:
+        if "values" not in axis and ("start" not in axis or "stop" not in axis or axis["steps"] < 2):
+            raise HTTPException(status_code=422, detail=f"Axis {axis['driver']} needs values or start, stop and steps >= 2")
+    try:
+        plan = await db_manager.get_business_plan(
+            projection={"_id": 0, "version": 1, "content.financial_data": 1}, plan_id=plan_id
+        )
+        if not plan:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        version = plan.get("version", 0)
+        key = cache_key(plan_id, version, axes, grid.streams)
+        entry = sensitivity_cache.get(key)
+        if entry is None:
+            financial_data = plan.get("content", {}).get("financial_data", {})
+            # Large grids take tens of milliseconds; keep the event loop free
+            data = await run_in_threadpool(
+                lambda: grid_response(sensitivity_grid(financial_data, axes, grid.streams), axes)
+            )
+            body = dumps({"success": True, "version": version, **data})
+            entry = CachedBody(body, version=version)
+            sensitivity_cache.put(key, entry)
+        return _cached_plan_response(request, entry)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error computing sensitivity grid: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/customs/landed-cost")
+async def compute_landed_cost(quote: LandedCostRequest):
+    """Compute the customs landed cost of a batch of import lines.
+
+    The lines are treated as one shipment. Every line gets the per-unit
+    calculation table (CIF, duties, fees, OTV, final cost) and a line total.
+    """
+    if not 1 <= len(quote.lines) <= MAX_CUSTOMS_LINES:
+        raise HTTPException(status_code=422, detail=f"Send between 1 and {MAX_CUSTOMS_LINES} lines")
+    fx_rate = PLAN_FX_RATE if quote.fxRate is None else quote.fxRate
+    try:
+        lines = quote.lines
+        columns = landed_cost(
+            [line.hsCode for line in lines],
+            [line.fobUsd for line in lines],
+            [line.freightUsd for line in lines],
+            [line.insuranceUsd for line in lines],
+            [line.qty for line in lines],
+            fx_rate,
+            rates={code: rate.model_dump(by_alias=True) for code, rate in quote.rates.items()},
+            fees=quote.fees,
+            kkdf_rate=quote.kkdfRate,
+            bandrol=[line.bandrol for line in lines],
+            allocation=quote.allocation,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        line_totals, totals = shipment_totals(columns, [line.qty for line in lines], fx_rate)
+        keys = ("sku", "hs_code", "qty") + LANDED_COST_FIELDS + ("total_tl",)
+        values = [
+            [line.sku for line in lines], [line.hsCode for line in lines], [line.qty for line in lines],
+            *(columns[field].round(2).tolist() for field in LANDED_COST_FIELDS), line_totals.round(2).tolist()
+        ]
+        body = {
+            "success": True,
+            "fx_rate": fx_rate,
+            "allocation": quote.allocation,
+            "lines": [dict(zip(keys, row)) for row in zip(*values)],
+            "totals": totals,
+        }
+        # Large quotes: skip the generic encoder, every value is already JSON-native
+        return FastJSONResponse(body)
+    except Exception as e:
+        logging.error(f"Error computing landed cost: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/fx/rates")
+async def get_fx_rates(
+    base: str = Query(BASE_CURRENCY),
+    on: Optional[date] = Query(None, alias="date")
+):
+    """Exchange rates on a date: units of base per unit of each known currency"""
+    on = on or date.today()
+    try:
+        per_base = fx_table.rate(base, on)
+        rates = {currency: round(fx_table.rate(currency, on) / per_base, 6) for currency in fx_table.currencies()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"success": True, "base": normalize_currency(base), "date": on.isoformat(), "rates": rates})
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats():
+    """Report hit and miss counts for the business plan cache"""
+    return {
+        "success": True,
+        "plan_cache": plan_caches.stats(),
+        "image_metadata_cache": image_metadata_cache.stats(),
+        "sensitivity_cache": sensitivity_cache.stats(),
+        "plan_version_cache": plan_version_cache.stats()
+    }
+
+@api_router.get("/admin/events/stats")
+async def get_event_stats():
+    """Report change feed subscribers and event counts for this worker"""
+    return {"success": True, "events": event_hub.stats()}
+
+@api_router.get("/admin/images/reconcile")
+async def get_reconcile_report():
+    """Report the outcome of the last image reconciliation run"""
+    return FastJSONResponse({"success": True, "running": reconciler.running, "report": reconciler.last_report})
+
+@api_router.post("/admin/images/reconcile")
+async def run_reconcile(delete: bool = Query(False)):
+    """Compare image files with their records now; delete=true also removes orphans"""
+    try:
+        report = await reconciler.run(delete)
+        return FastJSONResponse({"success": True, "report": report})
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error reconciling images: {e}")
+        raise HTTPException(status_code=500, detail="Failed to reconcile images")
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status, attempts and result of a background job"""
+    try:
+        job = await db_manager.get_job(job_id)
+    except Exception as e:
+        logging.error(f"Error fetching job: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse({"success": True, "job": job})
+
+@api_router.get("/admin/jobs/stats")
+async def get_job_stats():
+    """Report job counts by status and this worker's job queue counters"""
+    try:
+        return FastJSONResponse({"success": True, "jobs": await db_manager.count_jobs(), "queue": job_queue.stats()})
+    except Exception as e:
+        logging.error(f"Error fetching job stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/admin/startup")
+async def get_startup_report():
+    """Report how long startup took per phase, and per module when STARTUP_PROFILE is on"""
+    return FastJSONResponse({"success": True, "startup": startup_profile.report()})
+
+@api_router.get("/admin/indexes")
+async def get_index_report():
+    """Report missing, undeclared and unused database indexes"""
+    return {"success": True, "indexes": await audit_indexes(get_database())}
+
+@api_router.get("/admin/db/pool")
+async def get_pool_stats():
+    """Report MongoDB connection pool usage and settings"""
+    return {"success": True, "pool": pool_stats.stats(), "options": client_options()}
+
+def _image_url(plan_id: str, image_id: str) -> str:
+    if plan_id == DEFAULT_PLAN_ID:
+        return f"/api/images/{image_id}"
+    return f"/api/plans/{plan_id}/images/{image_id}"
+
+async def _plan_image(image_id: str, plan_id: str) -> Optional[dict]:
+    """Image metadata, only if the image belongs to the plan"""
+    image_metadata = await db_manager.get_image_metadata(image_id)
+    if image_metadata and image_metadata.get("plan_id", DEFAULT_PLAN_ID) != plan_id:
+        return None
+    return image_metadata
+
+async def _store_upload(file: UploadFile) -> StoredUpload:
+    """Stream an upload into the blob store and take a reference to its blob"""
+    partial_path = blob_store.temp_path()
+    # Stream to a temporary file; identical content then shares one blob
+    stored = await stream_upload(file, partial_path)
+    try:
+        await db_manager.acquire_blob(stored.sha256, {
+            "extension": stored.extension,
+            "mimetype": stored.mimetype,
+            "size": stored.size,
+            "created_at": datetime.utcnow()
+        })
+    except Exception:
+        partial_path.unlink(missing_ok=True)
+        raise
+    try:
+        blob_store.commit(stored)
+    except Exception:
+        await _release_blob(stored.sha256, blob_store.blob_path(stored.sha256, stored.extension))
+        raise
+    return stored
+
+def _image_record(file_id: str, plan_id: str, image_type: str, item_id: Optional[str],
+                  file: UploadFile, stored: StoredUpload) -> dict:
+    return {
+        "id": file_id,
+        "plan_id": plan_id,
+        "type": image_type,
+        "item_id": item_id,
+        "filename": stored.path.name,
+        "original_name": file.filename,
+        "mimetype": stored.mimetype,
+        "size": stored.size,
+        "sha256": stored.sha256,
+        "path": str(stored.path),
+        "uploaded_at": datetime.utcnow()
+    }
+
+async def _publish_upload(record: dict):
+    await event_hub.publish(plan_event(
+        "image.uploaded", record["plan_id"], image_id=record["id"],
+        image_url=_image_url(record["plan_id"], record["id"]),
+        image_type=record["type"], item_id=record["item_id"]
+    ))
+
+async def _enqueue_processing(records: List[dict]) -> List[Optional[str]]:
+    """Queue post-upload processing; an upload never fails because of it"""
+    try:
+        return await job_queue.enqueue_many([("image.process", {"image_id": record["id"]}) for record in records])
+    except Exception as e:
+        logging.warning(f"Could not queue image processing: {e}")
+        return [None] * len(records)
+
+async def process_image(payload: dict) -> dict:
+    """Post-upload work for one image: read its dimensions and render common variants.
+
+    Variants are re-encoded without EXIF, which keeps camera metadata out of
+    what clients see while the original blob stays byte-identical and
+    shareable by content hash.
+    """
+    image_metadata = await db_manager.get_image_metadata(payload["image_id"])
+    if not image_metadata:
+        return {"skipped": "Image was deleted"}
+    file_path = Path(image_metadata["path"])
+    details = {"processed_at": datetime.utcnow()}
+    rendered = []
+    
+    dimensions = await run_in_threadpool(image_dimensions, file_path)
+    if dimensions:
+        details["width"], details["height"] = dimensions
+        fmt = SOURCE_FORMATS.get(image_metadata["mimetype"])
+        if fmt and fmt in variant_service.supported_formats():
+            key = image_metadata.get("sha256") or image_metadata["id"]
+            for width in VARIANT_PREWARM_WIDTHS:
+                width = snap_width(width)
+                if width < dimensions[0]:
+                    await variant_service.get_variant(file_path, key, width, fmt)
+                    rendered.append(f"w{width}.{fmt}")
+    
+    await db_manager.set_image_details(image_metadata["id"], details)
+    return {"width": details.get("width"), "height": details.get("height"), "variants": rendered}
+
+job_queue.register("image.process", process_image)
+
 @api_router.post("/images/upload", response_model=ImageUploadResponse)
+@api_router.post("/plans/{plan_id}/images/upload", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
     image_type: str = Form(...),  # "equipment", "emoped", "battery"
-    item_id: Optional[str] = Form(None)  # for equipment items
+    item_id: Optional[str] = Form(None),  # for equipment items
+    plan_id: str = Depends(plan_scope)
 ):
     """Upload an image for products"""
+    file_id = str(uuid.uuid4())
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        file_extension = Path(file.filename).suffix
-        filename = f"{file_id}{file_extension}"
-        file_path = UPLOAD_DIR / filename
-        
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
-        # Save metadata to database
-        image_data = {
-            "id": file_id,
-            "type": image_type,
-            "item_id": item_id,
-            "filename": filename,
-            "original_name": file.filename,
-            "mimetype": file.content_type,
-            "size": len(content),
-            "path": str(file_path),
-            "uploaded_at": datetime.utcnow()
-        }
-        
-        await db_manager.save_image_metadata(image_data)
+        stored = await _store_upload(file)
+        image_data = _image_record(file_id, plan_id, image_type, item_id, file, stored)
+        try:
+            # Save metadata to database
+            await db_manager.save_image_metadata(image_data)
+        except Exception:
+            await _release_blob(stored.sha256, stored.path)
+            raise
         
+        job_ids = await _enqueue_processing([image_data])
+        await _publish_upload(image_data)
         return ImageUploadResponse(
             success=True,
-            image_url=f"/api/images/{file_id}",
-            image_id=file_id
+            image_url=_image_url(plan_id, file_id),
+            image_id=file_id,
+            job_id=job_ids[0]
         )
         
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         logging.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload image")
 
+@api_router.post("/images/upload-batch", response_model=BatchImageUploadResponse)
+@api_router.post("/plans/{plan_id}/images/upload-batch", response_model=BatchImageUploadResponse)
+async def upload_images(
+    files: List[UploadFile] = File(...),
+    image_type: str = Form(...),  # "equipment", "emoped", "battery"
+    item_ids: List[str] = Form(None),  # one per file, in the same order
+    plan_id: str = Depends(plan_scope)
+):
+    """Upload several product images in one request.
+
+    Files are stored concurrently, UPLOAD_CONCURRENCY at a time, and their
+    metadata is written with a single insert. Each file succeeds or fails on
+    its own; the response lists the outcome for every file in order.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+    if item_ids is not None and len(item_ids) != len(files):
+        raise HTTPException(status_code=400, detail="item_ids must have one entry per file")
+    
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    
+    async def store(file: UploadFile):
+        async with semaphore:
+            try:
+                return await _store_upload(file)
+            except UploadRejected as e:
+                return e
+            except Exception as e:
+                logging.error(f"Error uploading image {file.filename}: {e}")
+                return e
+    
+    try:
+        outcomes = await asyncio.gather(*(store(file) for file in files))
+        
+        results = []
+        pending = []  # (result index, metadata record, stored upload)
+        for index, (file, outcome) in enumerate(zip(files, outcomes)):
+            if isinstance(outcome, StoredUpload):
+                item_id = item_ids[index] if item_ids else None
+                record = _image_record(str(uuid.uuid4()), plan_id, image_type, item_id, file, outcome)
+                pending.append((index, record, outcome))
+                results.append(ImageUploadResult(
+                    filename=file.filename, success=True,
+                    image_url=_image_url(plan_id, record["id"]), image_id=record["id"]
+                ))
+            else:
+                error = outcome.detail if isinstance(outcome, UploadRejected) else "Failed to upload image"
+                results.append(ImageUploadResult(filename=file.filename, success=False, error=error))
+        
+        failed_records = set()
+        try:
+            await db_manager.save_image_metadata_many([record for _, record, _ in pending])
+        except BulkWriteError as e:
+            # Unordered inserts keep going; only the reported documents are missing
+            failed_records = {error["index"] for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logging.error(f"Error saving batch image metadata: {e}")
+            failed_records = set(range(len(pending)))
+        
+        saved = []
+        for position, (index, record, stored) in enumerate(pending):
+            if position in failed_records:
+                await _release_blob(stored.sha256, stored.path)
+                results[index] = ImageUploadResult(
+                    filename=results[index].filename, success=False, error="Failed to upload image"
+                )
+            else:
+                saved.append((index, record))
+                await _publish_upload(record)
+        
+        job_ids = await _enqueue_processing([record for _, record in saved])
+        for (index, _), job_id in zip(saved, job_ids):
+            results[index].jobId = job_id
+        
+        uploaded = sum(1 for result in results if result.success)
+        return BatchImageUploadResponse(
+            success=uploaded == len(results),
+            uploaded=uploaded,
+            failed=len(results) - uploaded,
+            results=results
+        )
+        
+    except Exception as e:
+        logging.error(f"Error uploading images: {e}")
+        raise HTTPException(status_code=500, detail="Failed to upload images")
+
+def _image_summary(image_metadata: dict, plan_id: str) -> dict:
+    """Public metadata of an image, without its storage path"""
+    return {
+        "id": image_metadata["id"],
+        "type": image_metadata.get("type"),
+        "item_id": image_metadata.get("item_id"),
+        "original_name": image_metadata.get("original_name"),
+        "mimetype": image_metadata.get("mimetype"),
+        "size": image_metadata.get("size"),
+        "sha256": image_metadata.get("sha256"),
+        "uploaded_at": image_metadata.get("uploaded_at"),
+        "width": image_metadata.get("width"),
+        "height": image_metadata.get("height"),
+        "image_url": _image_url(plan_id, image_metadata["id"])
+    }
+
+@api_router.get("/images")
+@api_router.get("/plans/{plan_id}/images")
+async def get_images(
+    ids: Optional[str] = Query(None),  # comma separated image ids
+    image_type: Optional[str] = Query(None, alias="type"),  # "equipment", "emoped", "battery"
+    item_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None),  # the next value of the previous page
+    plan_id: str = Depends(plan_scope)
+):
+    """Resolve metadata for many images by id, or list a plan's images newest first"""
+    if ids is None:
+        return await _list_images(image_type, item_id, limit, after, plan_id)
+    image_ids = list(dict.fromkeys(image_id.strip() for image_id in ids.split(",") if image_id.strip()))
+    if not image_ids:
+        raise HTTPException(status_code=400, detail="ids must name at least one image")
+    if len(image_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    try:
+        found = await db_manager.get_images_metadata(image_ids)
+        data, missing = [], []
+        for image_id in image_ids:
+            image_metadata = found.get(image_id)
+            if image_metadata and image_metadata.get("plan_id", DEFAULT_PLAN_ID) == plan_id:
+                data.append(_image_summary(image_metadata, plan_id))
+            else:
+                missing.append(image_id)
+        return FastJSONResponse({"success": True, "data": data, "missing": missing})
+    except Exception as e:
+        logging.error(f"Error fetching images: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch images")
+
+async def _next_or_none(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def _list_images(image_type: Optional[str], item_id: Optional[str], limit: int,
+                       after: Optional[str], plan_id: str) -> Response:
+    """Stream one page of image metadata.
+
+    Documents are encoded as the cursor yields them and sent in groups of
+    IMAGE_LISTING_BATCH, so memory does not grow with the page size.
+    """
+    if item_id and not image_type:
+        raise HTTPException(status_code=400, detail="item_id can only be used together with type")
+    try:
+        position = decode_image_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    images = db_manager.get_images_by_type(image_type, item_id, plan_id, after=position, limit=limit)
+    try:
+        # Fetch the first batch up front, so a database error is still a 500
+        image = await _next_or_none(images)
+    except Exception as e:
+        logging.error(f"Error listing images: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list images")
+    
+    async def body(image):
+        yield b'{"success":true,"images":['
+        count = 0
+        last = None
+        chunk = []
+        try:
+            while image is not None:
+                chunk.append(dumps(_image_summary(image, plan_id)))
+                count += 1
+                last = image
+                if len(chunk) == IMAGE_LISTING_BATCH:
+                    yield (b"," if count > len(chunk) else b"") + b",".join(chunk)
+                    chunk = []
+                image = await _next_or_none(images)
+            if chunk:
+                yield (b"," if count > len(chunk) else b"") + b",".join(chunk)
+        finally:
+            await images.aclose()
+        following = encode_image_cursor(last) if count == limit else None
+        yield b'],"next":' + dumps(following) + b'}'
+    
+    return StreamingResponse(body(image), media_type="application/json")
+
+async def _release_blob(sha256: str, path: Path):
+    """Drop one reference to a blob and delete the file after the last one"""
+    remaining = await db_manager.release_blob(sha256)
+    if remaining <= 0:
+        await blob_store.remove(path, lambda: db_manager.delete_blob_if_unreferenced(sha256))
+
+def _image_etag(image_metadata: dict) -> str:
+    """Strong ETag for an image from the metadata stored at upload time"""
+    return etag_for_parts(
+        image_metadata["id"],
+        image_metadata.get("size"),
+        image_metadata.get("uploaded_at"),
+        image_metadata.get("sha256", ""),
+    )
+
 @api_router.get("/images/{image_id}")
-async def get_image(image_id: str):
-    """Serve an uploaded image"""
+@api_router.get("/plans/{plan_id}/images/{image_id}")
+async def get_image(
+    image_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=VARIANT_WIDTHS[-1]),  # variant width in pixels
+    fmt: Optional[str] = Query(None),  # "webp", "avif", "jpeg", "png" or "auto"
+    plan_id: str = Depends(plan_scope)
+):
+    """Serve an uploaded image, or a resized variant of it"""
     try:
-        image_metadata = await db_manager.get_image_metadata(image_id)
+        image_metadata = await _plan_image(image_id, plan_id)
         if not image_metadata:
             raise HTTPException(status_code=404, detail="Image not found")
         
+        etag = _image_etag(image_metadata)
+        last_modified = image_metadata.get("uploaded_at")
+        if not isinstance(last_modified, datetime):
+            last_modified = None
+        
+        variant = None
+        if (w or fmt) and variant_service.enabled:
+            try:
+                variant_fmt = variant_service.negotiate_format(
+                    fmt, request.headers.get("accept", ""), image_metadata["mimetype"]
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            variant = (snap_width(w or VARIANT_WIDTHS[-1]), variant_fmt)
+        
+        headers = validator_headers(
+            etag_for_parts(etag, *variant) if variant else etag, last_modified, IMAGE_CACHE_CONTROL
+        )
+        if fmt == "auto":
+            headers["Vary"] = "Accept"
+        if is_not_modified(request, headers["ETag"], last_modified):
+            return not_modified_response(headers)
+        
+        # Open before responding, so a file deleted since the lookup is a 404
+        # rather than an aborted response
         file_path = Path(image_metadata["path"])
-        if not file_path.exists():
+        try:
+            original = await open_regular_file(file_path)
+        except FileNotFoundError:
+            image_metadata_cache.pop(image_id)
             raise HTTPException(status_code=404, detail="Image file not found")
         
-        return FileResponse(
-            file_path,
+        if variant:
+            key = image_metadata.get("sha256") or image_metadata["id"]
+            try:
+                variant_path, media_type = await variant_service.get_variant(file_path, key, *variant)
+                opened = await open_regular_file(variant_path)
+            except Exception as e:
+                logging.warning(f"Serving original for image {image_id}, variant failed: {e}")
+                headers["ETag"] = etag
+            except BaseException:
+                original[0].close()
+                raise
+            else:
+                original[0].close()
+                return RangeFileResponse(opened, request.headers, media_type, headers)
+        
+        return RangeFileResponse(
+            original,
+            request.headers,
             media_type=image_metadata["mimetype"],
+            headers=headers,
             filename=image_metadata["original_name"]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error serving image: {e}")
         raise HTTPException(status_code=500, detail="Failed to serve image")
 
 @api_router.delete("/images/{image_id}")
-async def delete_image(image_id: str):
+@api_router.delete("/plans/{plan_id}/images/{image_id}")
+async def delete_image(image_id: str, plan_id: str = Depends(plan_scope)):
     """Delete an uploaded image"""
     try:
-        image_metadata = await db_manager.get_image_metadata(image_id)
+        image_metadata = await _plan_image(image_id, plan_id)
         if not image_metadata:
             raise HTTPException(status_code=404, detail="Image not found")
         
-        # Delete file from disk
+        # Delete metadata first so a concurrent delete cannot release twice
+        if not await db_manager.delete_image_metadata(image_id):
+            raise HTTPException(status_code=404, detail="Image not found")
+        
         file_path = Path(image_metadata["path"])
-        if file_path.exists():
+        if image_metadata.get("sha256") and file_path.is_relative_to(blob_store.blob_dir):
+            await _release_blob(image_metadata["sha256"], file_path)
+        elif file_path.exists():
+            # Uploads stored before content addressing own their file
             file_path.unlink()
         
-        # Delete metadata from database
-        await db_manager.delete_image_metadata(image_id)
-        
+        await event_hub.publish(plan_event("image.deleted", plan_id, image_id=image_id))
         return {"success": True, "message": "Image deleted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error deleting image: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete image")
@@ -149,6 +1209,10 @@ async def delete_image(image_id: str):
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(UploadSizeLimitMiddleware)
+
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from financials import METRICS, SCENARIO_DRIVERS, apply_scenario, compute_pnl, driver_matrix
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Trials per worker task; results depend only on the seed, never on the worker count
+SIMULATION_CHUNK_SIZE = int(os.environ.get("SIMULATION_CHUNK_SIZE", "50000"))
+MAX_SIMULATION_TRIALS = int(os.environ.get("MAX_SIMULATION_TRIALS", "5000000"))
+SIMULATION_WORKERS = int(os.environ.get("SIMULATION_WORKERS", str(os.cpu_count() or 1)))
+
+def _sample(rng: np.random.Generator, spec: dict, size: int) -> np.ndarray:
+    """Draw size values from one Distribution spec"""
+    kind = spec.get("kind", "fixed")
+    if kind == "fixed":
+        return np.full(size, spec["value"], dtype=np.float64)
+    if kind == "normal":
+        return rng.normal(spec["mean"], spec["sd"], size)
+    if kind == "lognormal":
+        # Parameterized by the mean and sd of the value itself
+        mean, sd = spec["mean"], spec["sd"]
+        sigma2 = np.log1p((sd / mean) ** 2)
+        return rng.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), size)
+    if kind == "uniform":
+        return rng.uniform(spec["low"], spec["high"], size)
+    if kind == "triangular":
+        return rng.triangular(spec["low"], spec["mode"], spec["high"], size)
+    raise ValueError(f"Unknown distribution kind: {kind}")
+
+
+def validate_drivers(drivers: Dict[str, dict]) -> Dict[str, dict]:
+    """Check distribution specs up front so workers never see a bad one"""
+    unknown = set(drivers) - set(SCENARIO_DRIVERS)
+    if unknown:
+        raise ValueError(f"Unknown drivers: {', '.join(sorted(unknown))}")
+    rng = np.random.default_rng(0)
+    for name, spec in drivers.items():
+        try:
+            sample = _sample(rng, spec, 1)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Incomplete distribution for {name}: missing {e}")
+        if not np.isfinite(sample).all():
+            raise ValueError(f"Invalid distribution for {name}")
+    return drivers
+
+
+def _simulate_chunk(base: np.ndarray, streams: List[str], drivers: Dict[str, dict],
+                    seed: np.random.SeedSequence, trials: int, percentiles: List[float]) -> dict:
+    """Run one batch of trials; runs inside a worker process.
+
+    base is the (rows, COLUMNS) driver matrix and streams the stream of each
+    row. Returns sums, percentiles and negative EBITDA counts for merging.
+    """
+    rng = np.random.default_rng(seed)
+    factors = {name: np.clip(_sample(rng, spec, trials), 0, None) for name, spec in drivers.items()}
+    matrix = np.broadcast_to(apply_scenario(base, streams, factors), (trials,) + base.shape)
+    results = compute_pnl(matrix)  # (trials, rows, METRICS)
+    return {
+        "trials": trials,
+        "sum": results.sum(axis=0),
+        "percentiles": np.percentile(results, percentiles, axis=0),
+        "negative_ebitda": (results[..., METRICS.index("ebitda")] < 0).sum(axis=0),
+    }
+
+
+class SimulationService:
+    """Runs Monte Carlo trials of the plan drivers across a process pool.
+
+    Trials are split into fixed-size chunks, each seeded from its own child of
+    one SeedSequence, so a seed reproduces the same result on any machine.
+    Chunk percentiles are averaged into the reported bands; with equal-sized
+    chunks of tens of thousands of trials the difference from exact percentiles
+    is far below the sampling noise.
+    """
+
+    def __init__(self, max_workers: int = SIMULATION_WORKERS, chunk_size: int = SIMULATION_CHUNK_SIZE):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def simulate(self, financial_data: dict, drivers: Dict[str, dict], trials: int,
+                       seed: Optional[int], percentiles: List[float]) -> dict:
+        labels, base = driver_matrix(financial_data)
+        if not labels:
+            raise ValueError("Business plan has no financial drivers")
+        streams = [stream for stream, _ in labels]
+
+        if seed is None:
+            # Small enough to survive a round trip through JavaScript numbers
+            seed = secrets.randbits(53)
+        seed_sequence = np.random.SeedSequence(seed)
+        sizes = [self.chunk_size] * (trials // self.chunk_size)
+        if trials % self.chunk_size:
+            sizes.append(trials % self.chunk_size)
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(executor, _simulate_chunk, base, streams, drivers, child, size, percentiles)
+            for child, size in zip(seed_sequence.spawn(len(sizes)), sizes)
+        ))
+
+        weights = np.array([chunk["trials"] for chunk in chunks], dtype=np.float64)
+        mean = sum(chunk["sum"] for chunk in chunks) / trials
+        bands = np.tensordot(weights / trials, np.stack([chunk["percentiles"] for chunk in chunks]), axes=1)
+        negative = sum(chunk["negative_ebitda"] for chunk in chunks) / trials
+
+        results: Dict[str, list] = {}
+        for row, (stream, year) in enumerate(labels):
+            entry = {"year": year, "prob_negative_ebitda": float(negative[row])}
+            for m, metric in enumerate(METRICS):
+                entry[metric] = {"mean": float(mean[row, m])}
+                for p, percentile in enumerate(percentiles):
+                    entry[metric][f"p{percentile:g}"] = float(bands[p, row, m])
+            results.setdefault(stream, []).append(entry)
+        return {"seed": seed, "chunks": len(sizes), "results": results}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking would copy the event loop and the Mongo client's threads
+            # and locks into the workers, which can deadlock them
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info("Simulation workers stopped")
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Time every module imported during startup; costs a little on each import, so off by default
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "false").lower() in ("1", "true", "yes")
+# Modules listed in the startup report, slowest first
+STARTUP_PROFILE_LIMIT = int(os.environ.get("STARTUP_PROFILE_LIMIT", "25"))
+
+
+class _TimedLoader:
+    """Wraps a module loader to time exec_module, delegating everything else"""
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._profiler._stack
+        if not stack:
+            self._profiler.roots.append(module.__name__)
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self._profiler.timings[module.__name__] = (elapsed, elapsed - nested)
+
+
+class ImportProfiler(MetaPathFinder):
+    """Records how long each module takes to import, as python -X importtime does.
+
+    Installed first on sys.meta_path, it lets the real finders locate each
+    module and wraps the loader they return. Cumulative time includes the
+    modules a module imports itself; self time does not.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        # Modules imported from outside any profiled module; their cumulative times add up
+        self.roots: List[str] = []
+        self._stack: List[float] = []
+        self._finding = False
+
+    @property
+    def installed(self) -> bool:
+        return self in sys.meta_path
+
+    def install(self):
+        if not self.installed:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self.installed:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def report(self, limit: int = STARTUP_PROFILE_LIMIT) -> dict:
+        """Slowest modules by cumulative time, and self time summed per top-level package"""
+        packages: Dict[str, float] = {}
+        for name, (_, own) in self.timings.items():
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + own
+        modules = sorted(self.timings.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return {
+            "count": len(self.timings),
+            "total_ms": _ms(sum(self.timings[name][0] for name in self.roots if name in self.timings)),
+            "modules": [
+                {"module": name, "cumulative_ms": _ms(total), "self_ms": _ms(own)} for name, (total, own) in modules
+            ],
+            "packages": [
+                {"package": name, "self_ms": _ms(own)}
+                for name, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+            ],
+        }
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class StartupProfile:
+    """Durations of the startup phases, and of imports when profiling is on"""
+
+    def __init__(self, profile_imports: bool = STARTUP_PROFILE):
+        self.started = time.perf_counter()
+        self.ready_after: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.imports = ImportProfiler() if profile_imports else None
+        if self.imports is not None:
+            self.imports.install()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def ready(self):
+        """Mark the app as ready to serve; later imports are no longer timed"""
+        self.ready_after = time.perf_counter() - self.started
+        if self.imports is not None:
+            self.imports.uninstall()
+            report = self.imports.report(limit=10)
+            slowest = ", ".join(f"{item['module']} {item['cumulative_ms']}ms" for item in report["modules"])
+            logging.info(f"Imported {report['count']} modules in {report['total_ms']}ms; slowest: {slowest}")
+        logging.info(f"Ready to serve after {_ms(self.ready_after)}ms")
+
+    def report(self) -> dict:
+        return {
+            "ready_ms": _ms(self.ready_after) if self.ready_after is not None else None,
+            "phases": {name: _ms(seconds) for name, seconds in self.phases.items()},
+            "imports": self.imports.report() if self.imports is not None else None,
+        }
+
+
+startup_profile = StartupProfile()
+
+
+async def _main() -> int:
+    import server
+
+    async with server.lifespan(server.app):
+        pass
+    print(json.dumps(server.startup_profile.report(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    # Import the app and run its startup once with every import timed
+    os.environ["STARTUP_PROFILE"] = "true"
+    sys.exit(asyncio.run(_main()))
@@ -5,11 +5,17 @@ Tests all backend endpoints and database operations
 """
 
 import requests
+import csv
+import hashlib
 import json
 import os
 import tempfile
 from pathlib import Path
 import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from typing import Dict, Any
 
 # Get backend URL from frontend .env file
@@ -24,6 +30,11 @@ def get_backend_url():
 
 BASE_URL = get_backend_url()
 API_BASE = f"{BASE_URL}/api"
+# Must match the backend's MAX_UPLOAD_SIZE
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+# Pool settings the backend is expected to run with, same defaults as database.client_options
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE") or 100)
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE") or 0)
 
 class BackendTester:
     def __init__(self):
@@ -133,6 +144,644 @@ class BackendTester:
             self.log_test("Business Plan API", False, f"Request error: {str(e)}")
             return False
     
+    def test_business_plan_cache(self):
+        """Test that repeated plan reads are served from the cache"""
+        try:
+            before = self.session.get(f"{API_BASE}/admin/cache/stats").json()["plan_cache"]
+            first = self.session.get(f"{API_BASE}/business-plan")
+            second = self.session.get(f"{API_BASE}/business-plan")
+            after = self.session.get(f"{API_BASE}/admin/cache/stats").json()["plan_cache"]
+            
+            if first.content != second.content:
+                self.log_test("Business Plan Cache", False, "Repeated reads returned different bodies")
+                return False
+            
+            if after["hits"] <= before["hits"]:
+                self.log_test("Business Plan Cache", False, 
+                            "Hit count did not increase on repeated reads", {"before": before, "after": after})
+                return False
+            
+            self.log_test("Business Plan Cache", True, 
+                        f"Repeated reads served from cache, hits: {after['hits']}, misses: {after['misses']}")
+            return True
+            
+        except Exception as e:
+            self.log_test("Business Plan Cache", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_conditional_get(self):
+        """Test ETag revalidation of the business plan"""
+        try:
+            response = self.session.get(f"{API_BASE}/business-plan")
+            etag = response.headers.get("ETag")
+            if not etag:
+                self.log_test("Conditional GET", False, "Missing ETag header", {"headers": dict(response.headers)})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/business-plan", headers={"If-None-Match": etag})
+            if response.status_code != 304:
+                self.log_test("Conditional GET", False, 
+                            f"Expected 304 for matching ETag, got HTTP {response.status_code}")
+                return False
+            
+            response = self.session.get(f"{API_BASE}/business-plan", headers={"If-None-Match": '"stale"'})
+            if response.status_code != 200:
+                self.log_test("Conditional GET", False, 
+                            f"Expected 200 for stale ETag, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Conditional GET", True, f"Plan revalidated with ETag {etag}")
+            return True
+            
+        except Exception as e:
+            self.log_test("Conditional GET", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_response_compression(self):
+        """Test that the plan is compressed when asked and revalidates per encoding"""
+        try:
+            identity = self.session.get(f"{API_BASE}/business-plan", headers={"Accept-Encoding": "identity"})
+            response = self.session.get(f"{API_BASE}/business-plan", headers={"Accept-Encoding": "gzip"}, stream=True)
+            wire = response.raw.read(decode_content=False)
+            if response.status_code != 200 or response.headers.get("Content-Encoding") != "gzip":
+                self.log_test("Response Compression", False, f"HTTP {response.status_code}", 
+                            {"content_encoding": response.headers.get("Content-Encoding")})
+                return False
+            
+            if "accept-encoding" not in response.headers.get("Vary", "").lower():
+                self.log_test("Response Compression", False, "Vary does not list Accept-Encoding")
+                return False
+            
+            etag = response.headers.get("ETag")
+            if etag == identity.headers.get("ETag"):
+                self.log_test("Response Compression", False, "Encodings share one ETag", {"etag": etag})
+                return False
+            
+            revalidated = self.session.get(f"{API_BASE}/business-plan", 
+                                         headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+            if revalidated.status_code != 304:
+                self.log_test("Response Compression", False, 
+                            f"Expected 304 for the gzip ETag, got HTTP {revalidated.status_code}")
+                return False
+            
+            ratio = len(identity.content) / len(wire)
+            self.log_test("Response Compression", True, 
+                        f"{len(identity.content)} bytes sent as {len(wire)} gzip bytes ({ratio:.1f}x)")
+            return True
+            
+        except Exception as e:
+            self.log_test("Response Compression", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_business_plan_sections(self):
+        """Test section endpoints and fields projection"""
+        try:
+            response = self.session.get(f"{API_BASE}/business-plan/financial-data/ertug")
+            if response.status_code != 200:
+                self.log_test("Business Plan Sections", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            section = response.json().get("data", {})
+            if "financials" not in section or "investments" not in section:
+                self.log_test("Business Plan Sections", False, 
+                            "Ertug section missing financials or investments", {"response": section})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/business-plan", params={"fields": "risks"})
+            data = response.json().get("data", {})
+            if list(data.keys()) != ["risks"]:
+                self.log_test("Business Plan Sections", False, 
+                            "Fields projection returned unexpected sections", {"sections": list(data.keys())})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/business-plan/not-a-section")
+            if response.status_code != 404:
+                self.log_test("Business Plan Sections", False, 
+                            f"Expected 404 for unknown section, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Business Plan Sections", True, "Section and fields reads returned only the requested data")
+            return True
+            
+        except Exception as e:
+            self.log_test("Business Plan Sections", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_business_plan_patch(self):
+        """Test JSON Patch updates with If-Match concurrency control"""
+        try:
+            response = self.session.get(f"{API_BASE}/business-plan")
+            etag = response.headers.get("ETag")
+            risk_count = len(response.json().get("data", {}).get("risks", []))
+            headers = {"Content-Type": "application/json-patch+json", "If-Match": etag}
+            patch = [{"op": "add", "path": "/risks/-", "value": {"category": "Test", "risk": "Patch test risk"}}]
+            
+            response = self.session.patch(f"{API_BASE}/business-plan", json=patch, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Business Plan Patch", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            version = response.json()["version"]
+            
+            # A patch that changes nothing leaves the version alone
+            check = [{"op": "test", "path": f"/risks/{risk_count}/risk", "value": "Patch test risk"}]
+            response = self.session.patch(f"{API_BASE}/business-plan", json=check,
+                                          headers={"Content-Type": "application/json-patch+json"})
+            if response.status_code != 200 or response.json()["version"] != version:
+                self.log_test("Business Plan Patch", False, 
+                            "A test-only patch created a version", {"response": response.text})
+                return False
+            
+            # The same ETag is now stale
+            response = self.session.patch(f"{API_BASE}/business-plan", json=patch, headers=headers)
+            if response.status_code != 412:
+                self.log_test("Business Plan Patch", False, 
+                            f"Expected 412 for stale If-Match, got HTTP {response.status_code}")
+                return False
+            
+            # Put the plan back as it was
+            cleanup = [
+                {"op": "test", "path": f"/risks/{risk_count}/risk", "value": "Patch test risk"},
+                {"op": "remove", "path": f"/risks/{risk_count}"}
+            ]
+            response = self.session.patch(f"{API_BASE}/business-plan", json=cleanup,
+                                          headers={"Content-Type": "application/json-patch+json"})
+            if response.status_code != 200:
+                self.log_test("Business Plan Patch", False, 
+                            f"Cleanup failed with HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            self.log_test("Business Plan Patch", True, "Patch applied and stale If-Match rejected")
+            return True
+            
+        except Exception as e:
+            self.log_test("Business Plan Patch", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_business_plan_versions(self):
+        """Test plan history: listing, reading and diffing versions"""
+        try:
+            response = self.session.get(f"{API_BASE}/business-plan/versions")
+            if response.status_code != 200:
+                self.log_test("Business Plan Versions", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            history = response.json()
+            versions = history.get("versions", [])
+            if not versions or versions[0]["version"] != history.get("current"):
+                self.log_test("Business Plan Versions", False, 
+                            "History does not reach the current version", {"history": history})
+                return False
+            
+            current = history["current"]
+            response = self.session.get(f"{API_BASE}/business-plan/versions/{current}")
+            plan = self.session.get(f"{API_BASE}/business-plan").json()
+            if response.status_code != 200 or response.json()["data"]["risks"] != plan["data"]["risks"]:
+                self.log_test("Business Plan Versions", False, 
+                            "Current version does not match the active plan", {"status": response.status_code})
+                return False
+            
+            oldest = versions[-1]["version"]
+            response = self.session.get(f"{API_BASE}/business-plan/versions/diff", 
+                                      params={"from": oldest, "to": current})
+            if response.status_code != 200 or not isinstance(response.json().get("operations"), list):
+                self.log_test("Business Plan Versions", False, 
+                            f"Diff failed with HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            changes = len(response.json()["operations"])
+            self.log_test("Business Plan Versions", True, 
+                        f"{len(versions)} versions, {changes} changes since version {oldest}")
+            return True
+            
+        except Exception as e:
+            self.log_test("Business Plan Versions", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_patch_history_coercion(self):
+        """Test that a version written by a patch holds the validated values the plan stores"""
+        headers = {"Content-Type": "application/json-patch+json"}
+        try:
+            ertug = self.session.get(f"{API_BASE}/business-plan").json()["data"]["financial_data"]["ertug"]
+            count = len(ertug["investments"])
+            units = ertug["production"][0]["units"]
+            patch = [
+                {"op": "add", "path": "/financial_data/ertug/investments/-", "value": {"item": "Coercion test", "amount": "5.000 USD"}},
+                {"op": "replace", "path": "/financial_data/ertug/production/0/units", "value": str(units + 1)}
+            ]
+            response = self.session.patch(f"{API_BASE}/business-plan", json=patch, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Patch History Coercion", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            version = response.json()["version"]
+            plan = self.session.get(f"{API_BASE}/business-plan").json()["data"]
+            stored = self.session.get(f"{API_BASE}/business-plan/versions/{version}").json()["data"]
+            
+            cleanup = [
+                {"op": "test", "path": f"/financial_data/ertug/investments/{count}/item", "value": "Coercion test"},
+                {"op": "remove", "path": f"/financial_data/ertug/investments/{count}"},
+                {"op": "replace", "path": "/financial_data/ertug/production/0/units", "value": units}
+            ]
+            self.session.patch(f"{API_BASE}/business-plan", json=cleanup, headers=headers)
+            
+            if stored != plan:
+                self.log_test("Patch History Coercion", False, "Version differs from the stored plan",
+                            {"investment": stored["financial_data"]["ertug"]["investments"][count:]})
+                return False
+            
+            investment = plan["financial_data"]["ertug"]["investments"][count]
+            self.log_test("Patch History Coercion", True, f"Version {version} matches the plan",
+                        {"amount": investment["amount"], "currency": investment["currency"]})
+            return True
+            
+        except Exception as e:
+            self.log_test("Patch History Coercion", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_plan_scoped_routes(self):
+        """Test that plans under /plans/{plan_id} are isolated from each other"""
+        try:
+            plan_id = f"test-plan-{uuid.uuid4().hex[:8]}"
+            response = self.session.post(f"{API_BASE}/plans", json={"id": plan_id})
+            if response.status_code != 201:
+                self.log_test("Plan Scoped Routes", False, 
+                            f"Create failed with HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            patch = [{"op": "replace", "path": "/risks/0/risk", "value": "Scoped risk"}]
+            response = self.session.patch(f"{API_BASE}/plans/{plan_id}/business-plan", json=patch,
+                                        headers={"Content-Type": "application/json-patch+json"})
+            if response.status_code != 200:
+                self.log_test("Plan Scoped Routes", False, 
+                            f"Patch failed with HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            scoped = self.session.get(f"{API_BASE}/plans/{plan_id}/business-plan/risks").json()["data"]
+            default = self.session.get(f"{API_BASE}/business-plan/risks").json()["data"]
+            if scoped[0]["risk"] != "Scoped risk" or default[0]["risk"] == "Scoped risk":
+                self.log_test("Plan Scoped Routes", False, 
+                            "Patch was not isolated to its plan", {"scoped": scoped[0], "default": default[0]})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/plans/missing-{plan_id}/business-plan")
+            if response.status_code != 404:
+                self.log_test("Plan Scoped Routes", False, 
+                            f"Expected 404 for unknown plan, got HTTP {response.status_code}")
+                return False
+            
+            # Racing creates of one id: exactly one wins, the others conflict
+            racing_id = f"test-plan-{uuid.uuid4().hex[:8]}"
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                statuses = sorted(pool.map(
+                    lambda _: self.session.post(f"{API_BASE}/plans", json={"id": racing_id}).status_code, range(4)
+                ))
+            if statuses != [201, 409, 409, 409]:
+                self.log_test("Plan Scoped Routes", False, "Concurrent creates did not conflict cleanly",
+                            {"statuses": statuses})
+                return False
+            
+            self.log_test("Plan Scoped Routes", True, f"Plan {plan_id} created and patched in isolation")
+            return True
+            
+        except Exception as e:
+            self.log_test("Plan Scoped Routes", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_change_feed(self):
+        """Test that a plan patch is pushed to Server-Sent Events subscribers"""
+        try:
+            stream = self.session.get(f"{API_BASE}/events", stream=True, timeout=10)
+            if stream.status_code != 200 or not stream.headers.get("Content-Type", "").startswith("text/event-stream"):
+                self.log_test("Change Feed", False, f"HTTP {stream.status_code}", 
+                            {"content_type": stream.headers.get("Content-Type")})
+                return False
+            
+            plan = self.session.get(f"{API_BASE}/business-plan").json()
+            units = plan["data"]["financial_data"]["ertug"]["production"][0]["units"]
+            headers = {"Content-Type": "application/json-patch+json"}
+            # Sent as text: the event must carry the number the plan stores
+            path = "/financial_data/ertug/production/0/units"
+            patch = [{"op": "replace", "path": path, "value": str(units + 1)}]
+            response = self.session.patch(f"{API_BASE}/business-plan", json=patch, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Change Feed", False, f"Patch failed with HTTP {response.status_code}")
+                return False
+            
+            event, event_id = None, None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line and line.startswith("id:"):
+                    event_id = line[len("id:"):].strip()
+                if line and line.startswith("data:"):
+                    event = json.loads(line[len("data:"):])
+                    break
+            stream.close()
+            
+            patch = [{"op": "replace", "path": path, "value": units}]
+            self.session.patch(f"{API_BASE}/business-plan", json=patch, headers=headers)
+            
+            if not event or event.get("type") != "plan.patched" or event.get("version") != response.json()["version"]:
+                self.log_test("Change Feed", False, "No matching plan.patched event", {"event": event})
+                return False
+            
+            # The id is assigned by the publishing worker, so every worker replays by the same one
+            if not event_id or event.get("id") != event_id:
+                self.log_test("Change Feed", False, "Event id is not the one the publisher assigned",
+                            {"id": event_id, "event": event})
+                return False
+            
+            changed = [op.get("value") for op in event.get("patch") or [] if op["path"] == path]
+            if changed != [units + 1]:
+                self.log_test("Change Feed", False, "Event patch differs from the stored value", {"values": changed})
+                return False
+            
+            self.log_test("Change Feed", True, f"Received version {event['version']} with {len(event.get('patch') or [])} operations")
+            return True
+            
+        except Exception as e:
+            self.log_test("Change Feed", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_change_feed_resync(self):
+        """Test that a Last-Event-ID no worker has seen is answered with a resync"""
+        try:
+            stream = self.session.get(f"{API_BASE}/events", stream=True, timeout=10,
+                                      headers={"Last-Event-ID": f"{uuid.uuid4().hex[:12]}-1"})
+            event_type = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line and line.startswith("event:"):
+                    event_type = line[len("event:"):].strip()
+                    break
+            stream.close()
+            
+            if event_type != "resync":
+                self.log_test("Change Feed Resync", False, f"Expected a resync event, got {event_type}")
+                return False
+            
+            self.log_test("Change Feed Resync", True, "Unknown Last-Event-ID told to refetch the plan")
+            return True
+            
+        except Exception as e:
+            self.log_test("Change Feed Resync", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_financials_compute(self):
+        """Test that stored financials match the totals derived from drivers"""
+        try:
+            response = self.session.get(f"{API_BASE}/financials/compute")
+            if response.status_code != 200:
+                self.log_test("Financials Compute", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            data = response.json().get("data", {})
+            for stream in ["ertug", "fiyuu_sales", "fiyuu_swap"]:
+                if stream not in data:
+                    self.log_test("Financials Compute", False, f"Missing derived financials for {stream}")
+                    return False
+                for row in data[stream]["financials"]:
+                    if row["gross"] != row["sales"] - row["costs"]:
+                        self.log_test("Financials Compute", False, 
+                                    f"Gross profit does not add up for {stream} {row['year']}", {"row": row})
+                        return False
+                if not data[stream]["in_sync"]:
+                    self.log_test("Financials Compute", False, 
+                                f"Stored financials drift from drivers for {stream}", {"drift": data[stream]["drift"]})
+                    return False
+            
+            self.log_test("Financials Compute", True, "Derived financials match stored totals for all actors")
+            return True
+            
+        except Exception as e:
+            self.log_test("Financials Compute", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_financials_scale_with_volume(self):
+        """Test that derived totals scale with units and a discount above the price is rejected"""
+        headers = {"Content-Type": "application/json-patch+json"}
+        try:
+            driver = self.session.get(f"{API_BASE}/business-plan").json()["data"]["financial_data"]["ertug"]["production"][0]
+            response = self.session.patch(f"{API_BASE}/business-plan", headers=headers,
+                                          json=[{"op": "replace", "path": "/financial_data/ertug/production/0/units", "value": 1}])
+            if response.status_code != 200:
+                self.log_test("Financials Scale With Volume", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            try:
+                row = self.session.get(f"{API_BASE}/financials/compute").json()["data"]["ertug"]["financials"][0]
+            finally:
+                self.session.patch(f"{API_BASE}/business-plan", headers=headers,
+                                   json=[{"op": "replace", "path": "/financial_data/ertug/production/0/units", "value": driver["units"]}])
+            
+            # One unit sells at its net price and costs its unit cost; no fixed plugs remain
+            expected = {"sales": driver["price"] - driver.get("discount", 0), "costs": driver["cost"]}
+            if {metric: row[metric] for metric in expected} != expected:
+                self.log_test("Financials Scale With Volume", False, "One unit does not give per-unit totals",
+                            {"row": row, "expected": expected})
+                return False
+            
+            response = self.session.patch(f"{API_BASE}/business-plan", headers=headers, json=[
+                {"op": "replace", "path": "/financial_data/ertug/production/0/discount", "value": driver["price"] + 1}
+            ])
+            if response.status_code != 422:
+                self.log_test("Financials Scale With Volume", False, 
+                            f"Expected 422 for a discount above the price, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Financials Scale With Volume", True, f"One unit sells for {row['sales']} TL")
+            return True
+            
+        except Exception as e:
+            self.log_test("Financials Scale With Volume", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_financials_simulate(self):
+        """Test Monte Carlo simulation bands and seeded reproducibility"""
+        try:
+            payload = {
+                "trials": 20000,
+                "seed": 12345,
+                "drivers": {
+                    "fx_rate": {"kind": "normal", "mean": 45, "sd": 3},
+                    "units": {"kind": "triangular", "low": 0.7, "mode": 1.0, "high": 1.1}
+                }
+            }
+            response = self.session.post(f"{API_BASE}/financials/simulate", json=payload)
+            if response.status_code != 200:
+                self.log_test("Financials Simulate", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            first = response.json()
+            ertug = first.get("results", {}).get("ertug", [])
+            if not ertug or not (ertug[0]["ebitda"]["p5"] <= ertug[0]["ebitda"]["p50"] <= ertug[0]["ebitda"]["p95"]):
+                self.log_test("Financials Simulate", False, "Percentile bands missing or out of order", {"ertug": ertug})
+                return False
+            if not 0 <= ertug[0]["prob_negative_ebitda"] <= 1:
+                self.log_test("Financials Simulate", False, "Probability of negative EBITDA out of range")
+                return False
+            
+            second = self.session.post(f"{API_BASE}/financials/simulate", json=payload).json()
+            if second.get("results") != first.get("results"):
+                self.log_test("Financials Simulate", False, "Same seed produced different results")
+                return False
+            
+            self.log_test("Financials Simulate", True, f"Simulation reproducible in {first.get('elapsed_ms')} ms")
+            return True
+            
+        except Exception as e:
+            self.log_test("Financials Simulate", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_financials_sensitivity(self):
+        """Test the sensitivity grid and break-even solver"""
+        try:
+            payload = {
+                "axes": [{"driver": "monthly_rental", "start": 0, "stop": 1.5, "steps": 31}],
+                "streams": ["fiyuu_swap"]
+            }
+            response = self.session.post(f"{API_BASE}/financials/sensitivity", json=payload)
+            if response.status_code != 200:
+                self.log_test("Financials Sensitivity", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            data = response.json()
+            surface = data["surfaces"]["fiyuu_swap"]["2026"]
+            if len(surface) != 31 or surface != sorted(surface):
+                self.log_test("Financials Sensitivity", False, 
+                            "EBITDA surface should rise with monthly rental", {"surface": surface})
+                return False
+            
+            point = data["break_even"][0]["points"]["fiyuu_swap"]["2026"]
+            if point["value"] is None or not 0 < point["factor"] < 1.5:
+                self.log_test("Financials Sensitivity", False, "No break-even rental found", {"point": point})
+                return False
+            
+            self.log_test("Financials Sensitivity", True, 
+                        f"Swap 2026 breaks even at {point['value']} TL monthly rental")
+            return True
+            
+        except Exception as e:
+            self.log_test("Financials Sensitivity", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_customs_landed_cost(self):
+        """Test the landed cost calculation against the moped customs table"""
+        try:
+            payload = {
+                "fx_rate": 45,
+                "lines": [
+                    {"sku": "moped", "hs_code": "8714.10.00.90", "fob_usd": 305, "freight_usd": 15, "qty": 270}
+                ]
+            }
+            response = self.session.post(f"{API_BASE}/customs/landed-cost", json=payload)
+            if response.status_code != 200:
+                self.log_test("Customs Landed Cost", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            line = response.json()["lines"][0]
+            # The product sheet lists 320 USD CIF and ~352 USD landed for this moped
+            if line["cif_usd"] != 320 or abs(line["final_usd"] - 352) > 1:
+                self.log_test("Customs Landed Cost", False, 
+                            "Landed cost does not match the customs table", {"line": line})
+                return False
+            
+            response = self.session.post(f"{API_BASE}/customs/landed-cost", 
+                                       json={"lines": [{"hs_code": "0000.00", "fob_usd": 1}]})
+            if response.status_code != 422:
+                self.log_test("Customs Landed Cost", False, 
+                            f"Expected 422 for unknown HS code, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Customs Landed Cost", True, f"Landed cost {line['final_usd']} USD per unit")
+            return True
+            
+        except Exception as e:
+            self.log_test("Customs Landed Cost", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_business_plan_currency(self):
+        """Test reading the business plan converted to another currency"""
+        try:
+            response = self.session.get(f"{API_BASE}/business-plan", params={"currency": "USD"})
+            if response.status_code != 200:
+                self.log_test("Business Plan Currency", False, 
+                            f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            converted = response.json()
+            plan = self.session.get(f"{API_BASE}/business-plan").json()
+            rates = self.session.get(f"{API_BASE}/fx/rates", params={"date": converted["fx_date"]}).json()["rates"]
+            
+            investment = converted["data"]["financial_data"]["ertug"]["investments"][0]
+            if investment.get("currency") != "USD" or not isinstance(investment.get("amount"), (int, float)):
+                self.log_test("Business Plan Currency", False, 
+                            "Investments are not numeric USD amounts", {"investment": investment})
+                return False
+            
+            if converted.get("currency") != "USD" or "USD" not in rates:
+                self.log_test("Business Plan Currency", False, 
+                            "Missing currency or rates", {"currency": converted.get("currency"), "rates": rates})
+                return False
+            
+            sales_tl = plan["data"]["financial_data"]["ertug"]["financials"][0]["sales"]
+            sales_usd = converted["data"]["financial_data"]["ertug"]["financials"][0]["sales"]
+            if sales_usd >= sales_tl:
+                self.log_test("Business Plan Currency", False, 
+                            "Sales were not converted from TL", {"tl": sales_tl, "usd": sales_usd})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/business-plan", params={"currency": "XYZ"})
+            if response.status_code != 400:
+                self.log_test("Business Plan Currency", False, 
+                            f"Expected 400 for unknown currency, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Business Plan Currency", True, f"Ertug 2026 sales {sales_usd:,.0f} USD")
+            return True
+            
+        except Exception as e:
+            self.log_test("Business Plan Currency", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_fx_rate_lookup(self):
+        """Test that a date between two table rows uses the earlier rate, quoted in base per unit"""
+        try:
+            fx_file = Path(os.environ.get("FX_RATES_FILE", Path(__file__).parent / "backend" / "fx_rates.csv"))
+            with open(fx_file, newline="") as file:
+                usd = sorted((row["date"], float(row["rate"])) for row in csv.DictReader(file) if row["currency"] == "USD")
+            if len(usd) < 2:
+                self.log_test("FX Rate Lookup", False, "The rate table needs at least two dated USD rows", {"usd": usd})
+                return False
+            
+            (first_date, first_rate), (second_date, _) = usd[0], usd[1]
+            between = date.fromisoformat(first_date) + (date.fromisoformat(second_date) - date.fromisoformat(first_date)) / 2
+            response = self.session.get(f"{API_BASE}/fx/rates", params={"date": between.isoformat()})
+            if response.status_code != 200:
+                self.log_test("FX Rate Lookup", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            rates = response.json()["rates"]
+            if rates.get("USD") != first_rate or rates.get("TRY") != 1.0:
+                self.log_test("FX Rate Lookup", False, f"Expected the {first_date} rate of {first_rate} TL per USD",
+                            {"date": between.isoformat(), "rates": rates})
+                return False
+            
+            # With USD as base, TL is quoted as USD per TL
+            rates = self.session.get(f"{API_BASE}/fx/rates", params={"date": between.isoformat(), "base": "USD"}).json()["rates"]
+            if rates.get("USD") != 1.0 or rates.get("TRY") != round(1 / first_rate, 6):
+                self.log_test("FX Rate Lookup", False, "Rates against USD are not USD per unit", {"rates": rates})
+                return False
+            
+            self.log_test("FX Rate Lookup", True, f"{between.isoformat()} uses the {first_date} rate of {first_rate}")
+            return True
+            
+        except Exception as e:
+            self.log_test("FX Rate Lookup", False, f"Request error: {str(e)}")
+            return False
+    
     def create_test_image(self, filename: str = "test_image.jpg", size_kb: int = 50):
         """Create a test image file"""
         # Create a simple test image (JPEG header + minimal data)
@@ -226,6 +875,281 @@ class BackendTester:
             self.log_test("Image Upload API", False, f"Request error: {str(e)}")
             return False
     
+    def create_test_bmp(self) -> bytes:
+        """A 1x1 24-bit BMP whose header fields match its length"""
+        pixels = b'\x00\x00\xff\x00'  # one red pixel, row padded to 4 bytes
+        dib = b''.join(value.to_bytes(size, 'little') for value, size in [
+            (40, 4), (1, 4), (1, 4), (1, 2), (24, 2), (0, 4), (len(pixels), 4), (2835, 4), (2835, 4), (0, 4), (0, 4)
+        ])
+        file_size = 14 + len(dib) + len(pixels)
+        header = b'BM' + file_size.to_bytes(4, 'little') + b'\x00' * 4 + (14 + len(dib)).to_bytes(4, 'little')
+        return header + dib + pixels
+    
+    def test_upload_limits(self):
+        """Test upload size limits, magic byte checks and temporary file cleanup"""
+        tmp_dir = Path(os.environ.get("UPLOAD_DIR", Path(__file__).parent / "backend" / "uploads")) / "tmp"
+        partials_before = set(tmp_dir.glob("*.part")) if tmp_dir.exists() else set()
+        data = {'image_type': 'equipment'}
+        try:
+            # Content-Length is over the limit, so the body is refused before it is read
+            oversized = b'\xff\xd8\xff\xe0' + b'\x00' * MAX_UPLOAD_SIZE
+            files = {'file': ('oversized.jpg', oversized, 'image/jpeg')}
+            response = self.session.post(f"{API_BASE}/images/upload", files=files, data=data)
+            if response.status_code != 413:
+                self.log_test("Upload Limits - Content-Length", False, 
+                            f"Expected 413 for an oversized upload, got HTTP {response.status_code}")
+                return False
+            self.log_test("Upload Limits - Content-Length", True, "Oversized upload refused from its Content-Length")
+            
+            # A chunked body has no Content-Length; the limit is enforced while streaming
+            boundary = uuid.uuid4().hex
+            def chunked_body():
+                yield (f'--{boundary}\r\nContent-Disposition: form-data; name="image_type"\r\n\r\nequipment\r\n'
+                       f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="chunked.jpg"\r\n'
+                       f'Content-Type: image/jpeg\r\n\r\n').encode()
+                yield b'\xff\xd8\xff\xe0'
+                for _ in range(0, MAX_UPLOAD_SIZE, 1024 * 1024):
+                    yield b'\x00' * (1024 * 1024)
+                yield f'\r\n--{boundary}--\r\n'.encode()
+            response = self.session.post(f"{API_BASE}/images/upload", data=chunked_body(),
+                                       headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+            if response.status_code != 413:
+                self.log_test("Upload Limits - Streamed", False, 
+                            f"Expected 413 for an oversized chunked upload, got HTTP {response.status_code}")
+                return False
+            self.log_test("Upload Limits - Streamed", True, "Oversized chunked upload refused while streaming")
+            
+            # The leading bytes decide the type, whatever the name and content type claim
+            for name, content, mimetype in [
+                ("fake.jpg", b"This is not an image", "image/jpeg"),
+                ("fake.bmp", b"BMaking up a bitmap out of plain text", "image/bmp"),
+            ]:
+                files = {'file': (name, content, mimetype)}
+                response = self.session.post(f"{API_BASE}/images/upload", files=files, data=data)
+                if response.status_code != 400:
+                    self.log_test("Upload Limits - Magic Bytes", False, 
+                                f"Expected 400 for {name}, got HTTP {response.status_code}")
+                    return False
+            
+            files = {'file': ('pixel.bmp', self.create_test_bmp(), 'image/bmp')}
+            response = self.session.post(f"{API_BASE}/images/upload", files=files, data=data)
+            if response.status_code != 200:
+                self.log_test("Upload Limits - Magic Bytes", False, 
+                            f"A valid BMP was rejected with HTTP {response.status_code}", {"response": response.text})
+                return False
+            self.session.delete(f"{API_BASE}/images/{response.json()['image_id']}")
+            self.log_test("Upload Limits - Magic Bytes", True, "Files are typed by their content")
+            
+            # Only checkable when the backend writes to this machine
+            if tmp_dir.exists():
+                leftovers = set(tmp_dir.glob("*.part")) - partials_before
+                if leftovers:
+                    self.log_test("Upload Limits - Cleanup", False, "Rejected uploads left temporary files",
+                                {"files": sorted(path.name for path in leftovers)})
+                    return False
+                self.log_test("Upload Limits - Cleanup", True, "Rejected uploads left no temporary files")
+            return True
+            
+        except Exception as e:
+            self.log_test("Upload Limits", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_image_deduplication(self):
+        """Test that identical uploads share one blob that outlives either image"""
+        try:
+            # Unique per run, so no earlier upload already holds this blob
+            content = bytes([0xFF, 0xD8, 0xFF, 0xE0]) + uuid.uuid4().bytes * 64 + bytes([0xFF, 0xD9])
+            image_ids = []
+            for name in ("first.jpg", "second.jpg"):
+                files = {'file': (name, content, 'image/jpeg')}
+                response = self.session.post(f"{API_BASE}/images/upload", files=files, data={'image_type': 'emoped'})
+                if response.status_code != 200:
+                    self.log_test("Image Deduplication", False, 
+                                f"Upload failed with HTTP {response.status_code}", {"response": response.text})
+                    return False
+                image_ids.append(response.json()["image_id"])
+            
+            images = self.session.get(f"{API_BASE}/images", params={"ids": ",".join(image_ids)}).json()["data"]
+            digests = {image["sha256"] for image in images}
+            if len(images) != 2 or digests != {hashlib.sha256(content).hexdigest()}:
+                self.log_test("Image Deduplication", False, "Identical uploads do not share one blob",
+                            {"digests": sorted(digest or "" for digest in digests)})
+                return False
+            
+            self.session.delete(f"{API_BASE}/images/{image_ids[0]}")
+            response = self.session.get(f"{API_BASE}/images/{image_ids[1]}")
+            if response.status_code != 200 or response.content != content:
+                self.log_test("Image Deduplication", False, 
+                            f"Deleting one image broke the other, HTTP {response.status_code}")
+                return False
+            
+            self.session.delete(f"{API_BASE}/images/{image_ids[1]}")
+            response = self.session.get(f"{API_BASE}/images/{image_ids[1]}")
+            if response.status_code != 404:
+                self.log_test("Image Deduplication", False, 
+                            f"Expected 404 once both images are deleted, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Image Deduplication", True, "Two uploads shared one blob until both were deleted")
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Deduplication", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_batch_image_upload(self):
+        """Test uploading several images at once and resolving them in one request"""
+        try:
+            paths = [self.create_test_image(f"test_battery_{i}.jpg", 20 + i) for i in range(2)]
+            handles = [open(path, 'rb') for path in paths]
+            try:
+                files = [('files', (os.path.basename(path), handle, 'image/jpeg')) for path, handle in zip(paths, handles)]
+                files.append(('files', ('notes.txt', b"This is not an image", 'text/plain')))
+                data = {'image_type': 'battery', 'item_ids': ['battery-1', 'battery-2', 'battery-3']}
+                response = self.session.post(f"{API_BASE}/images/upload-batch", files=files, data=data)
+            finally:
+                for handle in handles:
+                    handle.close()
+                for path in paths:
+                    os.unlink(path)
+            
+            if response.status_code != 200:
+                self.log_test("Batch Image Upload", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            result = response.json()
+            outcomes = [item["success"] for item in result.get("results", [])]
+            if outcomes != [True, True, False] or result.get("uploaded") != 2 or result.get("failed") != 1:
+                self.log_test("Batch Image Upload", False, "Unexpected per-file results", {"response": result})
+                return False
+            
+            image_ids = [item["image_id"] for item in result["results"] if item["success"]]
+            self.uploaded_image_ids.extend(image_ids)
+            
+            response = self.session.get(f"{API_BASE}/images", params={"ids": ",".join(image_ids + ["missing-image"])})
+            if response.status_code != 200:
+                self.log_test("Batch Image Upload", False, f"Batch lookup returned HTTP {response.status_code}")
+                return False
+            
+            lookup = response.json()
+            if [image["id"] for image in lookup["data"]] != image_ids or lookup["missing"] != ["missing-image"]:
+                self.log_test("Batch Image Upload", False, "Batch lookup does not match the upload", {"response": lookup})
+                return False
+            
+            if [image["item_id"] for image in lookup["data"]] != ["battery-1", "battery-2"]:
+                self.log_test("Batch Image Upload", False, "item_ids were not kept in order", {"response": lookup})
+                return False
+            
+            self.log_test("Batch Image Upload", True, f"Uploaded {len(image_ids)} images and resolved them in one request")
+            return True
+            
+        except Exception as e:
+            self.log_test("Batch Image Upload", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_image_listing(self):
+        """Test that paging through the image listing visits every image once"""
+        try:
+            seen = []
+            exposed_paths = False
+            after = None
+            for _ in range(1000):
+                params = {"type": "battery", "limit": 1}
+                if after:
+                    params["after"] = after
+                response = self.session.get(f"{API_BASE}/images", params=params)
+                if response.status_code != 200:
+                    self.log_test("Image Listing", False, f"HTTP {response.status_code}", {"response": response.text})
+                    return False
+                page = response.json()
+                seen.extend(image["id"] for image in page["images"])
+                exposed_paths = exposed_paths or any("path" in image for image in page["images"])
+                after = page["next"]
+                if not after:
+                    break
+            
+            if len(seen) != len(set(seen)):
+                self.log_test("Image Listing", False, "An image was listed twice", {"ids": seen})
+                return False
+            
+            # The batch upload test stored two battery images
+            uploaded = [image_id for image_id in self.uploaded_image_ids if image_id in seen]
+            if len(uploaded) < 2:
+                self.log_test("Image Listing", False, "Uploaded battery images are missing", {"ids": seen})
+                return False
+            
+            if exposed_paths:
+                self.log_test("Image Listing", False, "Listing exposes storage paths")
+                return False
+            
+            self.log_test("Image Listing", True, f"Paged through {len(seen)} battery images one at a time")
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Listing", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_image_reconcile(self):
+        """Test that a report-only reconciliation run finds no problem with fresh uploads"""
+        try:
+            response = self.session.post(f"{API_BASE}/admin/images/reconcile")
+            if response.status_code != 200:
+                self.log_test("Image Reconcile", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            report = response.json()["report"]
+            if report["delete"] or any(report["removed"].values()):
+                self.log_test("Image Reconcile", False, "A report-only run removed something", {"report": report})
+                return False
+            
+            missing = {image["id"] for image in report["missing_files"]["sample"]}
+            if missing & set(self.uploaded_image_ids):
+                self.log_test("Image Reconcile", False, "Fresh uploads reported without files", {"report": report})
+                return False
+            
+            found = {category: report[category]["count"] for category in report["removed"]}
+            self.log_test("Image Reconcile", True, f"Scanned {report['scanned']['files']} files", found)
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Reconcile", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_image_processing_job(self):
+        """Test that an upload returns a job id and the job finishes in the background"""
+        try:
+            test_image_path = self.create_test_image("test_emoped.jpg", 30)
+            with open(test_image_path, 'rb') as f:
+                files = {'file': ('test_emoped.jpg', f, 'image/jpeg')}
+                response = self.session.post(f"{API_BASE}/images/upload", files=files, data={'image_type': 'emoped'})
+            os.unlink(test_image_path)
+            
+            if response.status_code != 200 or not response.json().get("job_id"):
+                self.log_test("Image Processing Job", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            upload = response.json()
+            self.uploaded_image_ids.append(upload["image_id"])
+            
+            job = None
+            for _ in range(50):
+                job = self.session.get(f"{API_BASE}/jobs/{upload['job_id']}").json().get("job", {})
+                if job.get("status") in ("succeeded", "failed"):
+                    break
+                time.sleep(0.2)
+            
+            if job.get("status") != "succeeded":
+                self.log_test("Image Processing Job", False, f"Job ended as {job.get('status')}", {"job": job})
+                return False
+            
+            self.log_test("Image Processing Job", True, 
+                        f"Processed in {job.get('duration')}s after {job['attempts']} attempt(s)", job.get("result"))
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Processing Job", False, f"Request error: {str(e)}")
+            return False
+    
     def test_image_retrieval_api(self):
         """Test image retrieval functionality"""
         if not self.uploaded_image_ids:
@@ -268,6 +1192,103 @@ class BackendTester:
             self.log_test("Image Retrieval API", False, f"Request error: {str(e)}")
             return False
     
+    def create_test_png(self, width: int, height: int) -> bytes:
+        """A solid red RGB PNG that any decoder can read"""
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return len(data).to_bytes(4, 'big') + kind + data + zlib.crc32(kind + data).to_bytes(4, 'big')
+        header = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + bytes([8, 2, 0, 0, 0])
+        rows = (b'\x00' + b'\xff\x00\x00' * width) * height
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+    
+    def webp_width(self, data: bytes) -> int:
+        """Width from a WebP header, for the simple lossy, lossless and extended layouts"""
+        kind = data[12:16]
+        if kind == b'VP8X':
+            return int.from_bytes(data[24:27], 'little') + 1
+        if kind == b'VP8L':
+            return (int.from_bytes(data[21:25], 'little') & 0x3FFF) + 1
+        return int.from_bytes(data[26:28], 'little') & 0x3FFF
+    
+    def test_image_variants(self):
+        """Test resized WebP variants and Accept negotiation"""
+        try:
+            files = {'file': ('variant.png', self.create_test_png(800, 400), 'image/png')}
+            response = self.session.post(f"{API_BASE}/images/upload", files=files, data={'image_type': 'emoped'})
+            if response.status_code != 200:
+                self.log_test("Image Variants", False, 
+                            f"Upload failed with HTTP {response.status_code}", {"response": response.text})
+                return False
+            image_id = response.json()["image_id"]
+            
+            try:
+                response = self.session.get(f"{API_BASE}/images/{image_id}", params={"w": 300, "fmt": "webp"})
+                content_type = response.headers.get("content-type", "")
+                if response.status_code == 200 and content_type == "image/png":
+                    self.log_test("Image Variants", True, "Variants are disabled on this server; original served")
+                    return True
+                if response.status_code != 200 or content_type != "image/webp":
+                    self.log_test("Image Variants", False, 
+                                f"Expected a WebP variant, got HTTP {response.status_code} {content_type}")
+                    return False
+                # 300 rounds up to the 320 px variant
+                width = self.webp_width(response.content)
+                if width != 320:
+                    self.log_test("Image Variants", False, f"Expected a 320 px wide variant, got {width} px")
+                    return False
+                
+                response = self.session.get(f"{API_BASE}/images/{image_id}", params={"w": 320, "fmt": "auto"},
+                                          headers={"Accept": "image/webp,image/*"})
+                content_type, vary = response.headers.get("content-type"), response.headers.get("Vary", "")
+                if content_type != "image/webp" or "Accept" not in vary:
+                    self.log_test("Image Variants", False, "fmt=auto did not negotiate WebP with Vary: Accept",
+                                {"content_type": content_type, "vary": vary})
+                    return False
+            finally:
+                self.session.delete(f"{API_BASE}/images/{image_id}")
+            
+            self.log_test("Image Variants", True, f"Served a {width} px WebP variant, negotiated with Vary: Accept")
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Variants", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_image_range_request(self):
+        """Test partial image retrieval with a Range header"""
+        if not self.uploaded_image_ids:
+            self.log_test("Image Range Request", False, "No uploaded images to test range requests")
+            return False
+        
+        try:
+            image_id = self.uploaded_image_ids[0]
+            full = self.session.get(f"{API_BASE}/images/{image_id}")
+            response = self.session.get(f"{API_BASE}/images/{image_id}", headers={"Range": "bytes=0-99"})
+            
+            if response.status_code != 206:
+                self.log_test("Image Range Request", False, 
+                            f"Expected 206 for range request, got HTTP {response.status_code}")
+                return False
+            
+            if response.content != full.content[:100]:
+                self.log_test("Image Range Request", False, "Partial content does not match the image",
+                            {"content_range": response.headers.get("Content-Range")})
+                return False
+            
+            response = self.session.get(f"{API_BASE}/images/{image_id}", 
+                                      headers={"Range": f"bytes={len(full.content)}-"})
+            if response.status_code != 416:
+                self.log_test("Image Range Request", False, 
+                            f"Expected 416 for unsatisfiable range, got HTTP {response.status_code}")
+                return False
+            
+            self.log_test("Image Range Request", True, 
+                        f"Range served: {response.headers.get('Content-Range')}")
+            return True
+            
+        except Exception as e:
+            self.log_test("Image Range Request", False, f"Request error: {str(e)}")
+            return False
+    
     def test_image_delete_api(self):
         """Test image deletion functionality"""
         if not self.uploaded_image_ids:
@@ -318,6 +1339,69 @@ class BackendTester:
             self.log_test("Image Delete API", False, f"Request error: {str(e)}")
             return False
     
+    def test_startup_report(self):
+        """Test that the server reports how long its startup took"""
+        try:
+            response = self.session.get(f"{API_BASE}/admin/startup")
+            if response.status_code != 200:
+                self.log_test("Startup Report", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            startup = response.json()["startup"]
+            if not isinstance(startup["ready_ms"], (int, float)) or "background" not in startup["phases"]:
+                self.log_test("Startup Report", False, "Startup was not timed", {"startup": startup})
+                return False
+            
+            if startup["imports"] is not None and not startup["imports"]["modules"]:
+                self.log_test("Startup Report", False, "Import profile lists no modules", {"startup": startup})
+                return False
+            
+            self.log_test("Startup Report", True, f"Ready after {startup['ready_ms']}ms", startup["phases"])
+            return True
+            
+        except Exception as e:
+            self.log_test("Startup Report", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_db_pool_stats(self):
+        """Test that the pool report carries the configured pool settings and usage counters"""
+        try:
+            # Make sure the pool has served at least one request
+            self.session.get(f"{API_BASE}/business-plan")
+            response = self.session.get(f"{API_BASE}/admin/db/pool")
+            if response.status_code != 200:
+                self.log_test("DB Pool Stats", False, f"HTTP {response.status_code}", {"response": response.text})
+                return False
+            
+            result = response.json()
+            options, pool = result["options"], result["pool"]
+            expected = {"maxPoolSize": MONGO_MAX_POOL_SIZE, "minPoolSize": MONGO_MIN_POOL_SIZE}
+            configured = {name: options.get(name) for name in expected}
+            if configured != expected:
+                self.log_test("DB Pool Stats", False, "Pool settings differ from the configuration",
+                            {"expected": expected, "reported": configured})
+                return False
+            
+            counters = ["open_connections", "checked_out", "max_checked_out", "checkouts",
+                        "checkout_failures", "avg_wait_ms", "max_wait_ms", "pool_clears"]
+            missing = [name for name in counters if not isinstance(pool.get(name), (int, float))]
+            if missing:
+                self.log_test("DB Pool Stats", False, f"Missing pool counters: {missing}", {"pool": pool})
+                return False
+            
+            if pool["max_checked_out"] > options["maxPoolSize"]:
+                self.log_test("DB Pool Stats", False, "More connections checked out than maxPoolSize allows",
+                            {"pool": pool, "options": options})
+                return False
+            
+            self.log_test("DB Pool Stats", True,
+                        f"maxPoolSize {options['maxPoolSize']}, {pool['checkouts']} checkouts so far")
+            return True
+            
+        except Exception as e:
+            self.log_test("DB Pool Stats", False, f"Request error: {str(e)}")
+            return False
+    
     def test_cors_headers(self):
         """Test CORS configuration"""
         try:
@@ -358,9 +1442,36 @@ class BackendTester:
         # Run all tests
         tests = [
             self.test_business_plan_api,
+            self.test_business_plan_cache,
+            self.test_conditional_get,
+            self.test_response_compression,
+            self.test_business_plan_sections,
+            self.test_business_plan_patch,
+            self.test_business_plan_versions,
+            self.test_patch_history_coercion,
+            self.test_plan_scoped_routes,
+            self.test_change_feed,
+            self.test_change_feed_resync,
+            self.test_financials_compute,
+            self.test_financials_scale_with_volume,
+            self.test_financials_simulate,
+            self.test_financials_sensitivity,
+            self.test_customs_landed_cost,
+            self.test_business_plan_currency,
+            self.test_fx_rate_lookup,
             self.test_image_upload_api,
+            self.test_upload_limits,
+            self.test_image_deduplication,
+            self.test_batch_image_upload,
+            self.test_image_listing,
+            self.test_image_reconcile,
+            self.test_image_processing_job,
             self.test_image_retrieval_api,
+            self.test_image_variants,
+            self.test_image_range_request,
             self.test_image_delete_api,
+            self.test_startup_report,
+            self.test_db_pool_stats,
             self.test_cors_headers
         ]
         
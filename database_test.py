@@ -5,11 +5,14 @@ Tests MongoDB operations and data persistence
 """
 
 import asyncio
+import inspect
+import re
 import sys
 import os
+from datetime import datetime, timedelta
 sys.path.append('/app/backend')
 
-from database import db_manager
+from database import DEFAULT_PLAN_ID, QUERY_CATALOG, UNINDEXED_QUERIES, DatabaseManager, db_manager
 from seed_data import SEED_BUSINESS_PLAN
 
 async def test_database_operations():
@@ -87,9 +90,14 @@ async def test_database_operations():
             print("❌ Failed to retrieve image metadata")
         
         # Test image retrieval by type
-        images_by_type = await db_manager.get_images_by_type("equipment")
+        images_by_type = [image async for image in db_manager.get_images_by_type("equipment")]
         print(f"✅ Found {len(images_by_type)} equipment images")
         
+        # Test keyset paging through a plan's images
+        print("\n📄 Testing image listing pages...")
+        if not await test_image_paging():
+            return False
+        
         # Clean up test image
         deleted = await db_manager.delete_image_metadata("test-image-123")
         if deleted:
@@ -106,9 +114,61 @@ async def test_database_operations():
         traceback.print_exc()
         return False
 
+async def test_image_paging():
+    """Page through images with after/limit and check order, gaps and repeats"""
+    uploaded_at = datetime(2025, 8, 29, 17, 0, 0)
+    # Two images share a timestamp, so the id has to break the tie
+    ids = [f"test-page-{index:02d}" for index in range(5)]
+    for index, image_id in enumerate(ids):
+        await db_manager.save_image_metadata({
+            "id": image_id, "type": "battery", "item_id": "test-paging", "plan_id": DEFAULT_PLAN_ID,
+            "filename": f"{image_id}.jpg", "mimetype": "image/jpeg", "size": 1024,
+            "uploaded_at": uploaded_at + timedelta(minutes=min(index, 3))
+        })
+    try:
+        seen, after = [], None
+        while True:
+            page = [image async for image in db_manager.get_images_by_type(
+                "battery", "test-paging", after=after, limit=2
+            )]
+            if not page:
+                break
+            if len(page) > 2:
+                print(f"❌ Page of {len(page)} images exceeds the limit of 2")
+                return False
+            seen.extend(image["id"] for image in page)
+            after = (page[-1]["uploaded_at"], page[-1]["id"])
+        
+        expected = list(reversed(ids))
+        if seen != expected:
+            print(f"❌ Pages returned {seen}, expected {expected}")
+            return False
+        print(f"✅ Paged through {len(seen)} images newest first without gaps or repeats")
+        return True
+    finally:
+        for image_id in ids:
+            await db_manager.delete_image_metadata(image_id)
+
+def test_query_catalog():
+    """Every DatabaseManager method that touches a collection is catalogued for the index explain"""
+    collections = {name for name, member in vars(DatabaseManager).items() if isinstance(member, property)}
+    catalogued = {name.split("(")[0] for name, _, _, _ in QUERY_CATALOG}
+    missing = []
+    for name, method in vars(DatabaseManager).items():
+        if not inspect.isfunction(method) or name in catalogued or name in UNINDEXED_QUERIES:
+            continue
+        used = set(re.findall(r"self\.(\w+)\.", inspect.getsource(method)))
+        if used & collections:
+            missing.append(name)
+    if missing:
+        print(f"❌ Queries without a catalog entry: {missing}")
+        return False
+    print(f"✅ All {len(catalogued)} querying methods are catalogued")
+    return True
+
 def main():
     """Main test execution"""
-    return asyncio.run(test_database_operations())
+    return test_query_catalog() and asyncio.run(test_database_operations())
 
 if __name__ == "__main__":
     success = main()
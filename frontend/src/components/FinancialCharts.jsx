@@ -192,7 +192,11 @@ const FinancialCharts = ({ data }) => {
                   {data.ertug.investments.map((investment, index) => (
                     <div key={index} className="p-4 bg-green-50 rounded-lg border border-green-200">
                       <div className="font-semibold text-green-800">{investment.item}</div>
-                      <div className="text-lg font-bold text-green-600">{investment.amount}</div>
+                      <div className="text-lg font-bold text-green-600">
+                        {typeof investment.amount === 'number'
+                          ? `${investment.amount.toLocaleString()} ${investment.currency || 'USD'}`
+                          : investment.amount}
+                      </div>
                     </div>
                   ))}
                 </div>
@@ -5,6 +5,9 @@ import { Upload, Image, X, Loader2 } from 'lucide-react';
 import { imagesAPI, handleAPIError } from '../services/api';
 import { toast } from 'sonner';
 
+// Previews are at most 192px tall, so a 640px wide variant covers high-DPI screens
+const PREVIEW_VARIANT = { width: 640, format: 'auto' };
+
 const ImageUploader = ({ type, id, label, existingImageId }) => {
   const [uploadedImage, setUploadedImage] = useState(null);
   const [isUploading, setIsUploading] = useState(false);
@@ -13,7 +16,7 @@ const ImageUploader = ({ type, id, label, existingImageId }) => {
   useEffect(() => {
     if (existingImageId) {
       setImageId(existingImageId);
-      setUploadedImage(imagesAPI.getImageUrl(existingImageId));
+      setUploadedImage(imagesAPI.getImageUrl(existingImageId, PREVIEW_VARIANT));
     }
   }, [existingImageId]);
 
@@ -41,7 +44,7 @@ const ImageUploader = ({ type, id, label, existingImageId }) => {
       
       if (response.success) {
         setImageId(response.imageId);
-        setUploadedImage(response.imageUrl);
+        setUploadedImage(imagesAPI.getImageUrl(response.imageId, PREVIEW_VARIANT));
         toast.success('Görsel başarıyla yüklendi');
       }
     } catch (error) {
@@ -68,7 +71,7 @@ const ImageUploader = ({ type, id, label, existingImageId }) => {
     }
   };
 
-  const currentImageUrl = uploadedImage || (imageId ? imagesAPI.getImageUrl(imageId) : null);
+  const currentImageUrl = uploadedImage || (imageId ? imagesAPI.getImageUrl(imageId, PREVIEW_VARIANT) : null);
 
   return (
     <Card className="w-full h-48 relative overflow-hidden border-2 border-dashed border-gray-300 hover:border-orange-400 transition-colors">
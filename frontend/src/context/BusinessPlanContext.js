@@ -200,9 +200,9 @@ const initialState = {
         2028: { units: 9000, cost: 31488, price: 40600 }
       },
       pnl: {
-        2026: { netSales: 107949600, costOfSales: 95891511, grossProfit: 12058089, totalOpex: 18720333, ebitda: -6662245 },
-        2027: { netSales: 213550400, costOfSales: 176597577, grossProfit: 36952823, totalOpex: 27934550, ebitda: 9018273 },
-        2028: { netSales: 353410000, costOfSales: 283394827, grossProfit: 70015173, totalOpex: 32015104, ebitda: 38000069 }
+        2026: { netSales: 107950500, costOfSales: 95893000, grossProfit: 12057500, totalOpex: 18720333, ebitda: -6662833 },
+        2027: { netSales: 213552000, costOfSales: 176598000, grossProfit: 36954000, totalOpex: 27934550, ebitda: 9019450 },
+        2028: { netSales: 353412000, costOfSales: 283392000, grossProfit: 70020000, totalOpex: 32015104, ebitda: 38004896 }
       }
     },
     fiyuuSales: {
@@ -216,9 +216,9 @@ const initialState = {
         2028: { units: 9000, buyPrice: 40600, sellPrice: 59513 }
       },
       pnl: {
-        2026: { netSales: 143595000, costOfSales: 118440000, grossProfit: 25155000, totalOpex: 14151352, ebitda: 11003648 },
+        2026: { netSales: 143594500, costOfSales: 118440000, grossProfit: 25154500, totalOpex: 14151352, ebitda: 11003148 },
         2027: { netSales: 298530000, costOfSales: 221520000, grossProfit: 77010000, totalOpex: 21224257, ebitda: 55785743 },
-        2028: { netSales: 516853125, costOfSales: 365400000, grossProfit: 151453125, totalOpex: 28734657, ebitda: 122718468 }
+        2028: { netSales: 516852000, costOfSales: 365400000, grossProfit: 151452000, totalOpex: 28734657, ebitda: 122717343 }
       }
     },
     fiyuuSwap: {
@@ -233,9 +233,9 @@ const initialState = {
         2028: { batteryCount: 22680, cabinetCount: 1260, monthlyRental: 4000 }
       },
       pnl: {
-        2026: { netSales: 108889200, costOfSales: 19963020, grossProfit: 88926180, totalOpex: 56831112, ebitda: 56431042 },
-        2027: { netSales: 469476000, costOfSales: 74844000, grossProfit: 394632000, totalOpex: 172439965, ebitda: 311575485 },
-        2028: { netSales: 1119787200, costOfSales: 159390000, grossProfit: 960397200, totalOpex: 377590438, ebitda: 804928956 }
+        2026: { netSales: 108864000, costOfSales: 19960920, grossProfit: 88903080, totalOpex: 56830778, ebitda: 56407942 },
+        2027: { netSales: 459648000, costOfSales: 74844000, grossProfit: 384804000, totalOpex: 172435875, ebitda: 301747485 },
+        2028: { netSales: 1088640000, costOfSales: 159372360, grossProfit: 929267640, totalOpex: 377596164, ebitda: 773799396 }
       }
     }
   }
@@ -326,9 +326,12 @@ export function BusinessPlanProvider({ children }) {
     }
   }, []);
 
-  // Save data to localStorage whenever state changes
+  // Save data to localStorage once edits settle rather than on every keystroke
   useEffect(() => {
-    localStorage.setItem('businessPlanData', JSON.stringify(state));
+    const timer = setTimeout(() => {
+      localStorage.setItem('businessPlanData', JSON.stringify(state));
+    }, 500);
+    return () => clearTimeout(timer);
   }, [state]);
 
   return (
@@ -1,17 +1,21 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import { businessPlanAPI } from '../services/api';
+import { applyPatch } from '../lib/jsonPatch';
 
 export const useBusinessPlan = () => {
   const [data, setData] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Version of the plan in data, to tell whether a change event follows on from it
+  const versionRef = useRef(null);
 
-  const fetchBusinessPlan = async () => {
+  const fetchBusinessPlan = useCallback(async () => {
     try {
       setLoading(true);
       setError(null);
       const response = await businessPlanAPI.getBusinessPlan();
       if (response.success) {
+        versionRef.current = response.version ?? null;
         setData(response.data);
       } else {
         setError('Failed to fetch business plan data');
@@ -22,11 +26,30 @@ export const useBusinessPlan = () => {
     } finally {
       setLoading(false);
     }
-  };
+  }, []);
 
   useEffect(() => {
     fetchBusinessPlan();
-  }, []);
+  }, [fetchBusinessPlan]);
+
+  // Apply pushed patches in place of polling; refetch when one was missed
+  useEffect(() => {
+    const handleEvent = (event) => {
+      if (!event.type.startsWith('plan.') || versionRef.current === null) {
+        return;
+      }
+      if (event.version <= versionRef.current) {
+        return;
+      }
+      if (event.patch && event.version === versionRef.current + 1) {
+        versionRef.current = event.version;
+        setData((current) => (current ? applyPatch(current, event.patch) : current));
+      } else {
+        fetchBusinessPlan();
+      }
+    };
+    return businessPlanAPI.subscribeToChanges(handleEvent, fetchBusinessPlan);
+  }, [fetchBusinessPlan]);
 
   const refetch = () => {
     fetchBusinessPlan();
@@ -38,4 +61,4 @@ export const useBusinessPlan = () => {
     error,
     refetch,
   };
-};
\ No newline at end of file
+};
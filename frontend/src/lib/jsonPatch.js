@@ -0,0 +1,30 @@
+// Apply RFC 6902 operations from the change feed without mutating the input
+const parsePointer = (pointer) =>
+  pointer
+    .slice(1)
+    .split('/')
+    .map((segment) => segment.replace(/~1/g, '/').replace(/~0/g, '~'));
+
+export const applyPatch = (document, operations) => {
+  const result = structuredClone(document);
+  for (const { op, path, value } of operations) {
+    const segments = parsePointer(path);
+    const key = segments.pop();
+    const parent = segments.reduce((node, segment) => node[segment], result);
+    if (Array.isArray(parent)) {
+      const index = key === '-' ? parent.length : Number(key);
+      if (op === 'add') {
+        parent.splice(index, 0, value);
+      } else if (op === 'remove') {
+        parent.splice(index, 1);
+      } else {
+        parent[index] = value;
+      }
+    } else if (op === 'remove') {
+      delete parent[key];
+    } else {
+      parent[key] = value;
+    }
+  }
+  return result;
+};
@@ -94,23 +94,23 @@ export const businessPlanData = {
         { item: "Nakliye & gümrükleme", amount: "10.000 USD" }
       ],
       financials: [
-        { year: "2026", sales: 107949600, costs: 95891511, gross: 12058089, opex: 18720333, ebitda: -6662245 },
-        { year: "2027", sales: 213550400, costs: 176597577, gross: 36952823, opex: 27934550, ebitda: 9018273 },
-        { year: "2028", sales: 353410000, costs: 283394827, gross: 70015173, opex: 32015104, ebitda: 38000069 }
+        { year: "2026", sales: 107950500, costs: 95893000, gross: 12057500, opex: 18720333, ebitda: -6662833 },
+        { year: "2027", sales: 213552000, costs: 176598000, gross: 36954000, opex: 27934550, ebitda: 9019450 },
+        { year: "2028", sales: 353412000, costs: 283392000, gross: 70020000, opex: 32015104, ebitda: 38004896 }
       ]
     },
     fiyuuSales: {
       financials: [
-        { year: "2026", sales: 143595000, costs: 118440000, gross: 25155000, opex: 14151352, ebitda: 11003648 },
+        { year: "2026", sales: 143594500, costs: 118440000, gross: 25154500, opex: 14151352, ebitda: 11003148 },
         { year: "2027", sales: 298530000, costs: 221520000, gross: 77010000, opex: 21224257, ebitda: 55785743 },
-        { year: "2028", sales: 516853125, costs: 365400000, gross: 151453125, opex: 28734657, ebitda: 122718468 }
+        { year: "2028", sales: 516852000, costs: 365400000, gross: 151452000, opex: 28734657, ebitda: 122717343 }
       ]
     },
     fiyuuSwap: {
       financials: [
-        { year: "2026", sales: 108889200, costs: 19963020, gross: 88926180, opex: 56831112, ebitda: 56431042 },
-        { year: "2027", sales: 469476000, costs: 74844000, gross: 394632000, opex: 172439965, ebitda: 311575485 },
-        { year: "2028", sales: 1119787200, costs: 159390000, gross: 960397200, opex: 377590438, ebitda: 804928956 }
+        { year: "2026", sales: 108864000, costs: 19960920, gross: 88903080, opex: 56830778, ebitda: 56407942 },
+        { year: "2027", sales: 459648000, costs: 74844000, gross: 384804000, opex: 172435875, ebitda: 301747485 },
+        { year: "2028", sales: 1088640000, costs: 159372360, gross: 929267640, opex: 377596164, ebitda: 773799396 }
       ]
     }
   },
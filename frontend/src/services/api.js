@@ -24,6 +24,43 @@ export const businessPlanAPI = {
       throw error;
     }
   },
+
+  // Get a single section, e.g. getSection('financial-data/ertug')
+  getSection: async (sectionPath) => {
+    try {
+      const response = await apiClient.get(`/business-plan/${sectionPath}`);
+      return response.data;
+    } catch (error) {
+      console.error(`Error fetching business plan section ${sectionPath}:`, error);
+      throw error;
+    }
+  },
+
+  // Apply JSON Patch operations; pass the ETag of the plan being edited to avoid lost updates
+  patchBusinessPlan: async (operations, etag = null) => {
+    try {
+      const headers = { 'Content-Type': 'application/json-patch+json' };
+      if (etag) {
+        headers['If-Match'] = etag;
+      }
+      const response = await apiClient.patch('/business-plan', operations, { headers });
+      return response.data;
+    } catch (error) {
+      console.error('Error patching business plan:', error);
+      throw error;
+    }
+  },
+
+  // Listen for plan and image change events; returns a function that stops listening
+  subscribeToChanges: (onEvent, onResync) => {
+    const source = new EventSource(`${API}/events`);
+    const handle = (message) => onEvent(JSON.parse(message.data));
+    ['plan.patched', 'plan.restored', 'image.uploaded', 'image.deleted'].forEach((type) =>
+      source.addEventListener(type, handle)
+    );
+    source.addEventListener('resync', () => onResync());
+    return () => source.close();
+  },
 };
 
 // Images API
@@ -50,9 +87,66 @@ export const imagesAPI = {
     }
   },
 
-  // Get image URL
-  getImageUrl: (imageId) => {
-    return `${API}/images/${imageId}`;
+  // Upload several images at once; itemIds, if given, has one entry per file
+  uploadImages: async (files, type, itemIds = null) => {
+    try {
+      const formData = new FormData();
+      Array.from(files).forEach((file) => formData.append('files', file));
+      formData.append('image_type', type);
+      if (itemIds) {
+        itemIds.forEach((itemId) => formData.append('item_ids', itemId));
+      }
+
+      const response = await apiClient.post('/images/upload-batch', formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error uploading images:', error);
+      throw error;
+    }
+  },
+
+  // Get metadata for many images in one request
+  getImages: async (imageIds) => {
+    try {
+      const response = await apiClient.get('/images', { params: { ids: imageIds.join(',') } });
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching images:', error);
+      throw error;
+    }
+  },
+
+  // List a page of images newest first; pass the previous page's next as after
+  listImages: async ({ type, itemId, limit, after } = {}) => {
+    try {
+      const params = {};
+      if (type) params.type = type;
+      if (itemId) params.item_id = itemId;
+      if (limit) params.limit = limit;
+      if (after) params.after = after;
+      const response = await apiClient.get('/images', { params });
+      return response.data;
+    } catch (error) {
+      console.error('Error listing images:', error);
+      throw error;
+    }
+  },
+
+  // Get image URL, optionally for a resized variant ({ width: 320, format: 'auto' })
+  getImageUrl: (imageId, { width, format } = {}) => {
+    const params = new URLSearchParams();
+    if (width) {
+      params.append('w', width);
+    }
+    if (format) {
+      params.append('fmt', format);
+    }
+    const query = params.toString();
+    return `${API}/images/${imageId}${query ? `?${query}` : ''}`;
   },
 
   // Delete an image